@@ -12,12 +12,28 @@ from flask import Flask, request, jsonify
 from datetime import datetime, timedelta, timezone
 import sqlite3
 import secrets
+import hmac
+import threading
+import time
 from authlib.jose import jwt
 from authlib.jose.errors import ExpiredTokenError, InvalidTokenError, DecodeError, BadSignatureError
-from werkzeug.security import check_password_hash
 import os
+import sys
+
+# Modules partagés entre services (shared/) : dossier parent en local, /app/shared dans l'image Docker
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.metrics import instrument_app, REGISTRY
+from shared.tracing import trace_app
+from shared.deadline import deadline_app, check_deadline, DeadlineConnection, DeadlineExceeded
+from shared.passwords import password_hashing_app, password_hasher, PasswordHasherBusy
+from shared.serving import serve
 
 app = Flask(__name__)
+instrument_app(app, 'auth_service')
+trace_app(app, 'auth_service')
+deadline_app(app, 'auth_service')
+password_hashing_app(app)
 app.config['SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'votre-cle-secrete-ici')
 
 # Configuration de la base de données (partagée avec User Service)
@@ -25,24 +41,314 @@ DATABASE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'users.
 
 def get_db():
     """Connexion à la base de données SQLite avec timeout pour éviter les verrouillages"""
-    conn = sqlite3.connect(DATABASE_PATH, timeout=10.0)
+    conn = sqlite3.connect(DATABASE_PATH, timeout=10.0, factory=DeadlineConnection)
     conn.row_factory = sqlite3.Row
     return conn
 
+def ensure_token_version_column():
+    """Ajoute users.token_version aux bases créées avant son introduction."""
+    try:
+        # mode=rw : ne crée pas de base vide si elle n'est pas encore initialisée
+        conn = sqlite3.connect(f'file:{DATABASE_PATH}?mode=rw', uri=True, timeout=10.0)
+    except sqlite3.OperationalError:
+        return
+    try:
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(users)')]
+        if columns and 'token_version' not in columns:
+            conn.execute('ALTER TABLE users ADD COLUMN token_version INTEGER NOT NULL DEFAULT 0')
+            conn.commit()
+    except sqlite3.OperationalError:
+        pass  # colonne ajoutée au même moment par le User Service
+    finally:
+        conn.close()
+
+ensure_token_version_column()
+
+class UserVersions:
+    """Table en mémoire user_id -> token_version, pour vérifier les access tokens sans lecture SQLite.
+
+    La table entière est relue quand la base a changé depuis le dernier contrôle
+    (PRAGMA data_version, au plus toutes les `check_interval` s) ; un utilisateur
+    absent (créé depuis) est lu individuellement. `revision` augmente à chaque changement
+    du contenu : le Gateway ne retélécharge la table (GET /auth/user-versions) que dans ce cas.
+    """
+
+    def __init__(self, path, check_interval=1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._conn = None
+        self._data_version = None
+        self._checked_at = 0.0
+        self._versions = {}
+        self.reloads = 0
+        self.revision = 0
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, timeout=10.0, check_same_thread=False)
+        return self._conn
+
+    def refresh(self):
+        if time.monotonic() - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if now - self._checked_at < self.check_interval:
+                return
+            self._checked_at = now
+            conn = self._connection()
+            data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+            if data_version != self._data_version:
+                # data_version change à chaque écriture (refresh tokens compris) : révision inchangée
+                # si la table des versions, elle, est identique
+                versions = dict(conn.execute('SELECT id, token_version FROM users'))
+                if versions != self._versions:
+                    self._versions = versions
+                    self.revision += 1
+                self._data_version = data_version
+                self.reloads += 1
+
+    def get(self, user_id):
+        """Version courante de l'utilisateur, None s'il n'existe plus."""
+        return self.get_many([user_id]).get(user_id)
+
+    def get_many(self, user_ids):
+        """{user_id: version} des utilisateurs existants ; les absents de la table sont lus en une requête."""
+        self.refresh()
+        versions = self._versions
+        found = {user_id: versions[user_id] for user_id in user_ids if user_id in versions}
+        missing = [user_id for user_id in user_ids if user_id not in versions]
+        if missing:
+            placeholders = ','.join('?' * len(missing))
+            with self._lock:
+                rows = self._connection().execute(
+                    f'SELECT id, token_version FROM users WHERE id IN ({placeholders})', missing).fetchall()
+            for user_id, version in rows:
+                found[user_id] = self._versions[user_id] = version
+            if rows:
+                self.revision += 1
+        return found
+
+    def set(self, user_id, version):
+        if self._versions.get(user_id) != version:
+            self._versions[user_id] = version
+            self.revision += 1
+
+    def snapshot(self):
+        """(révision, copie de la table) après un éventuel rechargement."""
+        self.refresh()
+        with self._lock:
+            return self.revision, dict(self._versions)
+
+# Délai max (s) avant qu'un changement de rôle ou une suppression n'invalide les access tokens
+USER_VERSION_CHECK_INTERVAL = float(os.getenv('AUTH_USER_VERSION_CHECK_INTERVAL', '1.0'))
+user_versions = UserVersions(DATABASE_PATH, USER_VERSION_CHECK_INTERVAL)
+# Distingue les révisions de deux démarrages du service dans l'ETag de /auth/user-versions
+USER_VERSIONS_EPOCH = secrets.token_hex(4)
+# Jeton partagé avec le Gateway pour /auth/user-versions (liste de tous les utilisateurs) ;
+# vide : endpoint fermé
+INTERNAL_API_TOKEN = os.getenv('INTERNAL_API_TOKEN', '')
+
+# Nombre max de tokens par appel à /auth/verify/batch (reste sous la limite de 999 paramètres SQLite)
+VERIFY_BATCH_MAX = int(os.getenv('AUTH_VERIFY_BATCH_MAX', '500'))
+
+# ========== MAINTENANCE DES REFRESH TOKENS ==========
+
+REFRESH_TOKEN_LIFETIME = timedelta(days=7)
+# Fenêtre (s) pendant laquelle un token tout juste renouvelé, présenté à nouveau (double envoi,
+# relance réseau, onglets concurrents), renvoie son successeur au lieu de révoquer la famille ; 0 la désactive
+REFRESH_TOKEN_REUSE_GRACE = float(os.getenv('AUTH_REFRESH_REUSE_GRACE', '5'))
+
+REFRESH_TOKENS_ROWS = REGISTRY.gauge(
+    'auth_refresh_tokens_rows', 'Lignes de refresh_tokens (total, revoked, expired) au dernier passage de la maintenance',
+    ('state',))
+REFRESH_TOKENS_PURGED = REGISTRY.counter(
+    'auth_refresh_tokens_purged_total', 'Refresh tokens supprimés par la maintenance', ('reason',))
+REFRESH_TOKENS_PURGE_BATCH = REGISTRY.histogram(
+    'auth_refresh_tokens_purge_batch_seconds', "Durée d'un lot de purge (verrou d'écriture SQLite compris)")
+REFRESH_TOKEN_REUSE = REGISTRY.counter(
+    'auth_refresh_token_reuse_total', 'Refresh tokens déjà utilisés présentés à nouveau (famille révoquée)')
+REFRESH_TOKEN_REUSE_GRACED = REGISTRY.counter(
+    'auth_refresh_token_reuse_graced_total',
+    'Refresh tokens présentés à nouveau dans la fenêtre de grâce (successeur renvoyé)')
+USERS_DB_BYTES = REGISTRY.gauge('auth_users_db_bytes', 'Taille du fichier users.db (pages libres comprises)')
+
+def ensure_refresh_token_schema():
+    """Ajoute refresh_tokens.revoked_at, family_id, replaced_by et les index de la maintenance aux bases existantes."""
+    try:
+        conn = sqlite3.connect(f'file:{DATABASE_PATH}?mode=rw', uri=True, timeout=10.0)
+    except sqlite3.OperationalError:
+        return
+    try:
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(refresh_tokens)')]
+        if not columns:
+            return
+        if 'revoked_at' not in columns:
+            conn.execute('ALTER TABLE refresh_tokens ADD COLUMN revoked_at TEXT')
+        if 'family_id' not in columns:
+            # Tokens antérieurs : famille d'un seul token (family_id NULL, équivalent à leur jti)
+            conn.execute('ALTER TABLE refresh_tokens ADD COLUMN family_id TEXT')
+        if 'replaced_by' not in columns:
+            conn.execute('ALTER TABLE refresh_tokens ADD COLUMN replaced_by TEXT')
+        # Construits une seule fois ; long au premier démarrage sur une table déjà volumineuse
+        conn.executescript(REFRESH_TOKEN_INDEXES)
+    except sqlite3.OperationalError:
+        pass  # schéma modifié au même moment par un autre processus
+    finally:
+        conn.close()
+
+REFRESH_TOKEN_INDEXES = """
+    CREATE INDEX IF NOT EXISTS idx_refresh_tokens_user_id ON refresh_tokens(user_id);
+    CREATE INDEX IF NOT EXISTS idx_refresh_tokens_expires_at ON refresh_tokens(expires_at);
+    CREATE INDEX IF NOT EXISTS idx_refresh_tokens_revoked_at ON refresh_tokens(revoked_at) WHERE revoked = 1;
+    CREATE INDEX IF NOT EXISTS idx_refresh_tokens_family_id ON refresh_tokens(family_id);
+"""
+
+ensure_refresh_token_schema()
+
+class RefreshTokenMaintenance:
+    """Purge incrémentale de refresh_tokens : tokens expirés, et révoqués depuis plus de `revoked_retention` s.
+
+    Chaque lot supprime au plus `batch_size` lignes dans sa propre transaction, puis laisse
+    `pause` s aux requêtes : le verrou d'écriture n'est jamais tenu plus d'un lot.
+    Les révoqués sont gardés un temps pour qu'un token déjà utilisé reste reconnu comme tel.
+    """
+
+    def __init__(self, path, batch_size=1000, pause=0.05, max_batches=100, revoked_retention=86400.0,
+                 count_chunk=50000):
+        self.path = path
+        self.count_chunk = count_chunk
+        self.batch_size = batch_size
+        self.pause = pause
+        self.max_batches = max_batches
+        self.revoked_retention = revoked_retention
+        self._thread = None
+
+    def _connect(self):
+        return sqlite3.connect(f'file:{self.path}?mode=rw', uri=True, timeout=10.0)
+
+    def _cutoffs(self):
+        now = datetime.now(timezone.utc)
+        return {
+            'expired': now.isoformat(),
+            'revoked': (now - timedelta(seconds=self.revoked_retention)).isoformat()
+        }
+
+    def purge_batch(self, conn, reason, cutoff):
+        """Supprime un lot ; retourne le nombre de lignes supprimées."""
+        if reason == 'expired':
+            where = 'expires_at <= ?'
+        else:
+            where = 'revoked = 1 AND revoked_at <= ?'
+        start = time.perf_counter()
+        with conn:
+            deleted = conn.execute(
+                f'DELETE FROM refresh_tokens WHERE rowid IN '
+                f'(SELECT rowid FROM refresh_tokens WHERE {where} LIMIT ?)',
+                (cutoff, self.batch_size)).rowcount
+        REFRESH_TOKENS_PURGE_BATCH.observe(time.perf_counter() - start)
+        if deleted:
+            REFRESH_TOKENS_PURGED.inc(reason, amount=deleted)
+        return deleted
+
+    def purge(self):
+        """Un passage : au plus `max_batches` lots ; retourne {raison: lignes supprimées}."""
+        purged = {'expired': 0, 'revoked': 0}
+        conn = self._connect()
+        try:
+            batches = 0
+            for reason, cutoff in self._cutoffs().items():
+                while batches < self.max_batches:
+                    deleted = self.purge_batch(conn, reason, cutoff)
+                    batches += 1
+                    purged[reason] += deleted
+                    if deleted < self.batch_size:
+                        break
+                    time.sleep(self.pause)
+        finally:
+            conn.close()
+        return purged
+
+    def table_stats(self):
+        """Compte les lignes par tranches de rowid (verrou de lecture court) et met à jour les jauges."""
+        conn = self._connect()
+        try:
+            cutoffs = self._cutoffs()
+            low, high = conn.execute('SELECT MIN(rowid), MAX(rowid) FROM refresh_tokens').fetchone()
+            stats = {'total': 0, 'revoked': 0, 'expired': 0}
+            while low is not None and low <= high:
+                # Une requête par tranche : l'écriture des logins passe entre deux tranches
+                total, revoked, expired = conn.execute(
+                    'SELECT COUNT(*), TOTAL(revoked = 1), TOTAL(expires_at <= ?) FROM refresh_tokens '
+                    'WHERE rowid >= ? AND rowid < ?', (cutoffs['expired'], low, low + self.count_chunk)).fetchone()
+                stats['total'] += total
+                stats['revoked'] += int(revoked)
+                stats['expired'] += int(expired)
+                low += self.count_chunk
+            page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+            page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+        finally:
+            conn.close()
+        for state, rows in stats.items():
+            REFRESH_TOKENS_ROWS.set(rows, state)
+        USERS_DB_BYTES.set(page_count * page_size)
+        return stats
+
+    def start(self, interval):
+        """Lance le thread qui purge puis met à jour les jauges toutes les `interval` secondes."""
+        if interval <= 0 or self._thread is not None:
+            return
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.purge()
+                    self.table_stats()
+                except sqlite3.Error:
+                    pass  # base absente ou verrouillée : nouvel essai au prochain passage
+
+        self._thread = threading.Thread(target=loop, name='refresh-token-maintenance', daemon=True)
+        self._thread.start()
+
+refresh_maintenance = RefreshTokenMaintenance(
+    DATABASE_PATH,
+    batch_size=int(os.getenv('AUTH_REFRESH_PURGE_BATCH', '1000')),
+    pause=float(os.getenv('AUTH_REFRESH_PURGE_PAUSE', '0.05')),
+    max_batches=int(os.getenv('AUTH_REFRESH_PURGE_MAX_BATCHES', '100')),
+    revoked_retention=float(os.getenv('AUTH_REFRESH_REVOKED_RETENTION', '86400'))
+)
+refresh_maintenance.start(float(os.getenv('AUTH_REFRESH_PURGE_INTERVAL', '60')))
+
 def fetch_user(username):
     """Récupère un utilisateur depuis SQLite."""
     conn = get_db()
     cursor = conn.cursor()
-    cursor.execute('SELECT id, username, password, email, role, created_at FROM users WHERE username = ?', (username,))
+    cursor.execute('SELECT id, username, password, email, role, created_at, token_version FROM users WHERE username = ?', (username,))
     user = cursor.fetchone()
     conn.close()
     return user
 
+def fetch_users(usernames):
+    """Récupère plusieurs utilisateurs en une requête : {username: ligne}."""
+    usernames = list(usernames)
+    if not usernames:
+        return {}
+    conn = get_db()
+    cursor = conn.cursor()
+    placeholders = ','.join('?' * len(usernames))
+    cursor.execute(f'SELECT id, username, password, email, role, created_at, token_version FROM users '
+                   f'WHERE username IN ({placeholders})', usernames)
+    rows = cursor.fetchall()
+    conn.close()
+    return {row['username']: row for row in rows}
+
 def fetch_user_by_id(user_id):
     """Récupère un utilisateur par son ID."""
     conn = get_db()
     cursor = conn.cursor()
-    cursor.execute('SELECT id, username, password, email, role, created_at FROM users WHERE id = ?', (user_id,))
+    cursor.execute('SELECT id, username, password, email, role, created_at, token_version FROM users WHERE id = ?', (user_id,))
     user = cursor.fetchone()
     conn.close()
     return user
@@ -50,15 +356,45 @@ def fetch_user_by_id(user_id):
 def authenticate_credentials(username, password):
     """Vérifie les identifiants et retourne l'utilisateur si valide."""
     user_row = fetch_user(username)
-    if user_row and check_password_hash(user_row['password'], password):
-        return user_row
-    return None
+    if not user_row:
+        return None
+    # Hachage volontairement coûteux : inutile si le Gateway a déjà abandonné la requête
+    check_deadline('check_password_hash')
+    if not password_hasher.verify(user_row['password'], password):
+        return None
+    if password_hasher.needs_rehash(user_row['password']):
+        upgrade_password_hash(user_row, password)
+    return user_row
 
-def generate_jwt_token(username, expires_delta=timedelta(minutes=15), token_type='access', jti=None):
-    """Génère un token JWT pour l'utilisateur fourni."""
+def upgrade_password_hash(user_row, password):
+    """Remplace un hachage aux paramètres obsolètes (le mot de passe en clair n'est connu qu'au login).
+
+    Au mieux : un échec laisse l'ancien hachage, remplacé à un login suivant.
+    """
+    try:
+        new_hash = password_hasher.hash(password)
+        conn = get_db()
+        try:
+            # Condition sur l'ancien hachage : ne remplace pas un changement de mot de passe concurrent
+            conn.execute('UPDATE users SET password = ? WHERE id = ? AND password = ?',
+                         (new_hash, user_row['id'], user_row['password']))
+            conn.commit()
+        finally:
+            conn.close()
+    except (PasswordHasherBusy, DeadlineExceeded, sqlite3.Error):
+        pass
+
+def generate_jwt_token(username, expires_delta=timedelta(minutes=15), token_type='access', jti=None, extra_claims=None,
+                       expires_at=None):
+    """Génère un token JWT pour l'utilisateur fourni.
+
+    extra_claims permet d'embarquer l'identité (user_id, role) dans l'access
+    token pour que le Gateway puisse le vérifier sans appeler /auth/verify.
+    expires_at fixe l'expiration (celle déjà enregistrée en base) à la place de expires_delta.
+    """
     from datetime import timezone
     now = datetime.now(timezone.utc)
-    expiration = now + expires_delta
+    expiration = expires_at or now + expires_delta
     payload = {
         'username': username,
         'type': token_type,
@@ -69,6 +405,9 @@ def generate_jwt_token(username, expires_delta=timedelta(minutes=15), token_type
     if jti:
         payload['jti'] = jti
 
+    if extra_claims:
+        payload.update(extra_claims)
+
     # Authlib format: jwt.encode(header, payload, key)
     header = {'alg': 'HS256'}
     token = jwt.encode(header, payload, app.config['SECRET_KEY'])
@@ -94,14 +433,14 @@ def decode_token_ignore_expiration(token):
     except (InvalidTokenError, DecodeError, BadSignatureError):
         return None
 
-def store_refresh_token(user_id, jti, expires_at):
-    """Stocke un refresh token dans la base de données."""
+def store_refresh_token(user_id, jti, expires_at, family_id=None):
+    """Stocke un refresh token dans la base de données (nouvelle famille par défaut : celle d'un login)."""
     conn = get_db()
     cursor = conn.cursor()
     cursor.execute('''
-        INSERT OR REPLACE INTO refresh_tokens (jti, user_id, created_at, expires_at, revoked)
-        VALUES (?, ?, ?, ?, 0)
-    ''', (jti, user_id, datetime.now(timezone.utc).isoformat(), expires_at.isoformat()))
+        INSERT OR REPLACE INTO refresh_tokens (jti, user_id, family_id, created_at, expires_at, revoked)
+        VALUES (?, ?, ?, ?, ?, 0)
+    ''', (jti, user_id, family_id or jti, datetime.now(timezone.utc).isoformat(), expires_at.isoformat()))
     conn.commit()
     conn.close()
 
@@ -109,52 +448,106 @@ def mark_refresh_token_revoked(jti):
     """Marque un refresh token comme révoqué."""
     conn = get_db()
     cursor = conn.cursor()
-    cursor.execute('UPDATE refresh_tokens SET revoked = 1 WHERE jti = ?', (jti,))
+    cursor.execute('UPDATE refresh_tokens SET revoked = 1, revoked_at = ? WHERE jti = ? AND revoked = 0',
+                   (datetime.now(timezone.utc).isoformat(), jti))
     conn.commit()
     conn.close()
 
-def is_refresh_token_revoked_or_expired(jti):
-    """Vérifie si un refresh token est révoqué ou expiré."""
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT jti, user_id, revoked, expires_at FROM refresh_tokens WHERE jti = ?', (jti,))
-    row = cursor.fetchone()
-    conn.close()
-
-    if not row:
-        return True, None
+class RefreshRejected(Exception):
+    """Refresh token refusé à la rotation (inconnu, expiré, révoqué ou déjà utilisé)."""
 
-    revoked, expires_at = row['revoked'], row['expires_at']
-    if revoked:
-        return True, row
+def rotate_refresh_token(jti, new_jti, new_expires_at):
+    """Rotation en une transaction : révoque `jti` s'il est encore valide, enregistre `new_jti`
+    dans la même famille et retourne (utilisateur, jti du successeur, expiration du successeur),
+    l'utilisateur étant lu par jointure sur la même connexion.
 
+    Un token déjà révoqué présenté à nouveau (rejeu d'un token volé, ou du token légitime
+    après vol) révoque toute sa famille. Exception : dans les REFRESH_TOKEN_REUSE_GRACE s
+    qui suivent sa rotation, et tant que son successeur n'a pas servi, c'est ce successeur
+    qui est renvoyé (double envoi, rotations concurrentes du même token). Lève RefreshRejected.
+    """
+    now = datetime.now(timezone.utc)
+    now_iso = now.isoformat()
+    conn = get_db()
     try:
-        expires = datetime.fromisoformat(expires_at)
-        # S'assurer que expires est timezone-aware
-        if expires.tzinfo is None:
-            expires = expires.replace(tzinfo=timezone.utc)
-    except ValueError:
-        return True, row
-
-    # Utiliser datetime.now(timezone.utc) au lieu de datetime.utcnow()
-    return expires <= datetime.now(timezone.utc), row
-
-def create_token_pair(user_row):
-    """Crée une paire de tokens (access + refresh)."""
-    username = user_row['username']
-    user_id = user_row['id']
-
-    access_token, access_exp = generate_jwt_token(username, expires_delta=timedelta(minutes=15), token_type='access')
+        # Verrou d'écriture pris d'emblée : pas d'échec de promotion du verrou sous concurrence
+        conn.execute('BEGIN IMMEDIATE')
+        revoked = conn.execute(
+            'UPDATE refresh_tokens SET revoked = 1, revoked_at = ?, replaced_by = ? '
+            'WHERE jti = ? AND revoked = 0 AND expires_at > ?',
+            (now_iso, new_jti, jti, now_iso)).rowcount
+        if not revoked:
+            row = conn.execute('SELECT revoked, revoked_at, family_id, replaced_by FROM refresh_tokens WHERE jti = ?',
+                               (jti,)).fetchone()
+            if row is None or not row['revoked']:
+                conn.rollback()
+                raise RefreshRejected('Refresh token révoqué ou expiré')
+            if row['replaced_by'] and row['revoked_at'] > (now - timedelta(seconds=REFRESH_TOKEN_REUSE_GRACE)).isoformat():
+                successor = conn.execute('''
+                    SELECT u.id, u.username, u.email, u.role, u.token_version, t.expires_at
+                    FROM refresh_tokens t JOIN users u ON u.id = t.user_id
+                    WHERE t.jti = ? AND t.revoked = 0 AND t.expires_at > ?
+                ''', (row['replaced_by'], now_iso)).fetchone()
+                if successor is not None:
+                    conn.rollback()
+                    REFRESH_TOKEN_REUSE_GRACED.inc()
+                    return successor, row['replaced_by'], datetime.fromisoformat(successor['expires_at'])
+            family_revoked = conn.execute(
+                'UPDATE refresh_tokens SET revoked = 1, revoked_at = ? WHERE family_id = ? AND revoked = 0',
+                (now_iso, row['family_id'] or jti)).rowcount
+            conn.commit()
+            if family_revoked:
+                REFRESH_TOKEN_REUSE.inc()
+                raise RefreshRejected('Refresh token déjà utilisé, session révoquée')
+            raise RefreshRejected('Refresh token révoqué ou expiré')
+        conn.execute('''
+            INSERT INTO refresh_tokens (jti, user_id, family_id, created_at, expires_at, revoked)
+            SELECT ?, user_id, COALESCE(family_id, jti), ?, ?, 0 FROM refresh_tokens WHERE jti = ?
+        ''', (new_jti, now_iso, new_expires_at.isoformat(), jti))
+        user_row = conn.execute('''
+            SELECT u.id, u.username, u.email, u.role, u.token_version
+            FROM refresh_tokens t JOIN users u ON u.id = t.user_id
+            WHERE t.jti = ?
+        ''', (new_jti,)).fetchone()
+        if user_row is None:
+            # Utilisateur supprimé : l'ancien token reste révoqué, sans successeur
+            conn.execute('DELETE FROM refresh_tokens WHERE jti = ?', (new_jti,))
+            conn.commit()
+            raise RefreshRejected('Utilisateur introuvable')
+        conn.commit()
+        return user_row, new_jti, new_expires_at
+    finally:
+        conn.close()
+
+def create_access_token(user_row):
+    """Access token avec identité complète et version de sécurité : /auth/verify répond sans lire SQLite."""
+    access_token, access_exp = generate_jwt_token(
+        user_row['username'],
+        expires_delta=timedelta(minutes=15),
+        token_type='access',
+        extra_claims={'user_id': user_row['id'], 'role': user_row['role'], 'email': user_row['email'],
+                      'ver': user_row['token_version']}
+    )
+    user_versions.set(user_row['id'], user_row['token_version'])
+    return access_token, access_exp
 
-    refresh_jti = secrets.token_hex(16)
+def create_refresh_token(username, jti=None, expires_at=None):
+    """Retourne (jti, refresh token, expiration) ; l'enregistrement en base est à la charge de l'appelant."""
+    refresh_jti = jti or secrets.token_hex(16)
     refresh_token, refresh_exp = generate_jwt_token(
         username,
-        expires_delta=timedelta(days=7),
+        expires_delta=REFRESH_TOKEN_LIFETIME,
         token_type='refresh',
-        jti=refresh_jti
+        jti=refresh_jti,
+        expires_at=expires_at
     )
+    return refresh_jti, refresh_token, refresh_exp
 
-    store_refresh_token(user_id, refresh_jti, refresh_exp)
+def create_token_pair(user_row):
+    """Crée une paire de tokens (access + refresh) ; le refresh token ouvre une nouvelle famille."""
+    access_token, access_exp = create_access_token(user_row)
+    refresh_jti, refresh_token, refresh_exp = create_refresh_token(user_row['username'])
+    store_refresh_token(user_row['id'], refresh_jti, refresh_exp)
 
     return {
         'access_token': access_token,
@@ -194,15 +587,8 @@ def login():
         'message': f'Connexion réussie ! Bienvenue {username}'
     }), 200
 
-@app.route('/auth/verify', methods=['POST'])
-def verify_token():
-    """Endpoint pour vérifier la validité d'un token JWT."""
-    data = request.get_json(silent=True) or {}
-    token = (data.get('token') or '').strip()
-
-    if not token:
-        return jsonify({'message': 'Token manquant'}), 400
-
+def decode_access_token(token):
+    """Décode et valide un access token : retourne (payload, None) ou (None, message d'erreur)."""
     try:
         decoded = jwt.decode(token, app.config['SECRET_KEY'])
         # Si decoded est un objet Claims, convertir en dict
@@ -211,35 +597,114 @@ def verify_token():
             payload = dict(decoded)
         else:
             payload = decoded
-        username = payload.get('username')
-        token_type = payload.get('type')
-
-        if not username:
-            return jsonify({'valid': False, 'message': 'Token invalide (pas de username)'}), 200
+    except ExpiredTokenError:
+        return None, 'Token expiré'
+    except (InvalidTokenError, DecodeError, BadSignatureError) as e:
+        return None, f'Token invalide: {str(e)}'
+
+    if not payload.get('username'):
+        return None, 'Token invalide (pas de username)'
+    if payload.get('type') != 'access':
+        return None, 'Token invalide (type)'
+    return payload, None
+
+def has_embedded_identity(payload):
+    """Vrai pour les tokens portant user_id, role et version de sécurité (vérifiables sans SQLite)."""
+    return payload.get('user_id') is not None and bool(payload.get('role')) and payload.get('ver') is not None
+
+def token_verdict(payload, versions, user_rows):
+    """Verdict d'un access token décodé.
+
+    versions : user_id -> token_version courante (tokens avec identité embarquée) ;
+    user_rows : username -> ligne users (anciens tokens, relus en base).
+    """
+    if has_embedded_identity(payload):
+        # Réponse depuis les claims : l'utilisateur doit exister avec la même version de sécurité
+        current_version = versions.get(payload['user_id'])
+        if current_version is None:
+            return {'valid': False, 'message': 'Utilisateur inexistant'}
+        if current_version != payload['ver']:
+            return {'valid': False, 'message': 'Token révoqué (rôle ou email modifié)'}
+        user = {'id': payload['user_id'], 'username': payload['username'],
+                'email': payload.get('email'), 'role': payload['role']}
+    else:
+        user_row = user_rows.get(payload['username'])
+        if not user_row:
+            return {'valid': False, 'message': 'Utilisateur inexistant'}
+        user = {
+            'id': user_row['id'],
+            'username': user_row['username'],
+            'email': user_row['email'],
+            'role': user_row['role']
+        }
+    return {'valid': True, 'user': user, 'payload': payload}
 
-        if token_type != 'access':
-            return jsonify({'valid': False, 'message': 'Token invalide (type)'}), 200
+@app.route('/auth/verify', methods=['POST'])
+def verify_token():
+    """Endpoint pour vérifier la validité d'un token JWT."""
+    data = request.get_json(silent=True) or {}
+    token = (data.get('token') or '').strip()
 
-        # Vérifie que l'utilisateur existe toujours
-        user_row = fetch_user(username)
-        if not user_row:
-            return jsonify({'valid': False, 'message': 'Utilisateur inexistant'}), 200
-
-        return jsonify({
-            'valid': True,
-            'user': {
-                'id': user_row['id'],
-                'username': user_row['username'],
-                'email': user_row['email'],
-                'role': user_row['role']
-            },
-            'payload': payload
-        }), 200
+    if not token:
+        return jsonify({'message': 'Token manquant'}), 400
 
-    except ExpiredTokenError:
-        return jsonify({'valid': False, 'message': 'Token expiré'}), 200
-    except (InvalidTokenError, DecodeError, BadSignatureError) as e:
-        return jsonify({'valid': False, 'message': f'Token invalide: {str(e)}'}), 200
+    payload, error = decode_access_token(token)
+    if error:
+        return jsonify({'valid': False, 'message': error}), 200
+
+    if has_embedded_identity(payload):
+        versions, user_rows = user_versions.get_many([payload['user_id']]), {}
+    else:
+        # Anciens tokens sans identité embarquée : l'utilisateur est relu en base
+        versions, user_rows = {}, {payload['username']: fetch_user(payload['username'])}
+    return jsonify(token_verdict(payload, versions, user_rows)), 200
+
+@app.route('/auth/user-versions', methods=['GET'])
+def list_user_versions():
+    """Table user_id -> token_version, relevée par le Gateway pour vérifier le claim `ver` localement.
+
+    Réservée au Gateway (en-tête X-Internal-Token) : elle énumère tous les utilisateurs.
+    """
+    token = request.headers.get('X-Internal-Token', '')
+    if not INTERNAL_API_TOKEN or not hmac.compare_digest(token.encode('utf-8'), INTERNAL_API_TOKEN.encode('utf-8')):
+        return jsonify({'message': 'Accès réservé aux services internes'}), 403
+    revision, versions = user_versions.snapshot()
+    etag = f'"{USER_VERSIONS_EPOCH}-{revision}"'
+    if etag in [value.strip() for value in request.headers.get('If-None-Match', '').split(',')]:
+        response = app.response_class(status=304)
+    else:
+        response = jsonify({'versions': {str(user_id): version for user_id, version in versions.items()},
+                            'total': len(versions)})
+    response.headers['ETag'] = etag
+    return response
+
+@app.route('/auth/verify/batch', methods=['POST'])
+def verify_token_batch():
+    """Vérifie plusieurs tokens en une requête : {"tokens": [...]} -> verdicts dans le même ordre.
+
+    Les utilisateurs des anciens tokens sont lus en une seule requête (username IN (...)),
+    les versions absentes de la table en mémoire aussi (id IN (...)).
+    """
+    data = request.get_json(silent=True)
+    tokens = data.get('tokens') if isinstance(data, dict) else None
+    if not isinstance(tokens, list) or not tokens:
+        return jsonify({'message': 'Liste de tokens manquante ({"tokens": [...]})'}), 400
+    if len(tokens) > VERIFY_BATCH_MAX:
+        return jsonify({'message': f'Trop de tokens (maximum {VERIFY_BATCH_MAX})'}), 400
+
+    decoded = [
+        decode_access_token(token.strip()) if isinstance(token, str) and token.strip() else (None, 'Token manquant')
+        for token in tokens
+    ]
+    payloads = [payload for payload, _ in decoded if payload is not None]
+    versions = user_versions.get_many({p['user_id'] for p in payloads if has_embedded_identity(p)})
+    user_rows = fetch_users({p['username'] for p in payloads if not has_embedded_identity(p)})
+
+    results = [
+        token_verdict(payload, versions, user_rows) if payload is not None else {'valid': False, 'message': error}
+        for payload, error in decoded
+    ]
+    return jsonify({'results': results, 'total': len(results)}), 200
 
 @app.route('/auth/refresh', methods=['POST'])
 def refresh_token():
@@ -276,24 +741,23 @@ def refresh_token():
     if not jti:
         return jsonify({'message': 'Refresh token sans identifiant'}), 401
 
-    revoked_or_expired, row = is_refresh_token_revoked_or_expired(jti)
-    if revoked_or_expired or not row:
-        return jsonify({'message': 'Refresh token révoqué ou expiré'}), 401
-
-    user_row = fetch_user_by_id(row['user_id'])
-    if not user_row:
-        mark_refresh_token_revoked(jti)
-        return jsonify({'message': 'Utilisateur introuvable'}), 401
-
-    # Rotation : révoque l'ancien refresh token et renvoie une nouvelle paire
-    mark_refresh_token_revoked(jti)
-    tokens = create_token_pair(user_row)
+    # Rotation : révocation de l'ancien, enregistrement du nouveau et lecture de l'utilisateur
+    # en une seule transaction ; le nouveau token est signé ensuite, avec le username lu en base
+    # (renommage depuis l'émission de l'ancien token)
+    try:
+        user_row, new_jti, new_refresh_exp = rotate_refresh_token(
+            jti, secrets.token_hex(16), datetime.now(timezone.utc) + REFRESH_TOKEN_LIFETIME)
+    except RefreshRejected as e:
+        return jsonify({'message': str(e)}), 401
+    access_token, access_exp = create_access_token(user_row)
+    # Dans la fenêtre de grâce, new_jti est celui du successeur déjà émis : même ligne, même expiration
+    _, new_refresh_token, new_refresh_exp = create_refresh_token(user_row['username'], new_jti, new_refresh_exp)
 
     return jsonify({
-        'access_token': tokens['access_token'],
-        'access_expires_at': tokens['access_expires_at'].isoformat() + 'Z',
-        'refresh_token': tokens['refresh_token'],
-        'refresh_expires_at': tokens['refresh_expires_at'].isoformat() + 'Z',
+        'access_token': access_token,
+        'access_expires_at': access_exp.isoformat() + 'Z',
+        'refresh_token': new_refresh_token,
+        'refresh_expires_at': new_refresh_exp.isoformat() + 'Z',
         'message': 'Tokens renouvelés avec succès'
     }), 200
 
@@ -345,5 +809,5 @@ def health():
 
 if __name__ == '__main__':
     print("Demarrage de l'Auth Service sur le port 5001...")
-    app.run(debug=True, port=5001, host='0.0.0.0')
+    serve(app, port=5001)
 
@@ -0,0 +1,69 @@
+"""
+Benchmark : débit de /auth/login selon le coût du hachage, calcul inline ou dans le pool de processus
+- Pour chaque méthode (--methods), une base dont les mots de passe sont hachés avec cette méthode
+- inline (PASSWORD_HASH_WORKERS=0) : le hachage tourne dans le thread de la requête
+- pool : pool de processus borné (--workers, --max-pending) ; au-delà, 503
+- Pendant la charge de logins, latence de /health : ce que subissent les autres endpoints du service
+
+Usage (depuis le dossier auth_service/) :
+    python bench_login.py [--requests 64] [--concurrency 16] [--workers 2]
+                          [--methods pbkdf2:sha256:100000,scrypt:16384:8:1,scrypt]
+"""
+
+import argparse
+import tempfile
+import threading
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Outils communs aux benchmarks (gateway/bench_utils.py)
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'gateway'))
+
+from shared.passwords import PasswordHasher
+from bench_utils import serve_in_thread, load_service_module, create_users_db, run_load, print_result
+
+def bench_method(auth, url, method, args):
+    db_path = os.path.join(tempfile.mkdtemp(prefix='bench_login_'), 'users.db')
+    create_users_db(db_path, users=[('bench', 'bench', 'bench@esme.fr', 'user')], password_method=method)
+    auth.DATABASE_PATH = db_path
+    auth.user_versions = auth.UserVersions(db_path)
+
+    for label, workers in (('inline', 0), (f'pool x{args.workers}', args.workers)):
+        auth.password_hasher = PasswordHasher(
+            method, workers=workers, max_pending=args.max_pending, wait=args.wait)
+        # Premier login hors mesure : démarrage des processus du pool
+        run_load(f'{url}/auth/login', total=1, concurrency=1, method='POST',
+                 json_body={'username': 'bench', 'password': 'bench'})
+
+        health = {}
+        def probe():
+            health['result'] = run_load(f'{url}/health', total=args.requests, concurrency=1)
+        prober = threading.Thread(target=probe)
+        prober.start()
+        login = run_load(f'{url}/auth/login', total=args.requests, concurrency=args.concurrency, method='POST',
+                         json_body={'username': 'bench', 'password': 'bench'})
+        prober.join()
+        print_result(f'  {label} login', login)
+        print_result(f'  {label} /health', health['result'])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=64)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--max-pending', type=int, default=64)
+    parser.add_argument('--wait', type=float, default=30.0)
+    parser.add_argument('--methods', default='pbkdf2:sha256:100000,scrypt:16384:8:1,scrypt')
+    args = parser.parse_args()
+
+    auth = load_service_module('auth_app', 'auth_service/app.py')
+    _, url = serve_in_thread(auth.app)
+
+    print(f'{args.requests} logins, {args.concurrency} clients, {os.cpu_count()} CPU\n')
+    for method in args.methods.split(','):
+        print(method)
+        bench_method(auth, url, method, args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+Benchmark : latence de /auth/refresh avec un historique volumineux dans refresh_tokens
+- Table remplie de --rows lignes d'historique (expirées, révoquées, encore valides)
+- Latence des refresh sans index, puis après création des index (durée de création mesurée)
+- Latence pendant une purge incrémentale (lots de --batch lignes) et durée des lots,
+  c'est-à-dire le temps de verrou d'écriture imposé aux requêtes
+- Latence et taille de la table après la purge
+
+Usage (depuis le dossier auth_service/) :
+    python bench_refresh_tokens.py [--rows 10000000] [--refreshes 300] [--batch 1000]
+"""
+
+from datetime import datetime, timedelta, timezone
+import argparse
+import sqlite3
+import tempfile
+import threading
+import time
+import sys
+import os
+
+# Outils communs aux benchmarks (gateway/bench_utils.py)
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'gateway'))
+
+from bench_utils import load_service_module, create_users_db, percentile
+
+def fill_history(db_path, rows, users):
+    """Insère `rows` refresh tokens : 60 % expirés, 30 % révoqués depuis 2 jours, 10 % valides."""
+    now = datetime.now(timezone.utc)
+    expired_at = (now - timedelta(days=1)).isoformat()
+    valid_until = (now + timedelta(days=6)).isoformat()
+    revoked_at = (now - timedelta(days=2)).isoformat()
+    created_at = (now - timedelta(days=8)).isoformat()
+
+    def generate():
+        for i in range(rows):
+            kind = i % 10
+            if kind < 6:
+                yield (f'h{i:031x}', i % users + 1, created_at, expired_at, 0, None)
+            elif kind < 9:
+                yield (f'h{i:031x}', i % users + 1, created_at, valid_until, 1, revoked_at)
+            else:
+                yield (f'h{i:031x}', i % users + 1, created_at, valid_until, 0, None)
+
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA journal_mode = OFF')
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.executemany('INSERT INTO refresh_tokens (jti, user_id, created_at, expires_at, revoked, revoked_at) '
+                     'VALUES (?, ?, ?, ?, ?, ?)', generate())
+    conn.commit()
+    conn.execute('PRAGMA journal_mode = DELETE')
+    conn.close()
+
+def measure_refreshes(client, refresh_token, count):
+    """Enchaîne `count` rotations ; retourne (latences en s, dernier refresh token)."""
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        response = client.post('/auth/refresh', json={'refresh_token': refresh_token})
+        latencies.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.get_json()
+        refresh_token = response.get_json()['refresh_token']
+    return latencies, refresh_token
+
+def print_latencies(label, latencies):
+    print(f'{label:<28} p50 {percentile(latencies, 50) * 1000:7.2f} ms   p99 {percentile(latencies, 99) * 1000:7.2f} ms'
+          f'   max {max(latencies) * 1000:7.2f} ms')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10_000_000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--refreshes', type=int, default=300)
+    parser.add_argument('--batch', type=int, default=1000)
+    parser.add_argument('--pause', type=float, default=0.05)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix='bench_refresh_tokens_'), 'users.db')
+    create_users_db(db_path, users=[(f'user{i}', 'bench', f'user{i}@esme.fr', 'user') for i in range(args.users)])
+    start = time.perf_counter()
+    fill_history(db_path, args.rows, args.users)
+    print(f'{args.rows} lignes d\'historique insérées en {time.perf_counter() - start:.1f} s '
+          f'({os.path.getsize(db_path) / 2**20:.0f} Mo)\n')
+
+    auth = load_service_module('auth_app', 'auth_service/app.py')
+    auth.DATABASE_PATH = db_path
+    auth.user_versions = auth.UserVersions(db_path)
+    client = auth.app.test_client()
+    token = client.post('/auth/login', json={'username': 'user0', 'password': 'bench'}).get_json()['refresh_token']
+
+    latencies, token = measure_refreshes(client, token, args.refreshes)
+    print_latencies('sans index', latencies)
+
+    start = time.perf_counter()
+    auth.ensure_refresh_token_schema()
+    print(f'création des index : {time.perf_counter() - start:.1f} s')
+    latencies, token = measure_refreshes(client, token, args.refreshes)
+    print_latencies('avec index', latencies)
+
+    maintenance = auth.RefreshTokenMaintenance(db_path, batch_size=args.batch, pause=args.pause,
+                                               max_batches=args.rows, revoked_retention=86400)
+    batches = []
+    purge_batch = maintenance.purge_batch
+    def timed_batch(conn, reason, cutoff):
+        batch_start = time.perf_counter()
+        deleted = purge_batch(conn, reason, cutoff)
+        batches.append(time.perf_counter() - batch_start)
+        return deleted
+    maintenance.purge_batch = timed_batch
+
+    purged = {}
+    purge_thread = threading.Thread(target=lambda: purged.update(maintenance.purge()))
+    start = time.perf_counter()
+    purge_thread.start()
+    during = []
+    while purge_thread.is_alive():
+        batch_latencies, token = measure_refreshes(client, token, 10)
+        during.extend(batch_latencies)
+    purge_thread.join()
+    duration = time.perf_counter() - start
+    print_latencies('pendant la purge', during)
+    print(f'purge : {purged} en {duration:.1f} s, {len(batches)} lots, '
+          f'lot p50 {percentile(batches, 50) * 1000:.1f} ms, max {max(batches) * 1000:.1f} ms')
+
+    latencies, token = measure_refreshes(client, token, args.refreshes)
+    print_latencies('après la purge', latencies)
+    start = time.perf_counter()
+    stats = maintenance.table_stats()
+    print(f'table : {stats} (comptage en {time.perf_counter() - start:.2f} s)')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmark : /auth/verify/batch face à un appel /auth/verify par token
+- Tokens avec identité embarquée (user_id, role, ver) : vérifiés sur les claims et la table
+  de versions en mémoire
+- Anciens tokens (username seul) : utilisateur relu en base, un SELECT par token en unitaire,
+  un seul SELECT ... WHERE username IN (...) par lot
+- Coût par token via le client de test (sans réseau), puis en HTTP (aller-retour compris)
+
+Usage (depuis le dossier auth_service/) :
+    python bench_verify_batch.py [--users 200] [--batch 200] [--rounds 5]
+"""
+
+import argparse
+import tempfile
+import time
+import sys
+import os
+
+import requests
+
+# Outils communs aux benchmarks (gateway/bench_utils.py)
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'gateway'))
+
+from bench_utils import serve_in_thread, load_service_module, create_users_db
+
+def build_tokens(auth, users, legacy):
+    """Un access token par utilisateur ; legacy=True : sans user_id / role / ver (anciens tokens)."""
+    tokens = []
+    for row in users:
+        if legacy:
+            token, _ = auth.generate_jwt_token(row['username'], token_type='access')
+        else:
+            token = auth.create_token_pair(row)['access_token']
+        tokens.append(token)
+    return tokens
+
+def bench_test_client(client, tokens, rounds):
+    """Retourne (µs par token en unitaire, µs par token en lot), meilleur tour retenu."""
+    single, batch = float('inf'), float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for token in tokens:
+            assert client.post('/auth/verify', json={'token': token}).get_json()['valid']
+        single = min(single, (time.perf_counter() - start) / len(tokens) * 1e6)
+
+        start = time.perf_counter()
+        results = client.post('/auth/verify/batch', json={'tokens': tokens}).get_json()['results']
+        batch = min(batch, (time.perf_counter() - start) / len(tokens) * 1e6)
+        assert all(result['valid'] for result in results)
+    return single, batch
+
+def bench_http(url, tokens, rounds):
+    """Retourne (ms pour vérifier tous les tokens un par un, ms en un seul lot), meilleur tour retenu."""
+    session = requests.Session()
+    single, batch = float('inf'), float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for token in tokens:
+            session.post(f'{url}/auth/verify', json={'token': token}, timeout=30)
+        single = min(single, (time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        session.post(f'{url}/auth/verify/batch', json={'tokens': tokens}, timeout=30)
+        batch = min(batch, (time.perf_counter() - start) * 1000)
+    return single, batch
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--batch', type=int, default=200)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix='bench_verify_batch_')
+    db_path = os.path.join(tmp_dir, 'users.db')
+    create_users_db(db_path, users=[(f'user{i}', 'bench', f'user{i}@esme.fr', 'user') for i in range(args.users)])
+
+    auth = load_service_module('auth_app', 'auth_service/app.py')
+    auth.DATABASE_PATH = db_path
+    auth.user_versions = auth.UserVersions(db_path)
+    users = [auth.fetch_user(f'user{i % args.users}') for i in range(args.batch)]
+    _, url = serve_in_thread(auth.app)
+    client = auth.app.test_client()
+
+    print(f'{args.batch} tokens ({args.users} utilisateurs), meilleur de {args.rounds} tours\n')
+    for label, legacy in (('identité embarquée', False), ('anciens tokens', True)):
+        tokens = build_tokens(auth, users, legacy)
+        single, batch = bench_test_client(client, tokens, args.rounds)
+        single_ms, batch_ms = bench_http(url, tokens, args.rounds)
+        print(f'{label} :')
+        print(f'  client de test : unitaire {single:7.1f} µs/token   lot {batch:7.1f} µs/token   '
+              f'(x{single / batch:.1f})')
+        print(f'  HTTP           : unitaire {single_ms:7.1f} ms        lot {batch_ms:7.1f} ms        '
+              f'(x{single_ms / batch_ms:.1f})')
+
+if __name__ == '__main__':
+    main()
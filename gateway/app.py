@@ -2,77 +2,556 @@
 API Gateway - Point d'entrée unique pour tous les clients
 Port: 5000
 Responsabilités:
-- Valider les tokens JWT avant de router
+- Valider les tokens JWT avant de router (localement ou via l'Auth Service)
 - Router les requêtes vers les bons services
 - Gérer les erreurs et les timeouts
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, make_response
 import requests
 from functools import wraps
+from authlib.jose import JsonWebToken
+from authlib.jose.errors import ExpiredTokenError, InvalidTokenError, DecodeError, BadSignatureError, JoseError
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.test import EnvironBuilder
+import contextvars
+import threading
+import hashlib
+import base64
+import math
+import json
+import time
+import sys
 import os
 
+# Modules partagés entre services (shared/) : dossier parent en local, /app/shared dans l'image Docker
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.metrics import instrument_app
+from shared.tracing import trace_app, start_span
+from shared.deadline import DEADLINE_HEADER, budget_header
+from shared.serving import serve
+from cache import TTLCache
+from upstreams import Upstream, UpstreamRejected
+from user_versions import UserVersionTable, REVOKED, UNKNOWN
+from singleflight import SingleFlight
+from ratelimit import RateLimiter, create_backend, parse_limit, parse_limits, parse_networks, client_address
+from compression import available_codecs, negotiate, compress_bytes, compress_stream, is_compressible
+from routes import RouteTable, is_allowed
+
 app = Flask(__name__)
+instrument_app(app, 'gateway')
+trace_app(app, 'gateway')
 
 # Configuration des services
 AUTH_SERVICE_URL = os.getenv('AUTH_SERVICE_URL', 'http://localhost:5001')
 USER_SERVICE_URL = os.getenv('USER_SERVICE_URL', 'http://localhost:5002')
 ORDERS_SERVICE_URL = os.getenv('ORDERS_SERVICE_URL', 'http://localhost:5003')
 
-# Timeout pour les requêtes vers les services (en secondes)
+# Timeout de lecture par défaut des requêtes vers les services (en secondes) ;
+# chaque route de la table (routes.json) peut fixer le sien
 SERVICE_TIMEOUT = 5
 
+# Mode de proxy :
+# - 'json'        : le corps est décodé puis ré-encodé (comportement historique)
+# - 'passthrough' : les octets de la requête et de la réponse sont relayés en streaming,
+#                   sans décodage ni mise en mémoire tampon complète
+PROXY_MODE = os.getenv('GATEWAY_PROXY_MODE', 'json')
+STREAM_CHUNK_SIZE = int(os.getenv('GATEWAY_STREAM_CHUNK_SIZE', '65536'))
+
+# Regroupement des GET identiques simultanés (même upstream, chemin, query et utilisateur)
+# sur les routes à petites réponses (profil, historique, stats, ...) ; les listes restent en streaming
+COALESCE_GETS = os.getenv('GATEWAY_COALESCE_GETS', 'true').strip().lower() in ('1', 'true', 'yes', 'on')
+get_coalescer = SingleFlight()
+
+# Cache de réponses par utilisateur pour les routes de lecture (profil, utilisateur, historique, stats),
+# invalidé par les écritures réussies qui passent par le Gateway
+RESPONSE_CACHE_TTL = float(os.getenv('GATEWAY_RESPONSE_CACHE_TTL', '30'))
+response_cache = TTLCache(
+    max_entries=int(os.getenv('GATEWAY_RESPONSE_CACHE_MAX_ENTRIES', '10000')),
+    max_bytes=int(os.getenv('GATEWAY_RESPONSE_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+)
+# Incrémenté à chaque invalidation : une lecture commencée avant une écriture n'est pas mise en cache.
+# Le verrou rend atomiques « comparer la génération puis stocker » et « incrémenter puis invalider »
+response_cache_generation = 0
+response_cache_lock = threading.Lock()
+
+# /gateway/batch : nombre max de sous-requêtes par lot, exécutées en parallèle par lot,
+# et threads partagés par tous les lots
+BATCH_MAX_ITEMS = int(os.getenv('GATEWAY_BATCH_MAX_ITEMS', '20'))
+BATCH_CONCURRENCY = int(os.getenv('GATEWAY_BATCH_CONCURRENCY', '6'))
+batch_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('GATEWAY_BATCH_WORKERS', '32')),
+    thread_name_prefix='gateway-batch'
+)
+
+# Compression des réponses au-delà de COMPRESSION_MIN_SIZE octets, codec négocié avec Accept-Encoding
+# (ordre de préférence de GATEWAY_COMPRESSION_CODECS ; br seulement si le module brotli est installé)
+COMPRESSION_ENABLED = os.getenv('GATEWAY_COMPRESSION', 'true').strip().lower() in ('1', 'true', 'yes', 'on')
+COMPRESSION_MIN_SIZE = int(os.getenv('GATEWAY_COMPRESSION_MIN_SIZE', '1024'))
+COMPRESSION_LEVEL = int(os.getenv('GATEWAY_COMPRESSION_LEVEL', '6'))
+COMPRESSION_CODECS = [
+    codec.strip() for codec in os.getenv('GATEWAY_COMPRESSION_CODECS', 'br,gzip,deflate').split(',')
+    if codec.strip() in available_codecs()
+]
+compression_counts = {}
+
+# Limitation de débit (token bucket) par utilisateur sur les routes authentifiées, par IP sur le login :
+# GATEWAY_RATE_LIMITS="<MÉTHODE> <route Flask>=<débit>/<s|m|h>[:<rafale>]; ..."
+RATE_LIMITS = parse_limits(os.getenv(
+    'GATEWAY_RATE_LIMITS', 'POST /gateway/orders=10/s:20; POST /gateway/auth/login=1/s:10'))
+RATE_LIMIT_DEFAULT = os.getenv('GATEWAY_RATE_LIMIT_DEFAULT', '').strip()
+rate_limiter = RateLimiter(
+    create_backend(os.getenv('GATEWAY_RATE_LIMIT_BACKEND', 'memory')),
+    RATE_LIMITS,
+    default=parse_limit(RATE_LIMIT_DEFAULT) if RATE_LIMIT_DEFAULT else None
+)
+# Proxys dont le X-Forwarded-For est cru (IP ou réseaux, séparés par des virgules) : le site web relaie
+# les logins de tous les navigateurs, la limite par IP doit viser le navigateur et non le site
+TRUSTED_PROXIES = parse_networks(os.getenv('GATEWAY_TRUSTED_PROXIES', '127.0.0.1,::1'))
+
+# Une session HTTP poolée (keep-alive) par service backend
+AUTH_SERVICE = Upstream.from_env('auth_service', AUTH_SERVICE_URL, default_read_timeout=SERVICE_TIMEOUT)
+USER_SERVICE = Upstream.from_env('user_service', USER_SERVICE_URL, default_read_timeout=SERVICE_TIMEOUT)
+ORDERS_SERVICE = Upstream.from_env('orders_service', ORDERS_SERVICE_URL, default_read_timeout=SERVICE_TIMEOUT)
+UPSTREAMS = [AUTH_SERVICE, USER_SERVICE, ORDERS_SERVICE]
+UPSTREAMS_BY_NAME = {upstream.name: upstream for upstream in UPSTREAMS}
+
+# Table de routes déclarative : routes /gateway/* relayées vers un backend, avec leur timeout,
+# cache, regroupement et politique de relance ; rechargée quand le fichier change
+ROUTES_FILE = os.getenv('GATEWAY_ROUTES_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'routes.json'))
+route_table = RouteTable(ROUTES_FILE, UPSTREAMS_BY_NAME,
+                         check_interval=float(os.getenv('GATEWAY_ROUTES_RELOAD_INTERVAL', '2')))
+
+# Health checks actifs des réplicas et rechargement de leur liste (fichier / DNS) ; 0 les désactive
+HEALTH_CHECK_INTERVAL = float(os.getenv('GATEWAY_HEALTH_CHECK_INTERVAL', '5'))
+for upstream in UPSTREAMS:
+    upstream.start_health_checks(HEALTH_CHECK_INTERVAL)
+
+# Clé partagée avec l'Auth Service pour vérifier les tokens sans appel HTTP
+JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY')
+
+# Mode de vérification des tokens :
+# - 'local'  : signature HS256, exp, type et version de sécurité (claim ver) vérifiés dans le Gateway,
+#              Auth Service en secours
+# - 'remote' : chaque token est envoyé à l'Auth Service (/auth/verify)
+TOKEN_VERIFY_MODE = os.getenv('GATEWAY_TOKEN_VERIFY_MODE', 'local' if JWT_SECRET_KEY else 'remote')
+
+# Cache des réponses de /auth/verify (clé = empreinte SHA-256 du token)
+# Les tokens valides sont gardés jusqu'à leur exp ou TOKEN_CACHE_TTL (le plus proche),
+# les tokens invalides pendant TOKEN_CACHE_NEGATIVE_TTL pour absorber les rejeux.
+# Tokens portant `ver` (copie des versions active) : au plus GATEWAY_USER_VERSIONS_INTERVAL, voir token_cache_ttl.
+TOKEN_CACHE_TTL = float(os.getenv('GATEWAY_TOKEN_CACHE_TTL', '60'))
+TOKEN_CACHE_NEGATIVE_TTL = float(os.getenv('GATEWAY_TOKEN_CACHE_NEGATIVE_TTL', '5'))
+token_cache = TTLCache(
+    max_entries=int(os.getenv('GATEWAY_TOKEN_CACHE_MAX_ENTRIES', '100000')),
+    max_bytes=int(os.getenv('GATEWAY_TOKEN_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+)
+
+# Seul HS256 est accepté (refuse 'none' et les algorithmes asymétriques)
+local_jwt = JsonWebToken(['HS256'])
+
+# Jeton partagé avec l'Auth Service pour ses endpoints internes (/auth/user-versions)
+INTERNAL_API_TOKEN = os.getenv('INTERNAL_API_TOKEN', '')
+
+def fetch_user_versions(etag):
+    """Relève la table user_id -> token_version de l'Auth Service (voir UserVersionTable)."""
+    headers = {'X-Internal-Token': INTERNAL_API_TOKEN}
+    if etag:
+        headers['If-None-Match'] = etag
+    response = AUTH_SERVICE.request('GET', '/auth/user-versions', headers=headers, retry=False)
+    try:
+        if response.status_code == 304:
+            return response.headers.get('ETag', etag), None
+        if response.status_code != 200:
+            return None
+        versions = response.json().get('versions', {})
+        return response.headers.get('ETag'), {int(user_id): version for user_id, version in versions.items()}
+    finally:
+        response.close()
+
+# Versions de sécurité des utilisateurs, relevées toutes les GATEWAY_USER_VERSIONS_INTERVAL s :
+# un token révoqué (rôle modifié, utilisateur supprimé, ...) est refusé localement dans ce délai ;
+# copie plus ancienne que GATEWAY_USER_VERSIONS_MAX_AGE (Auth Service injoignable) : /auth/verify
+user_version_table = UserVersionTable(
+    fetch_user_versions,
+    interval=float(os.getenv('GATEWAY_USER_VERSIONS_INTERVAL', '1')),
+    max_age=float(os.getenv('GATEWAY_USER_VERSIONS_MAX_AGE', '30'))
+)
+# Sans jeton interne, pas de table : en mode local, chaque token passe par /auth/verify (et son cache)
+if TOKEN_VERIFY_MODE == 'local' and JWT_SECRET_KEY and INTERNAL_API_TOKEN:
+    user_version_table.start()
+
+def verify_token_locally(token):
+    """Vérifie un token JWT dans le Gateway avec la clé partagée.
+
+    Retourne (decide, user) : decide vaut False quand le Gateway ne peut pas
+    conclure seul (pas de clé, token sans user_id/role/ver, version de sécurité
+    inconnue de la copie locale) et qu'il faut interroger l'Auth Service.
+    """
+    if not JWT_SECRET_KEY:
+        return False, None
+
+    try:
+        claims = local_jwt.decode(token, JWT_SECRET_KEY)
+        claims.validate()
+    except ExpiredTokenError:
+        return True, None
+    except (InvalidTokenError, DecodeError, BadSignatureError, JoseError, ValueError):
+        return True, None
+
+    if claims.get('type') != 'access' or not claims.get('username'):
+        return True, None
+
+    # Anciens tokens sans identité embarquée : l'Auth Service doit les résoudre
+    if claims.get('user_id') is None or not claims.get('role') or claims.get('ver') is None:
+        return False, None
+
+    # Signature valide mais version de sécurité dépassée : rôle modifié, utilisateur supprimé, ...
+    verdict = user_version_table.check(claims['user_id'], claims['ver'])
+    if verdict == REVOKED:
+        return True, None
+    if verdict == UNKNOWN:
+        return False, None
+
+    return True, {
+        'id': claims['user_id'],
+        'username': claims['username'],
+        'role': claims['role']
+    }
+
+def verify_token(token):
+    """Vérifie un token JWT selon TOKEN_VERIFY_MODE (local avec secours Auth Service, ou remote)."""
+    if TOKEN_VERIFY_MODE == 'local':
+        decided, user = verify_token_locally(token)
+        if decided:
+            return user is not None, user
+    return verify_token_with_auth_service(token)
+
+def unverified_payload(token):
+    """Décode les claims d'un token sans vérifier la signature (sert uniquement à dimensionner le cache)."""
+    try:
+        segment = token.split('.')[1]
+        return json.loads(base64.urlsafe_b64decode(segment + '=' * (-len(segment) % 4)))
+    except (IndexError, ValueError):
+        return None
+
+def token_expiry(token, payload=None):
+    """Retourne le timestamp exp d'un token sans vérifier la signature (sert uniquement à borner le cache)."""
+    if payload is None:
+        payload = unverified_payload(token)
+    exp = payload.get('exp') if isinstance(payload, dict) else None
+    return exp if isinstance(exp, (int, float)) else None
+
+def token_cache_ttl(token, payload=None):
+    """Durée de cache d'une réponse positive de /auth/verify.
+
+    TOKEN_CACHE_TTL borné par l'exp du token. Un token portant `ver` n'arrive ici que si la
+    copie locale ne connaît pas sa version (utilisateur supprimé, ou plus récent que le relevé) :
+    son verdict n'est gardé que jusqu'au relevé suivant, pour ne pas prolonger la révocation.
+    """
+    if payload is None:
+        payload = unverified_payload(token)
+    ttl = TOKEN_CACHE_TTL
+    exp = token_expiry(token, payload)
+    if exp is not None:
+        ttl = min(ttl, exp - time.time())
+    if isinstance(payload, dict) and payload.get('ver') is not None and user_version_table.running:
+        ttl = min(ttl, user_version_table.interval)
+    return ttl
+
 def verify_token_with_auth_service(token):
-    """Vérifie un token JWT en appelant l'Auth Service."""
+    """Vérifie un token JWT en appelant l'Auth Service (résultats mis en cache, y compris les refus)."""
+    cache_key = hashlib.sha256(token.encode('utf-8')).digest()
+    cached = token_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
     try:
-        response = requests.post(
-            f'{AUTH_SERVICE_URL}/auth/verify',
-            json={'token': token},
-            timeout=SERVICE_TIMEOUT
-        )
+        response = AUTH_SERVICE.request('POST', '/auth/verify', json={'token': token})
         if response.status_code == 200:
             data = response.json()
-            return data.get('valid', False), data.get('user')
+            is_valid, user = data.get('valid', False), data.get('user')
+            if is_valid and user:
+                token_cache.set(cache_key, (True, user), token_cache_ttl(token, data.get('payload')))
+            else:
+                token_cache.set(cache_key, (False, None), TOKEN_CACHE_NEGATIVE_TTL)
+            return is_valid, user
         return False, None
     except requests.exceptions.RequestException as e:
         print(f"Erreur lors de la vérification du token: {e}")
         return False, None
 
-def gateway_auth_required(f):
-    """Décorateur pour protéger une route avec validation JWT via Auth Service."""
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        token = None
+@app.after_request
+def compress_response(response):
+    """Compresse le corps si le client l'accepte ; les corps relayés en streaming le sont au fil de l'eau.
+
+    Réponses déjà encodées par un backend, trop petites, non textuelles ou internes
+    (sous-requêtes d'un lot) : laissées telles quelles.
+    """
+    if (not COMPRESSION_ENABLED or request.method == 'HEAD'
+            or request.environ.get('gateway.batch_user') is not None
+            or response.status_code < 200 or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers or not is_compressible(response.mimetype)):
+        return response
+    response.vary.add('Accept-Encoding')
+    codec = negotiate(request.headers.get('Accept-Encoding'), COMPRESSION_CODECS)
+    if codec is None:
+        return response
+
+    if response.is_streamed:
+        length = response.content_length
+        if length is not None and length < COMPRESSION_MIN_SIZE:
+            return response
+        response.response = compress_stream(response.response, codec, COMPRESSION_LEVEL)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESSION_MIN_SIZE:
+            return response
+        response.set_data(compress_bytes(data, codec, COMPRESSION_LEVEL))
+    response.headers['Content-Encoding'] = codec
+    # La représentation compressée n'est plus identique octet par octet : ETag faible
+    etag = response.headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        response.headers['ETag'] = f'W/{etag}'
+    compression_counts[codec] = compression_counts.get(codec, 0) + 1
+    return response
+
+def rate_limit_exceeded(identity):
+    """Réponse 429 si `identity` a épuisé la limite de la route courante, None sinon."""
+    rule = request.url_rule
+    route = f'{request.method} {rule.rule if rule is not None else request.path}'
+    wait = rate_limiter.check(route, identity)
+    if not wait:
+        return None
+    return jsonify({'message': 'Trop de requêtes, réessayez plus tard'}), 429, {'Retry-After': str(max(1, math.ceil(wait)))}
+
+def authenticate_request():
+    """Valide le token de la requête courante : retourne (user, None) ou (None, réponse 401/429)."""
+    token = None
+
+    if 'Authorization' in request.headers:
+        auth_header = request.headers['Authorization']
+        parts = auth_header.split()
+        if len(parts) == 2 and parts[0].lower() == 'bearer':
+            token = parts[1]
+        else:
+            return None, (jsonify({'message': 'Format de token invalide. Utiliser "Bearer <token>"'}), 401)
 
-        if 'Authorization' in request.headers:
-            auth_header = request.headers['Authorization']
-            parts = auth_header.split()
-            if len(parts) == 2 and parts[0].lower() == 'bearer':
-                token = parts[1]
-            else:
-                return jsonify({'message': 'Format de token invalide. Utiliser "Bearer <token>"'}), 401
+    # Sous-requête d'un lot (/gateway/batch) : l'utilisateur a déjà été authentifié
+    batch_user = request.environ.get('gateway.batch_user')
+    if batch_user is not None:
+        limited = rate_limit_exceeded(f"user:{batch_user['id']}")
+        if limited:
+            return None, limited
+        return batch_user, None
 
-        if not token:
-            return jsonify({'message': 'Token manquant'}), 401
+    if not token:
+        return None, (jsonify({'message': 'Token manquant'}), 401)
 
-        # Vérifie le token via l'Auth Service
-        is_valid, user = verify_token_with_auth_service(token)
-        if not is_valid or not user:
-            return jsonify({'message': 'Token invalide ou expiré'}), 401
+    # Vérifie le token (localement si possible, sinon via l'Auth Service)
+    with start_span('verify_token', tags={'mode': TOKEN_VERIFY_MODE}):
+        is_valid, user = verify_token(token)
+    if not is_valid or not user:
+        return None, (jsonify({'message': 'Token invalide ou expiré'}), 401)
 
-        # Ajoute les informations utilisateur aux headers pour les services en aval
-        request.environ['X-User-Id'] = str(user['id'])
-        request.environ['X-Username'] = user['username']
-        request.environ['X-User-Role'] = user.get('role', 'user')
+    limited = rate_limit_exceeded(f"user:{user['id']}")
+    if limited:
+        return None, limited
 
+    # Ajoute les informations utilisateur aux headers pour les services en aval
+    request.environ['X-User-Id'] = str(user['id'])
+    request.environ['X-Username'] = user['username']
+    request.environ['X-User-Role'] = user.get('role', 'user')
+
+    return user, None
+
+def gateway_auth_required(f):
+    """Décorateur pour protéger une route avec validation JWT via Auth Service."""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        user, error = authenticate_request()
+        if error is not None:
+            return error
         return f(user, *args, **kwargs)
 
     return decorated
 
-def forward_request(service_url, path, method='GET', user=None):
-    """Forward une requête vers un service backend."""
-    url = f'{service_url}{path}'
-    
+# Headers hop-by-hop : propres à une connexion, jamais relayés
+HOP_BY_HOP_HEADERS = {
+    'connection', 'keep-alive', 'proxy-connection', 'proxy-authenticate', 'proxy-authorization',
+    'transfer-encoding', 'te', 'trailer', 'upgrade'
+}
+
+# Headers à ne pas recopier vers les backends
+# traceparent est remplacé par celui du span client de l'appel (voir Upstream.request),
+# l'échéance par le budget que le Gateway accorde lui-même au backend ; l'identité (X-User-*)
+# ne vient que du token vérifié, jamais du client, et le jeton interne n'est jamais relayé
+EXCLUDED_REQUEST_HEADERS = HOP_BY_HOP_HEADERS | {
+    'authorization', 'host', 'content-length', 'traceparent', DEADLINE_HEADER.lower(),
+    'x-user-id', 'x-username', 'x-user-role', 'x-internal-token'
+}
+
+class RequestBodyStream:
+    """Corps de requête lu par blocs ; __len__ permet à requests d'envoyer le Content-Length."""
+
+    def __init__(self, stream, length):
+        self.stream = stream
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def read(self, size=-1):
+        return self.stream.read(size if size and size > 0 else STREAM_CHUNK_SIZE)
+
+def request_body_stream():
+    """Retourne le corps de la requête entrante sous forme streamable (ou None s'il est vide)."""
+    if request.content_length:
+        return RequestBodyStream(request.stream, request.content_length)
+    if request.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+        return iter(lambda: request.stream.read(STREAM_CHUNK_SIZE), b'')
+    return None
+
+def passthrough_response(upstream_response):
+    """Relaie la réponse d'un backend octet par octet (statut, headers et Content-Type conservés)."""
+    headers = [
+        (key, value) for key, value in upstream_response.headers.items()
+        if key.lower() not in HOP_BY_HOP_HEADERS
+    ]
+    body = upstream_response.raw.stream(STREAM_CHUNK_SIZE, decode_content=False)
+    response = Response(body, status=upstream_response.status_code, headers=headers, direct_passthrough=True)
+    # Libère (ou ferme si le client a abandonné) la connexion poolée une fois le corps envoyé
+    response.call_on_close(upstream_response.close)
+    return response
+
+def upstream_timeout(upstream):
+    """Timeouts (connect, read) : read de la route (table de routes) ou à défaut de l'upstream,
+    raccourci si la requête en fixe un plus court (sous-requête d'un lot ou du tableau de bord)."""
+    read_timeout = request.environ.get('gateway.route_timeout') or upstream.read_timeout
+    limit = request.environ.get('gateway.read_timeout')
+    if limit is not None:
+        read_timeout = min(read_timeout, limit)
+    return (upstream.connect_timeout, read_timeout)
+
+def route_timeout():
+    """Timeout déclaré par la route courante (None hors table de routes) : fixe la latence cible
+    de la limite adaptative de l'upstream, voir Upstream.latency_target."""
+    return request.environ.get('gateway.route_timeout')
+
+def upstream_retry():
+    """Politique de relance de la route courante (GET couverts et relancés par défaut)."""
+    return request.environ.get('gateway.route_retry', True)
+
+# Réponse d'un backend entièrement lue, partageable entre plusieurs requêtes
+UpstreamSnapshot = namedtuple('UpstreamSnapshot', ['status', 'headers', 'body'])
+
+def fetch_snapshot(upstream, method, path, headers):
+    """Exécute une requête sans corps et lit la réponse complète, sans la décoder."""
+    upstream_response = upstream.request(method, path, headers=headers, stream=True,
+                                         timeout=upstream_timeout(upstream), retry=upstream_retry(),
+                                         route_timeout=route_timeout())
+    try:
+        body = upstream_response.raw.read(decode_content=False)
+    finally:
+        upstream_response.close()
+    response_headers = [
+        (key, value) for key, value in upstream_response.headers.items()
+        if key.lower() not in HOP_BY_HOP_HEADERS
+    ]
+    return UpstreamSnapshot(upstream_response.status_code, response_headers, body)
+
+def snapshot_response(snapshot):
+    """Construit la réponse Flask d'un snapshot selon PROXY_MODE."""
+    if PROXY_MODE == 'passthrough':
+        return Response(snapshot.body, status=snapshot.status, headers=snapshot.headers)
+    try:
+        return jsonify(json.loads(snapshot.body)), snapshot.status
+    except ValueError:
+        return snapshot.body.decode('utf-8', errors='replace'), snapshot.status
+
+def get_snapshot(upstream, path, headers, user=None):
+    """GET lu entièrement, regroupé avec les requêtes identiques simultanées si COALESCE_GETS."""
+    if request.query_string:
+        path = f"{path}?{request.query_string.decode('latin-1')}"
+    if not COALESCE_GETS:
+        return fetch_snapshot(upstream, 'GET', path, headers)
+    key = (
+        upstream.name,
+        path,
+        user['id'] if user else None,
+        request.headers.get('Accept-Encoding')
+    )
+    snapshot, _ = get_coalescer.do(key, lambda: fetch_snapshot(upstream, 'GET', path, headers))
+    return snapshot
+
+def etag_matches(if_none_match, etag):
+    """Vérifie si l'en-tête If-None-Match du client correspond à l'ETag (comparaison faible)."""
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(',')]
+    return '*' in candidates or etag in candidates or f'W/{etag}' in candidates
+
+def cached_get(upstream, path, headers, user, tags):
+    """GET servi depuis le cache de réponses par utilisateur, avec ETag et réponses 304.
+
+    tags : liste de tags d'invalidation, ou fonction snapshot -> tags quand ils
+    dépendent du contenu (ex. id de l'utilisateur retourné par by-username).
+    """
+    key = (
+        user['id'] if user else None,
+        upstream.name,
+        path,
+        request.query_string,
+        request.headers.get('Accept-Encoding')
+    )
+    entry = response_cache.get(key)
+    if entry is None:
+        with response_cache_lock:
+            generation = response_cache_generation
+        snapshot = get_snapshot(upstream, path, headers, user=user)
+        if snapshot.status != 200:
+            return snapshot_response(snapshot)
+        etag = '"' + hashlib.blake2b(snapshot.body, digest_size=16).hexdigest() + '"'
+        entry = (snapshot, etag)
+        entry_tags = tags(snapshot) if callable(tags) else tags
+        size = len(snapshot.body) + sum(len(k) + len(v) for k, v in snapshot.headers)
+        with response_cache_lock:
+            if generation == response_cache_generation:
+                response_cache.set(key, entry, RESPONSE_CACHE_TTL, size=size, tags=entry_tags)
+
+    snapshot, etag = entry
+    if etag_matches(request.headers.get('If-None-Match'), etag):
+        response = Response(status=304)
+    else:
+        response = make_response(snapshot_response(snapshot))
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def invalidate_on_success(rv, tags):
+    """Invalide les tags du cache de réponses si l'écriture relayée a réussi (2xx)."""
+    global response_cache_generation
+    status = rv.status_code if isinstance(rv, Response) else rv[1]
+    if 200 <= status < 300:
+        with response_cache_lock:
+            response_cache_generation += 1
+            for tag in tags:
+                response_cache.invalidate_tag(tag)
+    return rv
+
+def forward_request(upstream, path, method='GET', user=None, coalesce=False, cache_tags=None):
+    """Forward une requête vers un service backend via sa session poolée.
+
+    coalesce=True regroupe les GET identiques simultanés ; la réponse est alors
+    lue entièrement, à réserver aux routes dont les réponses sont petites.
+    cache_tags (GET uniquement) active le cache de réponses par utilisateur.
+    """
+    if method not in ('GET', 'POST', 'PUT', 'DELETE'):
+        return jsonify({'message': f'Méthode {method} non supportée'}), 405
+
     # Prépare les headers
     headers = {}
     if user:
@@ -80,23 +559,43 @@ def forward_request(service_url, path, method='GET', user=None):
         headers['X-Username'] = user['username']
         headers['X-User-Role'] = user.get('role', 'user')
     
-    # Copie les headers de la requête originale (sauf Authorization)
+    # Copie les headers de la requête originale (sauf Authorization et headers hop-by-hop,
+    # pour ne pas fermer la connexion poolée vers le backend)
     for key, value in request.headers:
-        if key.lower() not in ['authorization', 'host', 'content-length']:
+        if key.lower() not in EXCLUDED_REQUEST_HEADERS:
             headers[key] = value
 
+    # Temps accordé au backend : passé ce délai le Gateway a répondu 503, le backend peut abandonner
+    headers[DEADLINE_HEADER] = budget_header(upstream_timeout(upstream)[1])
+
     try:
+        if cache_tags is not None and method == 'GET' and RESPONSE_CACHE_TTL > 0:
+            return cached_get(upstream, path, headers, user, cache_tags)
+
+        if coalesce and method == 'GET' and COALESCE_GETS:
+            return snapshot_response(get_snapshot(upstream, path, headers, user=user))
+
+        if PROXY_MODE == 'passthrough':
+            if request.query_string:
+                path = f"{path}?{request.query_string.decode('latin-1')}"
+            # Pas de corps pour un GET : il peut être couvert par une seconde tentative
+            body = request_body_stream() if method != 'GET' else None
+            response = upstream.request(method, path, headers=headers, data=body, stream=True,
+                                        timeout=upstream_timeout(upstream), retry=upstream_retry(),
+                                        route_timeout=route_timeout())
+            return passthrough_response(response)
+
         # Forward la requête
         if method == 'GET':
-            response = requests.get(url, headers=headers, params=request.args, timeout=SERVICE_TIMEOUT)
-        elif method == 'POST':
-            response = requests.post(url, headers=headers, json=request.get_json(silent=True), timeout=SERVICE_TIMEOUT)
-        elif method == 'PUT':
-            response = requests.put(url, headers=headers, json=request.get_json(silent=True), timeout=SERVICE_TIMEOUT)
-        elif method == 'DELETE':
-            response = requests.delete(url, headers=headers, timeout=SERVICE_TIMEOUT)
+            response = upstream.request('GET', path, headers=headers, params=request.args,
+                                        timeout=upstream_timeout(upstream), retry=upstream_retry(),
+                                        route_timeout=route_timeout())
+        elif method in ('POST', 'PUT'):
+            response = upstream.request(method, path, headers=headers, json=request.get_json(silent=True),
+                                        timeout=upstream_timeout(upstream), route_timeout=route_timeout())
         else:
-            return jsonify({'message': f'Méthode {method} non supportée'}), 405
+            response = upstream.request('DELETE', path, headers=headers, timeout=upstream_timeout(upstream),
+                                        route_timeout=route_timeout())
 
         # Retourne la réponse du service
         try:
@@ -104,6 +603,9 @@ def forward_request(service_url, path, method='GET', user=None):
         except ValueError:
             return response.text, response.status_code
 
+    except UpstreamRejected as e:
+        # Rejet immédiat : circuit ouvert ou limite de concurrence atteinte
+        return jsonify({'message': str(e)}), 503, {'Retry-After': str(max(1, int(round(e.retry_after))))}
     except requests.exceptions.Timeout:
         return jsonify({'message': 'Service temporairement indisponible (timeout)'}), 503
     except requests.exceptions.ConnectionError:
@@ -111,90 +613,226 @@ def forward_request(service_url, path, method='GET', user=None):
     except requests.exceptions.RequestException as e:
         return jsonify({'message': f'Erreur lors de la communication avec le service: {str(e)}'}), 500
 
-# ========== ROUTES AUTH (sans authentification) ==========
-
-@app.route('/gateway/auth/login', methods=['POST'])
-def route_auth_login():
-    """Route les requêtes de login vers l'Auth Service."""
-    return forward_request(AUTH_SERVICE_URL, '/auth/login', method='POST')
-
-@app.route('/gateway/auth/refresh', methods=['POST'])
-def route_auth_refresh():
-    """Route les requêtes de refresh vers l'Auth Service."""
-    return forward_request(AUTH_SERVICE_URL, '/auth/refresh', method='POST')
-
-@app.route('/gateway/auth/logout', methods=['POST'])
-def route_auth_logout():
-    """Route les requêtes de logout vers l'Auth Service."""
-    return forward_request(AUTH_SERVICE_URL, '/auth/logout', method='POST')
+# ========== ROUTES DE LA TABLE (routes.json) ==========
 
-# ========== ROUTES USERS (avec authentification) ==========
+def route_cache_tags(route, values):
+    """Tags de cache de la route ; ceux qui citent {body[...]} sont calculés sur la réponse du backend."""
+    if not any('{body' in tag for tag in route.cache):
+        return [tag.format_map(values) for tag in route.cache]
 
-@app.route('/gateway/users/profile', methods=['GET'])
-@gateway_auth_required
-def route_users_profile(current_user):
-    """Route les requêtes de profil vers le User Service."""
-    return forward_request(USER_SERVICE_URL, '/users/profile', method='GET', user=current_user)
-
-@app.route('/gateway/users', methods=['GET', 'POST'])
-@gateway_auth_required
-def route_users_list(current_user):
-    """Route les requêtes de liste et création d'utilisateurs vers le User Service."""
-    method = request.method
-    return forward_request(USER_SERVICE_URL, '/users', method=method, user=current_user)
-
-@app.route('/gateway/users/<int:user_id>', methods=['GET', 'PUT', 'DELETE'])
-@gateway_auth_required
-def route_users_by_id(current_user, user_id):
-    """Route les requêtes utilisateur par ID vers le User Service."""
-    method = request.method
-    return forward_request(USER_SERVICE_URL, f'/users/{user_id}', method=method, user=current_user)
-
-@app.route('/gateway/users/by-username/<username>', methods=['GET'])
-@gateway_auth_required
-def route_users_by_username(current_user, username):
-    """Route les requêtes utilisateur par username vers le User Service."""
-    return forward_request(USER_SERVICE_URL, f'/users/by-username/{username}', method='GET', user=current_user)
-
-# ========== ROUTES ORDERS (avec authentification) ==========
+    def tags_from_body(snapshot):
+        try:
+            body = json.loads(snapshot.body)
+        except ValueError:
+            body = None
+        tags = []
+        for tag in route.cache:
+            try:
+                tags.append(tag.format_map(dict(values, body=body)))
+            except (KeyError, IndexError, TypeError):
+                pass  # champ absent de la réponse : tag ignoré
+        return tags
+    return tags_from_body
+
+@app.route('/gateway/<path:subpath>', methods=['GET', 'POST', 'PUT', 'DELETE'])
+def dispatch_route(subpath):
+    """Relaie une requête /gateway/* selon l'entrée correspondante de la table de routes."""
+    route, rule, args = route_table.match(request.path, request.method)
+    # Métriques, span serveur et limites de débit portent le modèle de la route de la table
+    request.url_rule = rule
+    span = request.environ.get('tracing.span')
+    if span is not None:
+        span.name = f'{request.method} {rule.rule}'
+    request.environ['gateway.route_timeout'] = route.timeout
+    request.environ['gateway.route_retry'] = route.retry
+
+    if route.auth:
+        user, error = authenticate_request()
+        if error is not None:
+            return error
+        # Politique d'accès évaluée sur le rôle du token : refus sans appel au backend
+        if not is_allowed(route, request.method, user, args):
+            return jsonify({'message': 'Accès refusé'}), 403
+    else:
+        # Pas encore d'utilisateur authentifié : limite par IP cliente
+        user = None
+        ip = client_address(request.remote_addr, request.headers.get('X-Forwarded-For'), TRUSTED_PROXIES)
+        limited = rate_limit_exceeded(f'ip:{ip}')
+        if limited:
+            return limited
 
-@app.route('/gateway/orders', methods=['GET', 'POST'])
-@gateway_auth_required
-def route_orders(current_user):
-    """Route les requêtes de commandes vers le Orders Service."""
     method = request.method
-    return forward_request(ORDERS_SERVICE_URL, '/orders', method=method, user=current_user)
-
-@app.route('/gateway/orders/<int:order_id>', methods=['GET', 'PUT'])
+    values = dict(args, user=user)
+    cache_tags = route_cache_tags(route, values) if route.cache is not None else None
+    response = forward_request(UPSTREAMS_BY_NAME[route.upstream], route.target.format_map(values), method=method,
+                               user=user, coalesce=route.coalesce, cache_tags=cache_tags)
+    invalidated = route.invalidates.get(method)
+    if invalidated:
+        invalidate_on_success(response, [tag.format_map(values) for tag in invalidated])
+    return response
+
+# ========== ROUTE BATCH (avec authentification) ==========
+
+def batch_item_request(item):
+    """(méthode, chemin /gateway/..., erreur) d'une sous-requête ; erreur vaut None si le chemin est permis."""
+    method = str(item.get('method') or 'GET').upper()
+    path = str(item.get('path') or '')
+    if not path.startswith('/gateway/'):
+        path = '/gateway' + (path if path.startswith('/') else '/' + path)
+    # Lot ou tableau de bord imbriqués : leur propre fan-out sur batch_executor pourrait attendre
+    # des threads tous occupés par les sous-requêtes du lot parent (interblocage)
+    if path.startswith(('/gateway/auth/', '/gateway/batch', '/gateway/dashboard')):
+        return method, path, f'Chemin non autorisé dans un lot: {path}'
+    return method, path, None
+
+def dispatch_batch_item(item, user, read_timeout=None):
+    """Exécute une sous-requête du lot via les routes du Gateway et retourne {status, body}."""
+    method, path, error = batch_item_request(item)
+    if error is not None:
+        return {'status': 400, 'body': {'message': error}}
+
+    builder = EnvironBuilder(
+        path=path,
+        method=method,
+        json=item.get('body') if method in ('POST', 'PUT') else None
+    )
+    environ = builder.get_environ()
+    environ['gateway.batch_user'] = user
+    if read_timeout is not None:
+        environ['gateway.read_timeout'] = read_timeout
+    try:
+        with app.request_context(environ):
+            response = app.make_response(app.full_dispatch_request())
+            response.direct_passthrough = False
+            try:
+                data = response.get_data()
+            finally:
+                response.close()
+    except Exception as e:
+        return {'status': 500, 'body': {'message': f'Erreur lors de la sous-requête: {str(e)}'}}
+
+    if response.is_json:
+        body = json.loads(data) if data else None
+    else:
+        body = data.decode('utf-8', errors='replace')
+    return {'status': response.status_code, 'body': body}
+
+@app.route('/gateway/batch', methods=['POST'])
 @gateway_auth_required
-def route_orders_by_id(current_user, order_id):
-    """Route les requêtes de commande par ID vers le Orders Service."""
-    method = request.method
-    return forward_request(ORDERS_SERVICE_URL, f'/orders/{order_id}', method=method, user=current_user)
-
-@app.route('/gateway/orders/history', methods=['GET'])
+def route_batch(current_user):
+    """Exécute plusieurs sous-requêtes {method, path, body} en parallèle (token vérifié une seule fois)."""
+    payload = request.get_json(silent=True)
+    items = payload.get('requests') if isinstance(payload, dict) else payload
+    if not isinstance(items, list) or not items or not all(isinstance(item, dict) for item in items):
+        return jsonify({'message': 'Format invalide (liste de {method, path, body} attendue)'}), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({'message': f'Trop de sous-requêtes (maximum {BATCH_MAX_ITEMS})'}), 400
+
+    # Au plus BATCH_CONCURRENCY sous-requêtes de ce lot en cours à la fois
+    slots = threading.BoundedSemaphore(BATCH_CONCURRENCY)
+    futures = []
+    for item in items:
+        slots.acquire()
+        # copy_context : la sous-requête hérite du span courant (même trace que le lot)
+        future = batch_executor.submit(contextvars.copy_context().run, dispatch_batch_item, item, current_user)
+        future.add_done_callback(lambda _: slots.release())
+        futures.append(future)
+
+    responses = []
+    for item, future in zip(items, futures):
+        result = future.result()
+        if 'id' in item:
+            result['id'] = item['id']
+        responses.append(result)
+
+    return jsonify({'responses': responses, 'total': len(responses)}), 200
+
+# ========== ROUTE DASHBOARD (avec authentification) ==========
+
+# Parties du tableau de bord : nom -> (route Gateway, timeout propre en secondes)
+DASHBOARD_RECENT_ORDERS = int(os.getenv('GATEWAY_DASHBOARD_RECENT_ORDERS', '5'))
+DASHBOARD_PARTS = {
+    'profile': ('/gateway/users/profile', float(os.getenv('GATEWAY_DASHBOARD_PROFILE_TIMEOUT', '1.0'))),
+    'recent_orders': (f'/gateway/orders?limit={DASHBOARD_RECENT_ORDERS}',
+                      float(os.getenv('GATEWAY_DASHBOARD_ORDERS_TIMEOUT', '1.5'))),
+    'stats': ('/gateway/orders/stats', float(os.getenv('GATEWAY_DASHBOARD_STATS_TIMEOUT', '2.0'))),
+    'history': ('/gateway/orders/history', float(os.getenv('GATEWAY_DASHBOARD_HISTORY_TIMEOUT', '1.5')))
+}
+
+@app.route('/gateway/dashboard', methods=['GET'])
 @gateway_auth_required
-def route_orders_history(current_user):
-    """Route les requêtes d'historique vers le Orders Service."""
-    return forward_request(ORDERS_SERVICE_URL, '/orders/history', method='GET', user=current_user)
+def route_dashboard(current_user):
+    """Agrège profil, commandes récentes, stats et historique en parallèle, avec un timeout par partie.
+
+    Une partie lente ou en erreur n'empêche pas la réponse : elle vaut None et
+    son erreur est décrite dans 'errors'.
+    """
+    started = time.monotonic()
+    futures = {
+        name: batch_executor.submit(contextvars.copy_context().run, dispatch_batch_item,
+                                    {'method': 'GET', 'path': path}, current_user, timeout)
+        for name, (path, timeout) in DASHBOARD_PARTS.items()
+    }
+
+    result = {}
+    errors = {}
+    for name, future in futures.items():
+        timeout = DASHBOARD_PARTS[name][1]
+        try:
+            part = future.result(timeout=max(0.0, started + timeout - time.monotonic()))
+        except TimeoutError:
+            result[name] = None
+            errors[name] = {'status': 504, 'message': f'Pas de réponse en {timeout}s'}
+            continue
+        if part['status'] == 200:
+            result[name] = part['body']
+        else:
+            result[name] = None
+            body = part['body']
+            message = body.get('message') if isinstance(body, dict) else None
+            errors[name] = {'status': part['status'], 'message': message or f"Erreur {part['status']}"}
 
-@app.route('/gateway/orders/stats', methods=['GET'])
-@gateway_auth_required
-def route_orders_stats(current_user):
-    """Route les requêtes de statistiques vers le Orders Service."""
-    return forward_request(ORDERS_SERVICE_URL, '/orders/stats', method='GET', user=current_user)
+    result['errors'] = errors
+    result['partial'] = bool(errors)
+    status = 503 if len(errors) == len(DASHBOARD_PARTS) else 200
+    return jsonify(result), status
 
 # ========== ROUTES DE SANTÉ ==========
 
+@app.route('/gateway/stats', methods=['GET'])
+def gateway_stats():
+    """Expose les compteurs internes du Gateway (caches, pools de connexions, ...)."""
+    return jsonify({
+        'token_verify_mode': TOKEN_VERIFY_MODE,
+        'proxy_mode': PROXY_MODE,
+        'token_cache': token_cache.stats(),
+        'user_versions': user_version_table.stats(),
+        'upstreams': {upstream.name: upstream.stats() for upstream in UPSTREAMS},
+        'get_coalescing': dict(get_coalescer.stats(), enabled=COALESCE_GETS),
+        'response_cache': dict(response_cache.stats(), ttl=RESPONSE_CACHE_TTL),
+        'rate_limits': rate_limiter.stats(),
+        'routes': route_table.stats(),
+        'compression': {
+            'enabled': COMPRESSION_ENABLED,
+            'codecs': COMPRESSION_CODECS,
+            'min_size': COMPRESSION_MIN_SIZE,
+            'level': COMPRESSION_LEVEL,
+            'compressed_responses': dict(compression_counts)
+        }
+    }), 200
+
 @app.route('/health', methods=['GET'])
 def gateway_health():
-    """Vérifie la santé du Gateway."""
-    # Retourne simplement que le Gateway est en vie
-    # La vérification des autres services peut être faite séparément
+    """Vérifie la santé du Gateway et renvoie l'état des services vu par le health check en arrière-plan."""
+    # Aucun appel réseau ici : l'état est lu tel que publié par le dernier health check
+    details = {upstream.name: upstream.health for upstream in UPSTREAMS}
+    services = {name: health['status'] for name, health in details.items()}
     return jsonify({
-        'status': 'healthy',
+        'status': 'degraded' if 'unhealthy' in services.values() else 'healthy',
         'service': 'api_gateway',
-        'port': 5004
+        'port': 5004,
+        'services': services,
+        'details': details
     }), 200
 
 @app.route('/', methods=['GET'])
@@ -226,7 +864,10 @@ def index():
                 'history': 'GET /gateway/orders/history',
                 'stats': 'GET /gateway/orders/stats'
             },
-            'health': 'GET /health'
+            'batch': 'POST /gateway/batch',
+            'dashboard': 'GET /gateway/dashboard',
+            'health': 'GET /health',
+            'stats': 'GET /gateway/stats'
         }
     }), 200
 
@@ -235,5 +876,10 @@ if __name__ == '__main__':
     print(f"   Auth Service: {AUTH_SERVICE_URL}")
     print(f"   User Service: {USER_SERVICE_URL}")
     print(f"   Orders Service: {ORDERS_SERVICE_URL}")
-    app.run(debug=True, port=5004, host='0.0.0.0')
+    print(f"   Vérification des tokens: {TOKEN_VERIFY_MODE}")
+    print(f"   Mode de proxy: {PROXY_MODE}")
+    if TOKEN_VERIFY_MODE == 'local' and not INTERNAL_API_TOKEN:
+        print("   INTERNAL_API_TOKEN absent : versions des tokens vérifiées par /auth/verify")
+    # Appels bloquants vers les backends : un thread par requête en cours
+    serve(app, port=5004, threads=64)
 
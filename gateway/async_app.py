@@ -0,0 +1,590 @@
+"""
+API Gateway asynchrone - même table de routes /gateway/* que app.py (routes.json), sur une boucle asyncio
+Port: 5004
+Responsabilités:
+- Servir les routes du Gateway sans bloquer un thread par requête en cours
+- Valider les tokens JWT avec la même sémantique (vérification locale, Auth Service en secours, cache)
+- Relayer les requêtes en streaming via un client HTTP asynchrone poolé par upstream
+- Mêmes protections que le moteur Flask, sur le même état : limites de débit par route,
+  circuit breaker, limite adaptative de concurrence, réplicas (moins chargé, éjection)
+- Mêmes services annexes : /gateway/batch et /gateway/dashboard (sous-requêtes concurrentes
+  sur la boucle), compression des réponses, /metrics, traçage (span serveur par requête,
+  span client et traceparent par appel au backend)
+- Propres au moteur Flask : cache de réponses, regroupement des GET, couvertures et relances
+
+Lancement : python async_app.py
+"""
+
+from aiohttp import web, ClientSession, TCPConnector, ClientTimeout, ClientError, ClientConnectionError
+from werkzeug.exceptions import NotFound, MethodNotAllowed
+import asyncio
+import hashlib
+import math
+import json
+import time
+import os
+
+import app as sync_gateway
+from routes import is_allowed
+from ratelimit import client_address
+from upstreams import UpstreamRejected, UPSTREAM_RESPONSES
+from compression import negotiate, compress_bytes, is_compressible, Compressor
+from shared.metrics import REGISTRY, CONTENT_TYPE
+from shared.tracing import server_span, client_span
+
+# Connexions simultanées max par upstream (le pool synchrone est dimensionné en threads, pas ici)
+ASYNC_POOL_SIZE = int(os.getenv('GATEWAY_ASYNC_POOL_SIZE', '1000'))
+KEEP_ALIVE_TIMEOUT = float(os.getenv('GATEWAY_ASYNC_KEEP_ALIVE_TIMEOUT', '30'))
+
+class AsyncUpstream:
+    """Service backend joint via une ClientSession aiohttp poolée.
+
+    Partage avec l'Upstream synchrone son circuit breaker, sa limite adaptative de concurrence
+    et ses réplicas (choix du moins chargé, éjection, health checks) : les deux moteurs
+    protègent le backend de la même façon.
+    """
+
+    def __init__(self, upstream, pool_size=ASYNC_POOL_SIZE):
+        self.upstream = upstream
+        self.name = upstream.name
+        self.pool_size = pool_size
+        self.connect_timeout = upstream.connect_timeout
+        self.read_timeout = upstream.read_timeout
+        self.keep_alive = upstream.keep_alive
+        self.session = None
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests_total = 0
+        self.errors = 0
+
+    @property
+    def base_url(self):
+        return self.upstream.base_url
+
+    async def start(self):
+        connector = TCPConnector(
+            limit=self.pool_size,
+            keepalive_timeout=KEEP_ALIVE_TIMEOUT if self.keep_alive else None,
+            force_close=not self.keep_alive
+        )
+        timeout = ClientTimeout(total=None, connect=self.connect_timeout, sock_read=self.read_timeout)
+        # auto_decompress=False : les corps compressés sont relayés tels quels
+        self.session = ClientSession(connector=connector, timeout=timeout, auto_decompress=False)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+
+    def timeout(self, read_timeout=None):
+        """ClientTimeout d'une requête : read de la route si elle en fixe un, sinon celui de l'upstream."""
+        return ClientTimeout(total=None, connect=self.connect_timeout, sock_read=read_timeout or self.read_timeout)
+
+    async def request(self, method, path, headers=None, route_timeout=None, **kwargs):
+        """Envoie une requête au réplica le moins chargé et retourne la ClientResponse
+        (corps non lu, à libérer par l'appelant). `route_timeout` : voir Upstream.latency_target.
+
+        Lève UpstreamRejected sans contacter le backend si le circuit est ouvert
+        ou si la limite adaptative de concurrence est atteinte.
+        """
+        upstream = self.upstream
+        if not upstream.limiter.try_acquire():
+            UPSTREAM_RESPONSES.inc(self.name, 'rejected')
+            raise UpstreamRejected(f'Service {self.name} surchargé, réessayez plus tard', retry_after=1.0)
+        if not upstream.breaker.allow():
+            upstream.limiter.cancel()
+            UPSTREAM_RESPONSES.inc(self.name, 'rejected')
+            raise UpstreamRejected(f'Service {self.name} indisponible (circuit ouvert)',
+                                   retry_after=upstream.breaker.retry_after())
+        try:
+            replica = upstream.acquire_replica()
+        except UpstreamRejected:
+            upstream.breaker.cancel()
+            upstream.limiter.cancel()
+            raise
+
+        headers = dict(headers or {})
+        if replica.host:
+            headers['Host'] = replica.host
+        self.in_flight += 1
+        self.requests_total += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        start = time.perf_counter()
+        try:
+            # Span client jusqu'aux en-têtes ; son traceparent remplace celui reçu du client
+            with client_span(f'{method} {path}', headers,
+                             tags={'http.method': method, 'peer.service': self.name}) as span:
+                response = await self.session.request(method, f'{replica.url}{path}', headers=headers, **kwargs)
+                span.tags['http.status_code'] = response.status
+        except (ClientError, asyncio.TimeoutError):
+            elapsed = time.perf_counter() - start
+            self.errors += 1
+            UPSTREAM_RESPONSES.inc(self.name, 'error')
+            upstream.release_replica(replica, elapsed, failed=True)
+            upstream.breaker.record_failure()
+            upstream.limiter.release(elapsed, dropped=True)
+            raise
+        except BaseException:
+            # Annulation (client parti) ou erreur hors réseau : places rendues sans verdict sur le backend
+            upstream.release_replica(replica, time.perf_counter() - start, failed=False)
+            upstream.breaker.cancel()
+            upstream.limiter.cancel()
+            raise
+        finally:
+            self.in_flight -= 1
+
+        # Latence jusqu'aux en-têtes, comme la phase "wait" du moteur synchrone
+        elapsed = time.perf_counter() - start
+        upstream.latency.record(elapsed)
+        UPSTREAM_RESPONSES.inc(self.name, str(response.status))
+        failed = response.status >= 500
+        upstream.release_replica(replica, elapsed, failed)
+        if failed:
+            upstream.breaker.record_failure()
+        else:
+            upstream.breaker.record_success()
+        upstream.limiter.release(elapsed, latency_target=upstream.latency_target(route_timeout))
+        return response
+
+    def stats(self):
+        return {
+            'url': self.base_url,
+            'pool_size': self.pool_size,
+            'in_flight': self.in_flight,
+            'peak_in_flight': self.peak_in_flight,
+            'requests': self.requests_total,
+            'errors': self.errors,
+            'breaker': self.upstream.breaker.stats(),
+            'replicas': len(self.upstream.replicas)
+        }
+
+AUTH_SERVICE = AsyncUpstream(sync_gateway.AUTH_SERVICE)
+USER_SERVICE = AsyncUpstream(sync_gateway.USER_SERVICE)
+ORDERS_SERVICE = AsyncUpstream(sync_gateway.ORDERS_SERVICE)
+UPSTREAMS = [AUTH_SERVICE, USER_SERVICE, ORDERS_SERVICE]
+
+UPSTREAMS_BY_NAME = {upstream.name: upstream for upstream in UPSTREAMS}
+
+def json_error(message, status):
+    return web.json_response({'message': message}, status=status)
+
+# ========== AUTHENTIFICATION ==========
+
+async def verify_token_with_auth_service(token):
+    """Vérifie un token via l'Auth Service (même cache, y compris négatif, que le Gateway synchrone)."""
+    cache_key = hashlib.sha256(token.encode('utf-8')).digest()
+    cached = sync_gateway.token_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    try:
+        response = await AUTH_SERVICE.request('POST', '/auth/verify', json={'token': token})
+        async with response:
+            if response.status != 200:
+                return False, None
+            data = await response.json()
+    except (ClientError, asyncio.TimeoutError, ValueError, UpstreamRejected) as e:
+        print(f"Erreur lors de la vérification du token: {e}")
+        return False, None
+
+    is_valid, user = data.get('valid', False), data.get('user')
+    if is_valid and user:
+        sync_gateway.token_cache.set(cache_key, (True, user), sync_gateway.token_cache_ttl(token, data.get('payload')))
+    else:
+        sync_gateway.token_cache.set(cache_key, (False, None), sync_gateway.TOKEN_CACHE_NEGATIVE_TTL)
+    return is_valid, user
+
+async def verify_token(token):
+    """Vérifie un token JWT selon TOKEN_VERIFY_MODE (local avec secours Auth Service, ou remote)."""
+    if sync_gateway.TOKEN_VERIFY_MODE == 'local':
+        decided, user = sync_gateway.verify_token_locally(token)
+        if decided:
+            return user is not None, user
+    return await verify_token_with_auth_service(token)
+
+async def authenticate(request):
+    """Même logique que gateway_auth_required : retourne (user, None) ou (None, réponse 401)."""
+    token = None
+    auth_header = request.headers.get('Authorization')
+    if auth_header:
+        parts = auth_header.split()
+        if len(parts) == 2 and parts[0].lower() == 'bearer':
+            token = parts[1]
+        else:
+            return None, json_error('Format de token invalide. Utiliser "Bearer <token>"', 401)
+
+    if not token:
+        return None, json_error('Token manquant', 401)
+
+    is_valid, user = await verify_token(token)
+    if not is_valid or not user:
+        return None, json_error('Token invalide ou expiré', 401)
+    return user, None
+
+def rate_limit_exceeded(method, rule, identity):
+    """Réponse 429 si `identity` a épuisé la limite de la route (mêmes seaux que le moteur Flask), None sinon."""
+    wait = sync_gateway.rate_limiter.check(f'{method} {rule}', identity)
+    if not wait:
+        return None
+    response = json_error('Trop de requêtes, réessayez plus tard', 429)
+    response.headers['Retry-After'] = str(max(1, math.ceil(wait)))
+    return response
+
+# ========== COMPRESSION ==========
+
+def response_codec(request, response, mimetype, length):
+    """Codec de compression de la réponse (mêmes règles que le moteur Flask), ou None.
+
+    Quand un codec est retenu, les en-têtes sont mis à jour (Content-Encoding, ETag faible,
+    plus de Content-Length) : à l'appelant de compresser le corps.
+    """
+    if (not sync_gateway.COMPRESSION_ENABLED or request.method == 'HEAD'
+            or response.status < 200 or response.status in (204, 304)
+            or 'Content-Encoding' in response.headers or not is_compressible(mimetype)):
+        return None
+    response.headers.add('Vary', 'Accept-Encoding')
+    codec = negotiate(request.headers.get('Accept-Encoding'), sync_gateway.COMPRESSION_CODECS)
+    if codec is None or (length is not None and length < sync_gateway.COMPRESSION_MIN_SIZE):
+        return None
+    response.headers['Content-Encoding'] = codec
+    response.headers.pop('Content-Length', None)
+    etag = response.headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        response.headers['ETag'] = f'W/{etag}'
+    counts = sync_gateway.compression_counts
+    counts[codec] = counts.get(codec, 0) + 1
+    return codec
+
+# ========== PROXY ==========
+
+async def forward_request(request, upstream, path, user=None, read_timeout=None, route_timeout=None):
+    """Relaie la requête en streaming vers le backend et renvoie sa réponse octet par octet."""
+    headers = {}
+    if user:
+        headers['X-User-Id'] = str(user['id'])
+        headers['X-Username'] = user['username']
+        headers['X-User-Role'] = user.get('role', 'user')
+    for key, value in request.headers.items():
+        if key.lower() not in sync_gateway.EXCLUDED_REQUEST_HEADERS:
+            headers[key] = value
+    headers[sync_gateway.DEADLINE_HEADER] = sync_gateway.budget_header(read_timeout or upstream.read_timeout)
+
+    data = None
+    if request.body_exists:
+        data = request.content
+        if request.content_length is not None:
+            headers['Content-Length'] = str(request.content_length)
+
+    if request.query_string:
+        path = f'{path}?{request.query_string}'
+
+    try:
+        upstream_response = await upstream.request(request.method, path, headers=headers, data=data,
+                                                   timeout=upstream.timeout(read_timeout),
+                                                   route_timeout=route_timeout)
+    except UpstreamRejected as e:
+        # Rejet immédiat : circuit ouvert ou limite de concurrence atteinte
+        response = json_error(str(e), 503)
+        response.headers['Retry-After'] = str(max(1, int(round(e.retry_after))))
+        return response
+    except asyncio.TimeoutError:
+        return json_error('Service temporairement indisponible (timeout)', 503)
+    except ClientConnectionError:
+        return json_error('Service indisponible (connexion impossible)', 503)
+    except ClientError as e:
+        return json_error(f'Erreur lors de la communication avec le service: {str(e)}', 500)
+
+    async with upstream_response:
+        response = web.StreamResponse(status=upstream_response.status, reason=upstream_response.reason)
+        for key, value in upstream_response.headers.items():
+            if key.lower() not in sync_gateway.HOP_BY_HOP_HEADERS:
+                response.headers.add(key, value)
+        codec = response_codec(request, response, upstream_response.content_type, upstream_response.content_length)
+        compressor = Compressor(codec, sync_gateway.COMPRESSION_LEVEL) if codec else None
+        await response.prepare(request)
+        try:
+            async for chunk in upstream_response.content.iter_chunked(sync_gateway.STREAM_CHUNK_SIZE):
+                if compressor is not None:
+                    chunk = compressor.compress(chunk)
+                    if not chunk:
+                        continue
+                await response.write(chunk)
+            if compressor is not None:
+                await response.write(compressor.flush())
+            await response.write_eof()
+        except (ClientError, ConnectionResetError, asyncio.TimeoutError):
+            # En-têtes déjà envoyés : plus de réponse d'erreur possible. Client parti, ou backend
+            # coupé en cours de lecture : la connexion est fermée sans fin de corps, pour que
+            # le client voie une réponse tronquée plutôt qu'un corps complet
+            response.force_close()
+            if request.transport is not None:
+                request.transport.close()
+    return response
+
+async def dispatch_route(request):
+    """Relaie une requête /gateway/* selon la table de routes partagée avec le moteur Flask
+    (rechargée de la même façon) ; cache, regroupement et relances restent propres au moteur Flask."""
+    try:
+        route, rule, args = sync_gateway.route_table.match(request.path, request.method)
+    except NotFound:
+        return json_error('Route inconnue', 404)
+    except MethodNotAllowed as e:
+        response = json_error(f'Méthode {request.method} non autorisée', 405)
+        response.headers['Allow'] = ', '.join(sorted(e.valid_methods or ()))
+        return response
+    request['gateway.route'] = rule.rule
+
+    user = None
+    if route.auth:
+        user, error = await authenticate(request)
+        if error is not None:
+            return error
+        limited = rate_limit_exceeded(request.method, rule.rule, f"user:{user['id']}")
+        if limited is not None:
+            return limited
+        if not is_allowed(route, request.method, user, args):
+            return json_error('Accès refusé', 403)
+    else:
+        # Pas encore d'utilisateur authentifié : limite par IP cliente
+        ip = client_address(request.remote, request.headers.get('X-Forwarded-For'), sync_gateway.TRUSTED_PROXIES)
+        limited = rate_limit_exceeded(request.method, rule.rule, f'ip:{ip}')
+        if limited is not None:
+            return limited
+    target = route.target.format_map(dict(args, user=user))
+    return await forward_request(request, UPSTREAMS_BY_NAME[route.upstream], target, user=user,
+                                 read_timeout=route.timeout, route_timeout=route.timeout)
+
+# ========== LOTS ET TABLEAU DE BORD (avec authentification) ==========
+
+async def dispatch_internal(method, path, user, body=None, read_timeout=None):
+    """Sous-requête d'un lot ou du tableau de bord pour un utilisateur déjà authentifié :
+    même table de routes, même limite par utilisateur et même politique d'accès que dispatch_route.
+    Corps lu en entier ; retourne {status, body}."""
+    path, _, query = path.partition('?')
+    try:
+        route, rule, args = sync_gateway.route_table.match(path, method)
+    except NotFound:
+        return {'status': 404, 'body': {'message': 'Route inconnue'}}
+    except MethodNotAllowed:
+        return {'status': 405, 'body': {'message': f'Méthode {method} non autorisée'}}
+    wait = sync_gateway.rate_limiter.check(f'{method} {rule.rule}', f"user:{user['id']}")
+    if wait:
+        return {'status': 429, 'body': {'message': 'Trop de requêtes, réessayez plus tard'}}
+    if not is_allowed(route, method, user, args):
+        return {'status': 403, 'body': {'message': 'Accès refusé'}}
+
+    upstream = UPSTREAMS_BY_NAME[route.upstream]
+    target = route.target.format_map(dict(args, user=user)) + (f'?{query}' if query else '')
+    read_timeout = read_timeout or route.timeout
+    headers = {
+        'X-User-Id': str(user['id']),
+        'X-Username': user['username'],
+        'X-User-Role': user.get('role', 'user'),
+        sync_gateway.DEADLINE_HEADER: sync_gateway.budget_header(read_timeout or upstream.read_timeout)
+    }
+    try:
+        response = await upstream.request(method, target, headers=headers, json=body,
+                                          timeout=upstream.timeout(read_timeout), route_timeout=route.timeout)
+        async with response:
+            data = await response.read()
+    except UpstreamRejected as e:
+        return {'status': 503, 'body': {'message': str(e)}}
+    except asyncio.TimeoutError:
+        return {'status': 503, 'body': {'message': 'Service temporairement indisponible (timeout)'}}
+    except ClientConnectionError:
+        return {'status': 503, 'body': {'message': 'Service indisponible (connexion impossible)'}}
+    except ClientError as e:
+        return {'status': 500, 'body': {'message': f'Erreur lors de la communication avec le service: {str(e)}'}}
+
+    if response.content_type == 'application/json':
+        try:
+            return {'status': response.status, 'body': json.loads(data) if data else None}
+        except ValueError:
+            pass
+    return {'status': response.status, 'body': data.decode('utf-8', errors='replace')}
+
+async def authenticate_and_limit(request, rule):
+    """Authentification puis limite par utilisateur de `rule` : retourne (user, None) ou (None, réponse)."""
+    user, error = await authenticate(request)
+    if error is not None:
+        return None, error
+    limited = rate_limit_exceeded(request.method, rule, f"user:{user['id']}")
+    if limited is not None:
+        return None, limited
+    return user, None
+
+async def route_batch(request):
+    """Exécute plusieurs sous-requêtes {method, path, body} en parallèle (token vérifié une seule fois)."""
+    request['gateway.route'] = '/gateway/batch'
+    user, error = await authenticate_and_limit(request, '/gateway/batch')
+    if error is not None:
+        return error
+    try:
+        payload = await request.json()
+    except ValueError:
+        payload = None
+    items = payload.get('requests') if isinstance(payload, dict) else payload
+    if not isinstance(items, list) or not items or not all(isinstance(item, dict) for item in items):
+        return json_error('Format invalide (liste de {method, path, body} attendue)', 400)
+    if len(items) > sync_gateway.BATCH_MAX_ITEMS:
+        return json_error(f'Trop de sous-requêtes (maximum {sync_gateway.BATCH_MAX_ITEMS})', 400)
+
+    # Au plus BATCH_CONCURRENCY sous-requêtes de ce lot en cours à la fois
+    slots = asyncio.Semaphore(sync_gateway.BATCH_CONCURRENCY)
+
+    async def run(item):
+        method, path, error = sync_gateway.batch_item_request(item)
+        if error is not None:
+            result = {'status': 400, 'body': {'message': error}}
+        else:
+            async with slots:
+                result = await dispatch_internal(method, path, user,
+                                                 body=item.get('body') if method in ('POST', 'PUT') else None)
+        if 'id' in item:
+            result['id'] = item['id']
+        return result
+
+    responses = await asyncio.gather(*(run(item) for item in items))
+    return web.json_response({'responses': responses, 'total': len(responses)})
+
+async def route_dashboard(request):
+    """Agrège profil, commandes récentes, stats et historique en parallèle, avec un timeout par partie
+    (mêmes parties que le moteur Flask) ; une partie lente ou en erreur vaut None."""
+    request['gateway.route'] = '/gateway/dashboard'
+    user, error = await authenticate_and_limit(request, '/gateway/dashboard')
+    if error is not None:
+        return error
+
+    async def part(path, timeout):
+        try:
+            return await asyncio.wait_for(dispatch_internal('GET', path, user, read_timeout=timeout), timeout)
+        except asyncio.TimeoutError:
+            return {'status': 504, 'body': {'message': f'Pas de réponse en {timeout}s'}}
+
+    parts = sync_gateway.DASHBOARD_PARTS
+    results = await asyncio.gather(*(part(path, timeout) for path, timeout in parts.values()))
+    result = {}
+    errors = {}
+    for name, part_result in zip(parts, results):
+        if part_result['status'] == 200:
+            result[name] = part_result['body']
+            continue
+        result[name] = None
+        body = part_result['body']
+        message = body.get('message') if isinstance(body, dict) else None
+        errors[name] = {'status': part_result['status'], 'message': message or f"Erreur {part_result['status']}"}
+
+    result['errors'] = errors
+    result['partial'] = bool(errors)
+    return web.json_response(result, status=503 if len(errors) == len(parts) else 200)
+
+# ========== ROUTES DE SANTÉ ==========
+
+async def gateway_health(request):
+    # Même état que le moteur Flask : publié par les threads de health check de sync_gateway
+    details = {upstream.name: upstream.health for upstream in sync_gateway.UPSTREAMS}
+    services = {name: health['status'] for name, health in details.items()}
+    return web.json_response({
+        'status': 'degraded' if 'unhealthy' in services.values() else 'healthy',
+        'service': 'api_gateway',
+        'engine': 'async',
+        'port': 5004,
+        'services': services,
+        'details': details
+    })
+
+async def gateway_stats(request):
+    return web.json_response({
+        'engine': 'async',
+        'token_verify_mode': sync_gateway.TOKEN_VERIFY_MODE,
+        'token_cache': sync_gateway.token_cache.stats(),
+        'user_versions': sync_gateway.user_version_table.stats(),
+        'upstreams': {upstream.name: upstream.stats() for upstream in UPSTREAMS},
+        'routes': sync_gateway.route_table.stats(),
+        'compression': {
+            'enabled': sync_gateway.COMPRESSION_ENABLED,
+            'codecs': sync_gateway.COMPRESSION_CODECS,
+            'compressed_responses': dict(sync_gateway.compression_counts)
+        }
+    })
+
+async def metrics(request):
+    """Métriques du Gateway au format texte Prometheus (même registre que le moteur Flask)."""
+    return web.Response(body=REGISTRY.render().encode('utf-8'), headers={'Content-Type': CONTENT_TYPE})
+
+# ========== MÉTRIQUES, TRAÇAGE ET COMPRESSION DES RÉPONSES ==========
+
+HTTP_REQUESTS = REGISTRY.counter(
+    'http_requests_total', 'Requêtes HTTP traitées', ('service', 'route', 'method', 'status'))
+HTTP_DURATION = REGISTRY.histogram(
+    'http_request_duration_seconds', 'Durée de traitement des requêtes HTTP', ('service', 'route', 'method'))
+
+def route_label(request):
+    """Modèle de route de la requête (celui de la table de routes pour /gateway/*) pour borner les séries."""
+    route = request.get('gateway.route')
+    if route is not None:
+        return route
+    resource = request.match_info.route.resource
+    return resource.canonical if resource is not None else '<unmatched>'
+
+@web.middleware
+async def observe_request(request, handler):
+    """Span serveur rattaché au traceparent reçu, et compression des réponses construites en mémoire
+    (les réponses relayées en streaming sont compressées par forward_request)."""
+    request['metrics.start'] = time.perf_counter()
+    tags = {'http.method': request.method, 'http.path': request.path}
+    with server_span(request.path, request.headers.get('traceparent'), tags=tags) as span:
+        request['tracing.span'] = span
+        try:
+            response = await handler(request)
+        finally:
+            # Nom connu une fois la route résolue
+            span.name = f'{request.method} {route_label(request)}'
+        span.tags['http.status_code'] = response.status
+        if isinstance(response, web.Response) and not response.prepared and isinstance(response.body, bytes):
+            codec = response_codec(request, response, response.content_type, len(response.body))
+            if codec is not None:
+                response.body = compress_bytes(response.body, codec, sync_gateway.COMPRESSION_LEVEL)
+        return response
+
+async def record_response(request, response):
+    """À l'envoi des en-têtes : X-Trace-Id, statut du span et métriques (durée jusqu'aux en-têtes,
+    comme instrument_app)."""
+    span = request.get('tracing.span')
+    if span is not None:
+        span.tags['http.status_code'] = response.status
+        response.headers['X-Trace-Id'] = span.trace_id
+    start = request.get('metrics.start')
+    if start is not None:
+        route = route_label(request)
+        HTTP_DURATION.observe(time.perf_counter() - start, 'gateway', route, request.method)
+        HTTP_REQUESTS.inc('gateway', route, request.method, str(response.status))
+
+async def start_upstreams(app):
+    for upstream in UPSTREAMS:
+        await upstream.start()
+
+async def close_upstreams(app):
+    for upstream in UPSTREAMS:
+        await upstream.close()
+
+def create_app():
+    """Construit l'application aiohttp : routes de santé, puis toutes les routes /gateway/* de la table."""
+    app = web.Application(middlewares=[observe_request])
+    app.router.add_get('/health', gateway_health)
+    app.router.add_get('/metrics', metrics)
+    app.router.add_get('/gateway/stats', gateway_stats)
+    app.router.add_post('/gateway/batch', route_batch)
+    app.router.add_get('/gateway/dashboard', route_dashboard)
+    app.router.add_route('*', '/gateway/{tail:.*}', dispatch_route)
+    app.on_response_prepare.append(record_response)
+    app.on_startup.append(start_upstreams)
+    app.on_cleanup.append(close_upstreams)
+    return app
+
+if __name__ == '__main__':
+    print("Demarrage de l'API Gateway asynchrone sur le port 5004...")
+    print(f"   Auth Service: {AUTH_SERVICE.base_url}")
+    print(f"   User Service: {USER_SERVICE.base_url}")
+    print(f"   Orders Service: {ORDERS_SERVICE.base_url}")
+    print(f"   Vérification des tokens: {sync_gateway.TOKEN_VERIFY_MODE}")
+    web.run_app(create_app(), host='0.0.0.0', port=5004)
@@ -0,0 +1,125 @@
+"""
+Test de charge : montée en concurrence du Gateway synchrone (Flask) et asynchrone (aiohttp)
+- Backend factice qui ajoute une latence artificielle à chaque réponse
+- N clients simultanés sur GET /gateway/orders pour chaque moteur
+- Débit, latences et nombre maximal de threads du processus pendant le test
+
+Usage (depuis le dossier gateway/) :
+    python bench_async.py [--latency 0.2] [--concurrency 50,200,1000] [--rounds 3]
+"""
+
+from aiohttp import web, ClientSession, TCPConnector
+from authlib.jose import jwt
+import threading
+import argparse
+import asyncio
+import logging
+import time
+import os
+
+os.environ.setdefault('JWT_SECRET_KEY', 'bench-secret')
+
+import app as sync_gateway
+import async_app
+from bench_utils import serve_in_thread, percentile
+
+def start_loop_thread():
+    """Démarre une boucle asyncio dans un thread dédié."""
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return loop
+
+def serve_aiohttp(loop, app):
+    """Démarre une application aiohttp sur un port libre dans la boucle fournie."""
+    async def start():
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0, backlog=4096)
+        await site.start()
+        return runner.addresses[0][1]
+    port = asyncio.run_coroutine_threadsafe(start(), loop).result()
+    return f'http://127.0.0.1:{port}'
+
+def build_slow_backend(latency):
+    """Orders Service factice : répond après `latency` secondes."""
+    async def list_orders(request):
+        await asyncio.sleep(latency)
+        return web.json_response({'orders': [], 'total': 0})
+
+    backend = web.Application()
+    backend.router.add_get('/orders', list_orders)
+    return backend
+
+async def drive(url, headers, total, concurrency):
+    """Envoie `total` requêtes avec `concurrency` clients simultanés."""
+    latencies = []
+    errors = 0
+    remaining = iter(range(total))
+    peak_threads = threading.active_count()
+
+    async def worker(session):
+        nonlocal errors, peak_threads
+        for _ in remaining:
+            start = time.perf_counter()
+            try:
+                async with session.get(url, headers=headers) as response:
+                    await response.read()
+                    if response.status >= 400:
+                        errors += 1
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+            peak_threads = max(peak_threads, threading.active_count())
+
+    connector = TCPConnector(limit=0)
+    async with ClientSession(connector=connector) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+        duration = time.perf_counter() - started
+
+    return {
+        'rps': total / duration,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'errors': errors,
+        'peak_threads': peak_threads
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency', type=float, default=0.2, help='latence ajoutée par le backend (s)')
+    parser.add_argument('--concurrency', default='50,200,1000', help='niveaux de concurrence, séparés par des virgules')
+    parser.add_argument('--rounds', type=int, default=3, help='requêtes par client et par niveau')
+    args = parser.parse_args()
+    logging.getLogger('urllib3').setLevel(logging.ERROR)
+
+    backend_loop = start_loop_thread()
+    backend_url = serve_aiohttp(backend_loop, build_slow_backend(args.latency))
+
+    sync_gateway.ORDERS_SERVICE.base_url = backend_url
+    async_app.ORDERS_SERVICE.base_url = backend_url
+    sync_gateway.TOKEN_VERIFY_MODE = 'local'
+
+    _, sync_url = serve_in_thread(sync_gateway.app)
+    gateway_loop = start_loop_thread()
+    async_url = serve_aiohttp(gateway_loop, async_app.create_app())
+
+    token = jwt.encode({'alg': 'HS256'}, {
+        'username': 'bench', 'type': 'access', 'user_id': 1, 'role': 'user',
+        'exp': int(time.time()) + 3600
+    }, os.environ['JWT_SECRET_KEY']).decode('utf-8')
+    headers = {'Authorization': f'Bearer {token}'}
+
+    print(f"GET /gateway/orders - backend +{args.latency * 1000:.0f} ms, "
+          f"débit idéal = concurrence / latence\n")
+    print(f"{'moteur':<8} {'clients':>8} {'req/s':>9} {'idéal':>9} {'p50 ms':>9} {'p99 ms':>9} "
+          f"{'threads':>8} {'erreurs':>8}")
+    for level in (int(value) for value in args.concurrency.split(',')):
+        for engine, base_url in (('sync', sync_url), ('async', async_url)):
+            result = asyncio.run(drive(f'{base_url}/gateway/orders', headers, level * args.rounds, level))
+            print(f"{engine:<8} {level:>8} {result['rps']:>9.1f} {level / args.latency:>9.1f} "
+                  f"{result['p50_ms']:>9.1f} {result['p99_ms']:>9.1f} {result['peak_threads']:>8} "
+                  f"{result['errors']:>8}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Benchmark : compression des réponses du Gateway (gateway/compression.py)
+- Charges utiles représentatives : liste d'utilisateurs, liste de commandes, historique
+  de commandes (libellés longs en français)
+- Pour chaque codec disponible et chaque niveau : taille compressée, ratio, temps CPU
+  de compression par réponse, en bloc et en streaming (blocs de 8 Ko)
+
+Usage (depuis le dossier gateway/) :
+    python bench_compression.py [--iterations 200] [--levels 1,6,9]
+"""
+
+import argparse
+import random
+import json
+import time
+
+from compression import available_codecs, compress_bytes, compress_stream
+
+STATUSES = ('pending', 'confirmed', 'shipped', 'delivered', 'cancelled')
+ACTIONS = ('Commande créée', 'Statut mis à jour', 'Paiement accepté', 'Commande expédiée')
+
+def build_payloads(rng):
+    """Retourne {nom: corps JSON encodé}, proches des réponses réelles des services."""
+    users = [{'id': i, 'username': f'utilisateur{i}', 'email': f'utilisateur{i}@example.com',
+              'role': 'admin' if i % 50 == 0 else 'user', 'created_at': f'2024-0{1 + i % 9}-1{i % 10} 10:{i % 60:02d}:00'}
+             for i in range(1, 201)]
+    orders = [{'id': i, 'user_id': rng.randint(1, 200), 'product_name': f'Produit {rng.randint(1, 500)}',
+               'quantity': rng.randint(1, 5), 'total_price': round(rng.uniform(5, 500), 2),
+               'status': rng.choice(STATUSES), 'created_at': f'2024-05-{1 + i % 28:02d} 12:00:00'}
+              for i in range(1, 301)]
+    history = [{'id': i, 'order_id': 1 + i // 3, 'action': rng.choice(ACTIONS),
+                'details': f'{rng.choice(ACTIONS)} pour la commande {1 + i // 3} : quantité {rng.randint(1, 5)}, '
+                           f'montant {rng.uniform(5, 500):.2f} €, statut {rng.choice(STATUSES)}',
+                'timestamp': f'2024-05-{1 + i % 28:02d} 12:{i % 60:02d}:00'}
+               for i in range(1, 601)]
+    return {
+        'users': json.dumps({'users': users, 'total': len(users)}).encode('utf-8'),
+        'orders': json.dumps({'orders': orders, 'total': len(orders)}).encode('utf-8'),
+        'history': json.dumps({'history': history, 'total': len(history)}).encode('utf-8'),
+    }
+
+def chunks(data, size=8192):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+def bench(data, codec, level, iterations, streamed):
+    """Retourne (taille compressée, µs CPU par réponse)."""
+    parts = chunks(data)
+    start = time.process_time()
+    for _ in range(iterations):
+        if streamed:
+            body = b''.join(compress_stream(iter(parts), codec, level))
+        else:
+            body = compress_bytes(data, codec, level)
+    return len(body), (time.process_time() - start) / iterations * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--levels', default='1,6,9')
+    args = parser.parse_args()
+    levels = [int(level) for level in args.levels.split(',')]
+
+    print(f'Codecs disponibles : {", ".join(available_codecs())}')
+    for name, data in build_payloads(random.Random(42)).items():
+        print(f'\n{name} : {len(data)} octets non compressés')
+        print(f'  {"codec":<8}{"niveau":>7}{"octets":>9}{"ratio":>8}{"bloc µs":>10}{"stream µs":>11}')
+        for codec in available_codecs():
+            for level in levels:
+                size, block_us = bench(data, codec, level, args.iterations, streamed=False)
+                _, stream_us = bench(data, codec, level, args.iterations, streamed=True)
+                print(f'  {codec:<8}{level:>7}{size:>9}{len(data) / size:>8.1f}{block_us:>10.0f}{stream_us:>11.0f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Benchmark : coût de l'instrumentation partagée (shared/metrics.py)
+- Coût brut d'une observation d'histogramme et d'un incrément de compteur, seul et à 8 threads
+- Coût par requête Flask (client de test, sans réseau) avec et sans instrument_app
+- Débit HTTP d'une même application avec et sans instrument_app
+
+Usage (depuis le dossier gateway/) :
+    python bench_metrics.py [--iterations 200000] [--requests 20000] [--concurrency 16]
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, jsonify
+import argparse
+import time
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.metrics import Registry, instrument_app
+from bench_utils import serve_in_thread, stop_server, run_load, print_result
+
+def build_app(instrumented):
+    """Application minimale : une route paramétrée, réponse JSON courte."""
+    app = Flask('bench_metrics_instrumented' if instrumented else 'bench_metrics_plain')
+
+    @app.route('/orders/<int:order_id>', methods=['GET'])
+    def get_order(order_id):
+        return jsonify({'id': order_id, 'status': 'pending'}), 200
+
+    if instrumented:
+        instrument_app(app, 'bench', registry=Registry())
+    return app
+
+def bench_primitives(iterations, threads):
+    """Retourne le coût moyen (ns) de observe() + inc() avec `threads` threads concurrents."""
+    registry = Registry()
+    histogram = registry.histogram('bench_seconds', 'bench', ('route', 'method'))
+    counter = registry.counter('bench_total', 'bench', ('route', 'method', 'status'))
+    per_thread = iterations // threads
+
+    def work(_):
+        for i in range(per_thread):
+            histogram.observe(0.003, '/orders/<int:order_id>', 'GET')
+            counter.inc('/orders/<int:order_id>', 'GET', '200')
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(work, range(threads)))
+    return (time.perf_counter() - start) / (per_thread * threads) * 1e9
+
+def bench_test_client(requests_count, rounds=5):
+    """Retourne le temps moyen (µs) par requête via le client de test, sans puis avec instrumentation.
+
+    Les deux variantes sont alternées sur plusieurs tours et le meilleur tour est retenu,
+    pour que le bruit de la machine ne masque pas l'écart mesuré.
+    """
+    clients = {instrumented: build_app(instrumented).test_client() for instrumented in (False, True)}
+    best = {False: float('inf'), True: float('inf')}
+    for client in clients.values():
+        for i in range(500):
+            client.get(f'/orders/{i}')
+    per_round = max(1, requests_count // rounds)
+    for _ in range(rounds):
+        for instrumented, client in clients.items():
+            start = time.perf_counter()
+            for i in range(per_round):
+                client.get(f'/orders/{i}')
+            best[instrumented] = min(best[instrumented], (time.perf_counter() - start) / per_round * 1e6)
+    return best[False], best[True]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=200000)
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    args = parser.parse_args()
+
+    print('Primitives (observe + inc) :')
+    for threads in (1, 8):
+        print(f'  {threads} thread(s) : {bench_primitives(args.iterations, threads):7.0f} ns par requête')
+
+    plain, instrumented = bench_test_client(args.requests)
+    print('\nRequête Flask (client de test, sans réseau) :')
+    print(f'  sans métriques : {plain:7.1f} µs')
+    print(f'  avec métriques : {instrumented:7.1f} µs   (surcoût {instrumented - plain:+.1f} µs, '
+          f'{(instrumented - plain) / plain * 100:+.1f} %)')
+
+    print(f'\nHTTP ({args.requests // 4} requêtes, concurrence {args.concurrency}) :')
+    for instrumented in (False, True):
+        server, url = serve_in_thread(build_app(instrumented))
+        try:
+            result = run_load(f'{url}/orders/42', total=args.requests // 4, concurrency=args.concurrency)
+            print_result('avec métriques' if instrumented else 'sans métriques', result)
+        finally:
+            stop_server(server)
+
+if __name__ == '__main__':
+    main()
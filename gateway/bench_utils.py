@@ -0,0 +1,140 @@
+"""
+Outils communs aux benchmarks du Gateway
+- Démarrage d'applications WSGI dans un thread (ports éphémères)
+- Chargement des services voisins (auth_service, ...) sans conflit de nom 'app'
+- Génération de charge concurrente et calcul du débit / des latences
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.security import generate_password_hash
+from werkzeug.serving import make_server
+import importlib.util
+import logging
+import threading
+import sqlite3
+import time
+import os
+import requests
+
+try:
+    import waitress.server as waitress_server
+except ImportError:  # serveur werkzeug à la place
+    waitress_server = None
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def serve_in_thread(wsgi_app, threaded=True):
+    """Démarre une application WSGI sur un port libre et retourne (serveur, url).
+
+    waitress (keep-alive) comme les services lancés par app.py s'il est installé,
+    serveur werkzeug sinon.
+    """
+    if waitress_server is not None:
+        logging.getLogger('waitress').setLevel(logging.ERROR)
+        server = waitress_server.create_server(wsgi_app, host='127.0.0.1', port=0, threads=16 if threaded else 1)
+        threading.Thread(target=server.run, daemon=True).start()
+        return server, f'http://127.0.0.1:{server.effective_port}'
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, wsgi_app, threaded=threaded)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+def stop_server(server):
+    """Arrête un serveur démarré par serve_in_thread."""
+    if waitress_server is not None:
+        server.close()
+    else:
+        server.shutdown()
+
+def load_service_module(module_name, relative_path):
+    """Importe le app.py d'un autre service sous un nom de module distinct."""
+    path = os.path.join(ROOT_DIR, relative_path)
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def create_users_db(path, users=(('bench', 'bench', 'bench@esme.fr', 'user'),), password_method='pbkdf2:sha256:1000'):
+    """Crée une base users.db minimale (users + refresh_tokens) pour les benchmarks."""
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            email TEXT,
+            role TEXT DEFAULT 'user',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            token_version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS refresh_tokens (
+            jti TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            family_id TEXT,
+            created_at TEXT NOT NULL,
+            expires_at TEXT NOT NULL,
+            revoked INTEGER DEFAULT 0,
+            revoked_at TEXT,
+            replaced_by TEXT,
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        )
+    ''')
+    for username, password, email, role in users:
+        cursor.execute('INSERT OR IGNORE INTO users (username, password, email, role) VALUES (?, ?, ?, ?)',
+                       (username, generate_password_hash(password, method=password_method), email, role))
+    conn.commit()
+    conn.close()
+
+def percentile(values, pct):
+    """Percentile simple (valeurs triées, sans interpolation)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+def run_load(url, headers=None, total=2000, concurrency=16, method='GET', json_body=None):
+    """Envoie `total` requêtes avec `concurrency` clients et retourne débit et latences."""
+    local = threading.local()
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def one_call(_):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            response = session.request(method, url, headers=headers, json=json_body, timeout=30)
+            ok = response.status_code < 400
+        except requests.exceptions.RequestException:
+            ok = False
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            if not ok:
+                errors[0] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one_call, range(total)))
+    duration = time.perf_counter() - started
+
+    return {
+        'requests': total,
+        'concurrency': concurrency,
+        'rps': total / duration if duration else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'errors': errors[0]
+    }
+
+def print_result(label, result):
+    """Affiche une ligne de résultat de benchmark."""
+    print(f"{label:<28} {result['rps']:>9.1f} req/s   p50 {result['p50_ms']:>7.2f} ms   "
+          f"p99 {result['p99_ms']:>7.2f} ms   erreurs {result['errors']}")
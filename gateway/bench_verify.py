@@ -0,0 +1,75 @@
+"""
+Benchmark : débit de GET /gateway/orders selon le mode de vérification des tokens
+- 'remote' : chaque requête appelle /auth/verify (HTTP + lecture SQLite)
+- 'remote + cache' : idem, réponses de /auth/verify mises en cache
+- 'local'  : signature, exp et type vérifiés dans le Gateway
+
+Usage (depuis le dossier gateway/) :
+    python bench_verify.py [--requests 2000] [--concurrency 16]
+"""
+
+from flask import Flask, jsonify
+import argparse
+import tempfile
+import os
+
+os.environ.setdefault('JWT_SECRET_KEY', 'bench-secret')
+
+import app as gateway
+from bench_utils import serve_in_thread, load_service_module, create_users_db, run_load, print_result
+
+def build_orders_stub():
+    """Orders Service factice : renvoie une liste de commandes fixe."""
+    stub = Flask('orders_stub')
+
+    @stub.route('/orders', methods=['GET'])
+    def list_orders():
+        return jsonify({'orders': [], 'total': 0}), 200
+
+    return stub
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix='bench_verify_')
+    db_path = os.path.join(tmp_dir, 'users.db')
+    create_users_db(db_path)
+
+    # Vrai Auth Service sur une base temporaire, même clé que le Gateway
+    auth = load_service_module('auth_app', 'auth_service/app.py')
+    auth.DATABASE_PATH = db_path
+    auth.user_versions = auth.UserVersions(db_path)
+    auth.app.config['SECRET_KEY'] = os.environ['JWT_SECRET_KEY']
+    _, auth_url = serve_in_thread(auth.app)
+    _, orders_url = serve_in_thread(build_orders_stub())
+
+    gateway.AUTH_SERVICE.base_url = auth_url
+    gateway.ORDERS_SERVICE.base_url = orders_url
+    gateway.JWT_SECRET_KEY = os.environ['JWT_SECRET_KEY']
+    _, gateway_url = serve_in_thread(gateway.app)
+
+    tokens = auth.create_token_pair(auth.fetch_user('bench'))
+    headers = {'Authorization': f"Bearer {tokens['access_token']}"}
+
+    print(f"GET /gateway/orders - {args.requests} requêtes, {args.concurrency} clients\n")
+    results = {}
+    default_ttl = gateway.TOKEN_CACHE_TTL
+    for label, mode, cache_ttl in (('remote', 'remote', 0), ('remote + cache', 'remote', default_ttl),
+                                   ('local', 'local', 0)):
+        gateway.TOKEN_VERIFY_MODE = mode
+        gateway.TOKEN_CACHE_TTL = cache_ttl
+        gateway.token_cache.clear()
+        run_load(f'{gateway_url}/gateway/orders', headers=headers, total=min(200, args.requests),
+                 concurrency=args.concurrency)  # échauffement
+        results[label] = run_load(f'{gateway_url}/gateway/orders', headers=headers,
+                                  total=args.requests, concurrency=args.concurrency)
+        print_result(f'mode {label}', results[label])
+
+    if results['remote']['rps']:
+        print(f"\nGain local / remote : x{results['local']['rps'] / results['remote']['rps']:.2f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""
+Cache mémoire du Gateway
+- LRU borné à la fois en nombre d'entrées et en octets estimés
+- Expiration individuelle de chaque entrée (TTL)
+- Invalidation groupée par étiquettes (tags)
+- Compteurs hits / misses / évictions / expirations / invalidations
+"""
+
+from collections import OrderedDict
+import threading
+import time
+import sys
+
+def approximate_size(value):
+    """Estime la taille mémoire d'une valeur (dict, list, tuple, str, bytes, scalaires)."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for key, item in value.items():
+            size += approximate_size(key) + approximate_size(item)
+    elif isinstance(value, (list, tuple, set)):
+        for item in value:
+            size += approximate_size(item)
+    return size
+
+class TTLCache:
+    """Cache LRU thread-safe avec TTL par entrée et plafond mémoire."""
+
+    # Surcoût approximatif d'une entrée de l'OrderedDict (noeud + tuple interne)
+    ENTRY_OVERHEAD = 200
+
+    def __init__(self, max_entries=10000, max_bytes=16 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()  # clé -> (valeur, expire_a, taille, tags)
+        self._tags = {}  # tag -> ensemble de clés
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def _unlink(self, key, entry):
+        """Retire une entrée déjà sortie de _data de la comptabilité mémoire et des tags."""
+        self.current_bytes -= entry[2]
+        for tag in entry[3]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def get(self, key, default=None):
+        """Retourne la valeur associée à la clé si elle existe et n'a pas expiré."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at = entry[0], entry[1]
+            if expires_at <= now:
+                del self._data[key]
+                self._unlink(key, entry)
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl, size=None, tags=()):
+        """Ajoute ou remplace une entrée valable `ttl` secondes, rattachée aux tags fournis."""
+        if ttl <= 0:
+            return
+        if size is None:
+            size = approximate_size(key) + approximate_size(value)
+        size += self.ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return
+
+        tags = tuple(tags)
+        expires_at = time.monotonic() + ttl
+        with self._lock:
+            previous = self._data.pop(key, None)
+            if previous is not None:
+                self._unlink(key, previous)
+            self._data[key] = (value, expires_at, size, tags)
+            self.current_bytes += size
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._data) > self.max_entries or self.current_bytes > self.max_bytes:
+                evicted_key, evicted = self._data.popitem(last=False)
+                self._unlink(evicted_key, evicted)
+                self.evictions += 1
+
+    def delete(self, key):
+        """Supprime une entrée si elle existe."""
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is not None:
+                self._unlink(key, entry)
+                return True
+            return False
+
+    def invalidate_tag(self, tag):
+        """Supprime toutes les entrées rattachées au tag ; retourne le nombre d'entrées retirées."""
+        with self._lock:
+            keys = self._tags.pop(tag, ())
+            removed = 0
+            for key in keys:
+                entry = self._data.pop(key, None)
+                if entry is not None:
+                    self._unlink(key, entry)
+                    removed += 1
+            self.invalidations += removed
+            return removed
+
+    def clear(self):
+        """Vide le cache (les compteurs sont conservés)."""
+        with self._lock:
+            self._data.clear()
+            self._tags.clear()
+            self.current_bytes = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """Retourne les compteurs et l'occupation du cache."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._data),
+                'max_entries': self.max_entries,
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations
+            }
@@ -0,0 +1,93 @@
+"""
+Compression des réponses du Gateway
+- Codec choisi d'après l'Accept-Encoding du client (valeurs q comprises) parmi gzip, deflate
+  et br (si le module brotli est installé), dans l'ordre de préférence configuré
+- Corps en mémoire compressé d'un bloc, corps relayés en streaming compressés au fil de l'eau
+- Réponses déjà encodées par le backend relayées telles quelles
+"""
+
+import zlib
+
+try:
+    import brotli
+except ImportError:  # br reste simplement indisponible
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'application/xml',
+                      'application/problem+json', 'image/svg+xml')
+
+def available_codecs():
+    return ('br', 'gzip', 'deflate') if brotli is not None else ('gzip', 'deflate')
+
+def parse_accept_encoding(header):
+    """'gzip;q=0.8, br' -> {'gzip': 0.8, 'br': 1.0} (codecs à q=0 conservés, donc refusés)."""
+    accepted = {}
+    for part in (header or '').split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name] = q
+    return accepted
+
+def negotiate(header, preferred):
+    """Retourne le codec à utiliser (le mieux noté par le client, puis l'ordre `preferred`), ou None."""
+    accepted = parse_accept_encoding(header)
+    best, best_q = None, 0.0
+    for codec in preferred:
+        q = accepted.get(codec, accepted.get('*', 0.0))
+        if q > best_q:
+            best, best_q = codec, q
+    return best
+
+class Compressor:
+    """Interface commune compress() / flush() aux trois codecs."""
+
+    def __init__(self, codec, level):
+        self.codec = codec
+        if codec == 'br':
+            # Niveau zlib 1-9 ramené sur l'échelle de qualité brotli 0-11
+            self._brotli = brotli.Compressor(quality=min(11, max(0, round(level * 11 / 9))))
+        else:
+            wbits = 16 + zlib.MAX_WBITS if codec == 'gzip' else zlib.MAX_WBITS
+            self._zlib = zlib.compressobj(level, zlib.DEFLATED, wbits)
+
+    def compress(self, data):
+        if self.codec == 'br':
+            return self._brotli.process(data)
+        return self._zlib.compress(data)
+
+    def flush(self):
+        if self.codec == 'br':
+            return self._brotli.finish()
+        return self._zlib.flush()
+
+def compress_bytes(data, codec, level):
+    compressor = Compressor(codec, level)
+    return compressor.compress(data) + compressor.flush()
+
+def compress_stream(chunks, codec, level):
+    """Compresse un itérable de blocs ; ne produit un bloc que lorsque le codec a de quoi émettre."""
+    compressor = Compressor(codec, level)
+    try:
+        for chunk in chunks:
+            out = compressor.compress(chunk)
+            if out:
+                yield out
+        tail = compressor.flush()
+        if tail:
+            yield tail
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+def is_compressible(mimetype):
+    return bool(mimetype) and mimetype.startswith(COMPRESSIBLE_TYPES)
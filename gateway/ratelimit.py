@@ -0,0 +1,197 @@
+"""
+Limitation de débit du Gateway (token bucket)
+- Un seau par (route, identité) : utilisateur authentifié, ou IP cliente pour le login
+- IP cliente lue dans X-Forwarded-For uniquement derrière un proxy de confiance (le site web
+  relaie les logins de tous les navigateurs depuis une seule adresse)
+- Limites configurables par route, au format "<débit>/<s|m|h>[:<rafale>]" (ex. 10/s:20)
+- État dans un backend interchangeable : mémoire (un seul Gateway) ou fichier SQLite
+  partagé (plusieurs Gateways sur le même hôte / volume, en attendant un store réseau)
+"""
+
+from collections import namedtuple
+import ipaddress
+import threading
+import sqlite3
+import time
+
+RateLimit = namedtuple('RateLimit', ['rate', 'burst'])
+
+PERIODS = {'s': 1.0, 'm': 60.0, 'h': 3600.0}
+
+def parse_limit(value):
+    """'10/s:20' -> RateLimit(rate=10.0 jetons/s, burst=20) ; la rafale vaut le débit par défaut."""
+    value = value.strip()
+    spec, _, burst = value.partition(':')
+    count, _, period = spec.partition('/')
+    if period not in PERIODS:
+        raise ValueError(f'Limite invalide: {value!r} (attendu "<nombre>/<s|m|h>[:<rafale>]")')
+    count = float(count)
+    return RateLimit(count / PERIODS[period], float(burst) if burst else max(1.0, count))
+
+def parse_networks(value):
+    """'127.0.0.1, 10.0.0.0/8' -> liste de réseaux (une IP seule est un réseau /32 ou /128)."""
+    return [ipaddress.ip_network(item.strip(), strict=False) for item in value.split(',') if item.strip()]
+
+def is_trusted(address, networks):
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in networks)
+
+def client_address(remote_addr, forwarded_for, trusted_proxies):
+    """IP du client à limiter.
+
+    X-Forwarded-For n'est lu que si la connexion vient d'un proxy de confiance ; il est parcouru
+    de droite à gauche et la première adresse qui n'est pas un proxy de confiance est retenue
+    (les adresses plus à gauche ont pu être inventées par le client).
+    """
+    if not forwarded_for or not is_trusted(remote_addr, trusted_proxies):
+        return remote_addr
+    hops = [hop.strip() for hop in forwarded_for.split(',') if hop.strip()]
+    for hop in reversed(hops):
+        if not is_trusted(hop, trusted_proxies):
+            return hop
+    return hops[0] if hops else remote_addr
+
+def parse_limits(value):
+    """'POST /gateway/orders=10/s:20; POST /gateway/auth/login=5/m' -> {route: RateLimit}."""
+    limits = {}
+    for entry in value.split(';'):
+        if entry.strip():
+            route, _, limit = entry.rpartition('=')
+            limits[' '.join(route.split())] = parse_limit(limit)
+    return limits
+
+class MemoryBuckets:
+    """Seaux en mémoire ; les seaux pleins depuis longtemps sont purgés quand la table grossit."""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = {}  # clé -> [jetons, horodatage monotonic, temps de remplissage complet]
+        self._lock = threading.Lock()
+
+    def take(self, key, limit):
+        """Consomme un jeton ; retourne 0 si accordé, sinon le délai (s) avant le prochain jeton."""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_keys:
+                    self._prune(now)
+                bucket = self._buckets[key] = [limit.burst, now, limit.burst / limit.rate]
+            tokens = min(limit.burst, bucket[0] + (now - bucket[1]) * limit.rate)
+            bucket[1] = now
+            if tokens >= 1.0:
+                bucket[0] = tokens - 1.0
+                return 0.0
+            bucket[0] = tokens
+            return (1.0 - tokens) / limit.rate
+
+    def _prune(self, now):
+        """Retire les seaux redevenus pleins (équivalents à un seau neuf)."""
+        full = [key for key, (_, updated, refill) in self._buckets.items() if now - updated >= refill]
+        for key in full:
+            del self._buckets[key]
+
+    def stats(self):
+        with self._lock:
+            return {'backend': 'memory', 'keys': len(self._buckets), 'max_keys': self.max_keys}
+
+class SQLiteBuckets:
+    """Seaux dans un fichier SQLite partagé entre processus (une transaction IMMEDIATE par décision)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connection()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS rate_buckets (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        ''')
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+        return conn
+
+    def take(self, key, limit):
+        now = time.time()
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated_at FROM rate_buckets WHERE key = ?', (key,)).fetchone()
+            tokens = limit.burst if row is None else min(limit.burst, row[0] + max(0.0, now - row[1]) * limit.rate)
+            wait = 0.0
+            if tokens >= 1.0:
+                tokens -= 1.0
+            else:
+                wait = (1.0 - tokens) / limit.rate
+            conn.execute('INSERT OR REPLACE INTO rate_buckets (key, tokens, updated_at) VALUES (?, ?, ?)',
+                         (key, tokens, now))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return wait
+
+    def stats(self):
+        count = self._connection().execute('SELECT COUNT(*) FROM rate_buckets').fetchone()[0]
+        return {'backend': 'sqlite', 'path': self.path, 'keys': count}
+
+def create_backend(spec):
+    """'memory' ou 'sqlite:<chemin>'."""
+    if spec.startswith('sqlite:'):
+        return SQLiteBuckets(spec[len('sqlite:'):])
+    if spec != 'memory':
+        raise ValueError(f'Backend de limitation inconnu: {spec!r}')
+    return MemoryBuckets()
+
+class RateLimiter:
+    """Applique la limite de chaque route (ou la limite par défaut) à une identité."""
+
+    def __init__(self, backend, limits=None, default=None):
+        self.backend = backend
+        self.limits = dict(limits or {})
+        self.default = default
+        self._lock = threading.Lock()
+        self.allowed = {}
+        self.limited = {}
+
+    def limit_for(self, route):
+        return self.limits.get(route, self.default)
+
+    def check(self, route, identity):
+        """Retourne 0 si la requête passe, sinon le délai (s) à indiquer dans Retry-After.
+
+        En cas d'erreur du backend partagé, la requête passe (mieux vaut ne pas
+        limiter que bloquer tout le trafic).
+        """
+        limit = self.limit_for(route)
+        if limit is None:
+            return 0.0
+        try:
+            wait = self.backend.take(f'{route}|{identity}', limit)
+        except sqlite3.Error:
+            wait = 0.0
+        counters = self.limited if wait else self.allowed
+        with self._lock:
+            counters[route] = counters.get(route, 0) + 1
+        return wait
+
+    def stats(self):
+        with self._lock:
+            routes = {}
+            for route in set(self.limits) | set(self.allowed) | set(self.limited):
+                limit = self.limit_for(route)
+                routes[route] = {'rate_per_s': round(limit.rate, 4), 'burst': limit.burst,
+                                 'allowed': self.allowed.get(route, 0), 'limited': self.limited.get(route, 0)}
+        stats = {'routes': routes, 'default': dict(self.default._asdict()) if self.default else None}
+        stats.update(self.backend.stats())
+        return stats
@@ -0,0 +1,225 @@
+"""
+Protection des upstreams du Gateway
+- Circuit breaker par upstream (fermé / ouvert / semi-ouvert)
+- Limite adaptative de requêtes simultanées (AIMD) qui rejette vite quand la latence monte
+- Fenêtre de latences récentes (percentile servant de délai de couverture des GET)
+- Budget de relances : les requêtes supplémentaires restent une fraction du trafic normal
+
+Le CircuitBreaker de pybreaker (utilisé par web_service) garde son verrou pendant
+tout l'appel protégé : il sérialiserait chaque requête relayée, d'où cette version
+qui ne verrouille que les transitions d'état.
+"""
+
+from collections import deque
+import threading
+import time
+
+class CircuitBreaker:
+    """Ouvre le circuit après `fail_max` échecs consécutifs, le teste à nouveau après `reset_timeout` secondes."""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, fail_max=5, reset_timeout=30.0, half_open_max_calls=1):
+        self.fail_max = fail_max
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self.fail_counter = 0
+        self.opened_at = 0.0
+        self.half_open_calls = 0
+        self.rejected = 0
+        self.times_opened = 0
+
+    def _open(self):
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+
+    def allow(self):
+        """Indique si un appel peut partir (passe en semi-ouvert une fois le délai écoulé)."""
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    self.rejected += 1
+                    return False
+                self.state = self.HALF_OPEN
+                self.half_open_calls = 0
+            if self.state == self.HALF_OPEN:
+                if self.half_open_calls >= self.half_open_max_calls:
+                    self.rejected += 1
+                    return False
+                self.half_open_calls += 1
+            return True
+
+    def cancel(self):
+        """Rend la place semi-ouverte prise par allow() pour un appel qui n'est jamais parti."""
+        with self._lock:
+            if self.state == self.HALF_OPEN and self.half_open_calls > 0:
+                self.half_open_calls -= 1
+
+    def record_success(self):
+        with self._lock:
+            self.fail_counter = 0
+            if self.state == self.HALF_OPEN:
+                self.state = self.CLOSED
+                self.half_open_calls = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.fail_counter += 1
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.fail_counter >= self.fail_max):
+                self._open()
+                self.half_open_calls = 0
+
+    def retry_after(self):
+        """Secondes restantes avant le prochain essai (0 si le circuit n'est pas ouvert)."""
+        with self._lock:
+            if self.state != self.OPEN:
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'fail_counter': self.fail_counter,
+                'fail_max': self.fail_max,
+                'reset_timeout': self.reset_timeout,
+                'times_opened': self.times_opened,
+                'rejected': self.rejected
+            }
+
+class AdaptiveLimiter:
+    """Limite AIMD des requêtes simultanées vers un upstream.
+
+    Chaque réponse plus rapide que `latency_target` augmente la limite de 1/limite
+    (environ +1 par fenêtre complète) ; un timeout, une erreur réseau ou une
+    réponse trop lente la multiplie par `backoff`. L'appelant peut fixer une cible
+    propre à la requête (route lente par nature).
+    """
+
+    def __init__(self, initial_limit=20, min_limit=1, max_limit=200, latency_target=1.0, backoff=0.9):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.rejected = 0
+        self.decreases = 0
+
+    def try_acquire(self):
+        """Réserve une place ; False si la limite courante est atteinte."""
+        with self._lock:
+            if self.in_flight >= int(self.limit):
+                self.rejected += 1
+                return False
+            self.in_flight += 1
+            return True
+
+    def cancel(self):
+        """Libère une place réservée sans échantillon de latence (appel jamais parti)."""
+        with self._lock:
+            self.in_flight -= 1
+
+    def release(self, latency, dropped=False, latency_target=None):
+        """Libère une place et ajuste la limite selon la latence observée (cible par défaut : latency_target)."""
+        with self._lock:
+            self.in_flight -= 1
+            if dropped or latency > (latency_target or self.latency_target):
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self.decreases += 1
+            else:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'limit': round(self.limit, 2),
+                'min_limit': self.min_limit,
+                'max_limit': self.max_limit,
+                'latency_target': self.latency_target,
+                'in_flight': self.in_flight,
+                'rejected': self.rejected,
+                'decreases': self.decreases
+            }
+
+class LatencyWindow:
+    """Dernières latences observées ; le percentile est recalculé tous les `refresh_every` échantillons."""
+
+    def __init__(self, percentile=95, size=1000, min_samples=20, refresh_every=50):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.refresh_every = refresh_every
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.value = None  # None tant qu'il n'y a pas assez d'échantillons
+
+    def record(self, latency):
+        with self._lock:
+            self._samples.append(latency)
+            self._pending += 1
+            if self._pending < self.refresh_every or len(self._samples) < self.min_samples:
+                return
+            self._pending = 0
+            ordered = sorted(self._samples)
+        self.value = ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))]
+
+    def stats(self):
+        return {
+            'percentile': self.percentile,
+            'value_ms': round(self.value * 1000, 2) if self.value is not None else None,
+            'samples': len(self._samples)
+        }
+
+class RetryBudget:
+    """Chaque requête dépose `ratio` jeton, chaque seconde en ajoute `min_per_second` ; une relance en consomme un.
+
+    Pendant une panne, les relances ne peuvent donc pas dépasser ~ratio du trafic :
+    elles n'amplifient pas la charge sur un backend déjà en difficulté.
+    """
+
+    def __init__(self, ratio=0.1, min_per_second=1.0, max_tokens=20.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.withdrawn = 0
+        self.exhausted = 0
+
+    def _refill(self, amount):
+        now = time.monotonic()
+        self.tokens = min(self.max_tokens, self.tokens + amount + (now - self._updated) * self.min_per_second)
+        self._updated = now
+
+    def deposit(self):
+        with self._lock:
+            self._refill(self.ratio)
+
+    def try_withdraw(self):
+        """Prend un jeton pour une requête supplémentaire ; False si le budget est épuisé."""
+        with self._lock:
+            self._refill(0.0)
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                self.withdrawn += 1
+                return True
+            self.exhausted += 1
+            return False
+
+    def stats(self):
+        with self._lock:
+            return {
+                'ratio': self.ratio,
+                'min_per_second': self.min_per_second,
+                'tokens': round(self.tokens, 2),
+                'withdrawn': self.withdrawn,
+                'exhausted': self.exhausted
+            }
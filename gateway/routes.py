@@ -0,0 +1,191 @@
+"""
+Table de routes déclarative du Gateway
+- Décrite dans un fichier JSON : une entrée par route /gateway/* relayée vers un backend
+  (chemin au format Flask, méthodes, upstream, chemin backend, authentification, rôles
+  autorisés, timeout de lecture, cache, regroupement des GET, relances, tags invalidés
+  par les écritures)
+- Compilée au chargement en une Map werkzeug (même moteur de correspondance que Flask)
+- Rechargée à chaud quand le fichier change ; une table invalide est refusée et
+  l'ancienne reste en service
+
+Les modèles de chemin backend et de tags sont des chaînes str.format, évaluées avec
+les paramètres du chemin, `user` (utilisateur authentifié) et, pour les tags de cache
+uniquement, `body` (réponse JSON du backend) : "/users/{user_id}", "orders:{user[id]}".
+"""
+
+from collections import namedtuple
+from werkzeug.routing import Map, Rule
+import threading
+import json
+import time
+import os
+
+Route = namedtuple('Route', [
+    'name', 'path', 'methods', 'upstream', 'target', 'auth', 'roles', 'timeout',
+    'coalesce', 'cache', 'retry', 'invalidates'
+])
+
+METHODS = ('GET', 'POST', 'PUT', 'DELETE')
+
+# Valeurs appliquées aux entrées qui ne les précisent pas (surchargées par "defaults" dans le fichier)
+DEFAULTS = {
+    'auth': True, 'roles': {}, 'timeout': None, 'coalesce': False, 'cache': None, 'retry': True, 'invalidates': {}
+}
+
+def parse_roles(value, name, path):
+    """{"DELETE": ["admin"], "*": ["admin", "owner:user_id"]} -> {méthode: tuple de règles}.
+
+    Une règle est un rôle, ou "owner:<paramètre>" : le paramètre du chemin est l'id de l'appelant.
+    """
+    if not isinstance(value, dict):
+        raise ValueError(f'Route {name!r} : "roles" doit associer des méthodes à des listes de rôles')
+    roles = {}
+    for method, rules in value.items():
+        if not isinstance(rules, list) or not all(isinstance(rule, str) and rule for rule in rules):
+            raise ValueError(f'Route {name!r} : rôles invalides pour {method}')
+        for rule in rules:
+            param = rule[len('owner:'):] if rule.startswith('owner:') else None
+            if param is not None and f'<{param}>' not in path and f':{param}>' not in path:
+                raise ValueError(f'Route {name!r} : paramètre {param!r} absent du chemin')
+        roles[method.upper()] = tuple(rules)
+    return roles
+
+def parse_route(entry, defaults, upstreams):
+    """Valide une entrée du fichier et retourne une Route (ValueError si elle est invalide)."""
+    if not isinstance(entry, dict):
+        raise ValueError(f'Entrée de route invalide: {entry!r}')
+    values = dict(defaults, **entry)
+    name = values.get('name') or values.get('path')
+    for key in ('path', 'upstream', 'target'):
+        if not isinstance(values.get(key), str):
+            raise ValueError(f'Route {name!r} : champ "{key}" manquant')
+    if not values['path'].startswith('/gateway/'):
+        raise ValueError(f'Route {name!r} : le chemin doit commencer par /gateway/')
+    if values['upstream'] not in upstreams:
+        raise ValueError(f"Route {name!r} : upstream inconnu {values['upstream']!r}")
+    methods = tuple(method.upper() for method in values.get('methods') or ('GET',))
+    unsupported = [method for method in methods if method not in METHODS]
+    if unsupported:
+        raise ValueError(f'Route {name!r} : méthodes non supportées {unsupported}')
+    timeout = values['timeout']
+    if timeout is not None and (not isinstance(timeout, (int, float)) or timeout <= 0):
+        raise ValueError(f'Route {name!r} : timeout invalide {timeout!r}')
+    cache = values['cache']
+    if cache is not None and not (isinstance(cache, list) and all(isinstance(tag, str) for tag in cache)):
+        raise ValueError(f'Route {name!r} : "cache" doit être une liste de tags (ou null)')
+    invalidates = {method.upper(): list(tags) for method, tags in (values['invalidates'] or {}).items()}
+    roles = parse_roles(values['roles'] or {}, name, values['path'])
+    if roles and not values['auth']:
+        raise ValueError(f'Route {name!r} : des rôles exigent "auth": true')
+    return Route(name, values['path'], methods, values['upstream'], values['target'], bool(values['auth']), roles,
+                 float(timeout) if timeout is not None else None, bool(values['coalesce']), cache,
+                 bool(values['retry']), invalidates)
+
+def load_routes(path, upstreams):
+    """Lit le fichier JSON ({"defaults": {...}, "routes": [...]}) et retourne la liste des Route."""
+    with open(path, encoding='utf-8') as f:
+        document = json.load(f)
+    defaults = dict(DEFAULTS, **document.get('defaults', {}))
+    routes = [parse_route(entry, defaults, upstreams) for entry in document.get('routes', [])]
+    names = [route.name for route in routes]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f'Noms de routes en double: {duplicates}')
+    return routes
+
+def is_allowed(route, method, user, args):
+    """Évalue la politique d'accès de la route pour l'utilisateur authentifié (rôle issu du token)."""
+    roles = route.roles.get('GET' if method == 'HEAD' else method, route.roles.get('*'))
+    if roles is None:
+        return True
+    role = user.get('role', 'user')
+    for rule in roles:
+        if rule.startswith('owner:'):
+            if str(args.get(rule[len('owner:'):])) == str(user['id']):
+                return True
+        elif rule == role:
+            return True
+    return False
+
+def compile_routes(routes):
+    """Map werkzeug (endpoint = nom de la route) liée une fois pour toutes, prête pour match()."""
+    try:
+        url_map = Map([Rule(route.path, endpoint=route.name, methods=route.methods) for route in routes],
+                      strict_slashes=False)
+        return url_map.bind('gateway')
+    except (ValueError, LookupError) as e:
+        raise ValueError(f'Table de routes invalide: {e}') from e
+
+class RouteTable:
+    """Table de routes compilée ; match() vérifie au plus toutes les `check_interval` s si le fichier a changé."""
+
+    def __init__(self, path, upstreams, check_interval=2.0):
+        self.path = path
+        self.upstreams = set(upstreams)
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._checked_at = time.monotonic()
+        self._mtime = os.stat(path).st_mtime
+        self.version = 0
+        self.loaded_at = None
+        self.last_error = None
+        # Au démarrage, une table invalide est une erreur fatale
+        self._install(load_routes(path, self.upstreams))
+
+    def _install(self, routes):
+        adapter = compile_routes(routes)
+        # Remplacée en bloc : une requête en cours garde la table avec laquelle elle a été routée
+        self._state = ({route.name: route for route in routes}, adapter)
+        self.version += 1
+        self.loaded_at = time.time()
+        self.last_error = None
+
+    def reload(self):
+        """Recharge le fichier ; en cas d'erreur, garde la table courante et retourne False."""
+        with self._lock:
+            try:
+                self._mtime = os.stat(self.path).st_mtime
+                self._install(load_routes(self.path, self.upstreams))
+                return True
+            except (OSError, ValueError) as e:
+                self.last_error = str(e)
+                return False
+
+    def maybe_reload(self):
+        now = time.monotonic()
+        if self.check_interval <= 0 or now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        try:
+            changed = os.stat(self.path).st_mtime != self._mtime
+        except OSError:
+            return
+        if changed:
+            self.reload()
+
+    def match(self, path, method):
+        """Retourne (Route, Rule werkzeug, paramètres du chemin).
+
+        Lève NotFound ou MethodNotAllowed (werkzeug.exceptions) si aucune entrée ne correspond.
+        """
+        self.maybe_reload()
+        routes, adapter = self._state
+        rule, args = adapter.match(path, method=method, return_rule=True)
+        return routes[rule.endpoint], rule, args
+
+    def routes(self):
+        return list(self._state[0].values())
+
+    def stats(self):
+        return {
+            'file': self.path,
+            'version': self.version,
+            'loaded_at': self.loaded_at,
+            'last_error': self.last_error,
+            'routes': {
+                route.name: {'path': route.path, 'methods': list(route.methods), 'upstream': route.upstream,
+                             'roles': {method: list(rules) for method, rules in route.roles.items()},
+                             'timeout': route.timeout, 'cache': route.cache is not None, 'retry': route.retry}
+                for route in self.routes()
+            }
+        }
@@ -0,0 +1,69 @@
+"""
+Regroupement des appels identiques simultanés (singleflight)
+- Le premier appelant d'une clé exécute l'appel, les suivants attendent son résultat
+- Les erreurs sont propagées à tous les appelants regroupés
+- Compteurs : appels réellement exécutés et appels économisés
+"""
+
+import threading
+
+class _Call:
+    """Appel en cours partagé entre les appelants d'une même clé."""
+
+    __slots__ = ('event', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+class SingleFlight:
+    """Exécute une seule fois les appels concurrents portant la même clé."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        """Retourne (résultat, partagé) ; partagé vaut True si le résultat vient d'un autre appelant."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+            return call.result, False
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    def stats(self):
+        """Retourne les compteurs de regroupement."""
+        with self._lock:
+            total = self.executed + self.coalesced
+            return {
+                'upstream_calls': self.executed,
+                'upstream_calls_saved': self.coalesced,
+                'saved_ratio': round(self.coalesced / total, 4) if total else 0.0,
+                'in_flight_keys': len(self._calls)
+            }
@@ -0,0 +1,829 @@
+"""
+Upstreams du Gateway - une session HTTP poolée par service backend
+- Connexions keep-alive réutilisées (plus de connect TCP à chaque appel)
+- Taille de pool et timeouts connect/read configurables par upstream
+- Métriques d'utilisation du pool (in-flight, connexions ouvertes, réutilisation)
+- Circuit breaker et limite adaptative de concurrence par upstream (rejet immédiat en 503)
+- Plusieurs réplicas par upstream : répartition au moins de requêtes en cours,
+  éjection passive (échecs consécutifs) et active (/health), liste rechargée
+  depuis un fichier ou le DNS sans redémarrage
+- État de santé agrégé publié par le thread de health check (lu sans appel réseau)
+- Latence de chaque appel découpée en connexion / attente de la réponse / transfert du corps
+- Un span client par appel, contexte de trace propagé dans l'en-tête traceparent
+- GET couverts (hedging) : seconde tentative si la première dépasse le p95 observé,
+  relances et couvertures prélevées sur un budget par upstream ; la première tentative part
+  du thread de l'appelant, seule la couverture passe par un thread du pool
+- Échéance (X-Request-Deadline-Ms) recalculée pour chaque tentative d'un même appel
+"""
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from resilience import CircuitBreaker, AdaptiveLimiter, LatencyWindow, RetryBudget
+from shared.metrics import REGISTRY
+from shared.tracing import client_span
+from shared.deadline import DEADLINE_HEADER, budget_header
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from datetime import datetime, timezone
+import contextvars
+import threading
+import itertools
+import heapq
+import random
+import socket
+import time
+import requests
+import os
+
+def env_flag(name, default):
+    """Lit un booléen depuis l'environnement ('1', 'true', 'yes', 'on')."""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+UPSTREAM_DURATION = REGISTRY.histogram(
+    'gateway_upstream_duration_seconds',
+    'Durée des appels aux backends par phase (connect, wait = jusqu\'aux en-têtes, transfer = corps)',
+    ('upstream', 'phase'))
+UPSTREAM_RESPONSES = REGISTRY.counter(
+    'gateway_upstream_responses_total', 'Réponses des backends par statut (error = échec réseau, rejected = refus local)',
+    ('upstream', 'status'))
+UPSTREAM_HEDGES = REGISTRY.counter(
+    'gateway_upstream_hedges_total', 'GET couverts par une seconde tentative (result = sent / won)',
+    ('upstream', 'result'))
+UPSTREAM_RETRIES = REGISTRY.counter(
+    'gateway_upstream_retries_total', 'GET relancés après un échec de connexion ou une réponse 502/503/504',
+    ('upstream',))
+UPSTREAM_BUDGET_EXHAUSTED = REGISTRY.counter(
+    'gateway_upstream_retry_budget_exhausted_total', 'Couvertures ou relances refusées faute de budget',
+    ('upstream',))
+
+# Threads qui exécutent les couvertures des GET (la première tentative part du thread de l'appelant)
+HEDGE_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.getenv('GATEWAY_HEDGE_WORKERS', '128')),
+    thread_name_prefix='gateway-hedge'
+)
+
+# Statuts pour lesquels un GET est relancé (le backend n'a pas traité la requête)
+RETRYABLE_STATUSES = {502, 503, 504}
+
+# Temps de connexion TCP cumulé par le thread courant pendant l'appel en cours
+_phase = threading.local()
+
+def parse_endpoints(value):
+    """Découpe une liste d'URLs séparées par des virgules ou des retours à la ligne (# = commentaire)."""
+    if isinstance(value, (list, tuple)):
+        return [url.rstrip('/') for url in value if url]
+    urls = []
+    for line in value.replace(',', '\n').splitlines():
+        line = line.split('#', 1)[0].strip()
+        if line:
+            urls.append(line.rstrip('/'))
+    return urls
+
+def resolve_endpoints(urls):
+    """Remplace le nom d'hôte de chaque URL http par toutes ses adresses IPv4 (ex. docker compose --scale).
+
+    Retourne {url résolue: en-tête Host d'origine}. Les URL https sont gardées telles quelles
+    (valeur None) : une adresse IP à la place du nom casserait SNI et la vérification du certificat.
+    """
+    resolved = {}
+    for url in urls:
+        parts = urlsplit(url)
+        if parts.scheme == 'https':
+            resolved.setdefault(url, None)
+            continue
+        port = parts.port or 80
+        host = parts.netloc.rsplit('@', 1)[-1]
+        addresses = sorted({info[4][0] for info in socket.getaddrinfo(parts.hostname, port, socket.AF_INET, socket.SOCK_STREAM)})
+        for address in addresses:
+            resolved.setdefault(f'{parts.scheme}://{address}:{port}{parts.path}'.rstrip('/'), host)
+    return resolved
+
+class UpstreamRejected(requests.exceptions.RequestException):
+    """Appel refusé sans contacter le backend (circuit ouvert ou limite de concurrence atteinte)."""
+
+    def __init__(self, message, retry_after=1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class PooledAdapter(HTTPAdapter):
+    """HTTPAdapter qui signale à son upstream chaque nouvelle connexion TCP."""
+
+    def __init__(self, upstream, **kwargs):
+        self.upstream = upstream
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        upstream = self.upstream
+
+        class CountingHTTPConnection(HTTPConnection):
+            def connect(self):
+                start = time.perf_counter()
+                super().connect()
+                upstream.record_connect(time.perf_counter() - start)
+                watch_connection(self)
+
+            def request(self, *args, **kwargs):
+                watch_connection(self)
+                return super().request(*args, **kwargs)
+
+        class CountingHTTPSConnection(HTTPSConnection):
+            def connect(self):
+                start = time.perf_counter()
+                super().connect()
+                upstream.record_connect(time.perf_counter() - start)
+                watch_connection(self)
+
+            def request(self, *args, **kwargs):
+                watch_connection(self)
+                return super().request(*args, **kwargs)
+
+        class CountingHTTPConnectionPool(HTTPConnectionPool):
+            ConnectionCls = CountingHTTPConnection
+
+        class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+            ConnectionCls = CountingHTTPSConnection
+
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': CountingHTTPConnectionPool,
+            'https': CountingHTTPSConnectionPool
+        }
+
+    def idle_connections(self):
+        """Nombre de connexions ouvertes actuellement au repos dans les pools."""
+        idle = 0
+        for key in list(self.poolmanager.pools.keys()):
+            pool = self.poolmanager.pools.get(key)
+            if pool is not None and pool.pool is not None:
+                idle += sum(1 for conn in list(pool.pool.queue) if conn is not None)
+        return idle
+
+class HedgeTimer:
+    """Déclenche les couvertures à leur échéance depuis un seul thread.
+
+    Un GET en attente de son délai de couverture n'occupe aucun thread : seule
+    la couverture effectivement envoyée prend un thread de HEDGE_EXECUTOR.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def schedule(self, delay, callback):
+        """Appelle `callback` dans `delay` secondes ; retourne une entrée à passer à cancel()."""
+        entry = [time.monotonic() + delay, next(self._sequence), callback]
+        with self._condition:
+            heapq.heappush(self._heap, entry)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='gateway-hedge-timer', daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return entry
+
+    def cancel(self, entry):
+        # Retrait paresseux : l'entrée reste dans le tas jusqu'à son échéance, sans rappel
+        entry[2] = None
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    now = time.monotonic()
+                    if self._heap and self._heap[0][0] <= now:
+                        entry = heapq.heappop(self._heap)
+                        break
+                    self._condition.wait(self._heap[0][0] - now if self._heap else None)
+            callback = entry[2]
+            if callback is not None:
+                try:
+                    callback()
+                except Exception as e:
+                    print(f"Couverture non envoyée: {e}")
+
+HEDGE_TIMER = HedgeTimer()
+
+def shutdown_connection(connection):
+    """Coupe le socket d'une connexion : un recv bloqué dans un autre thread se termine en erreur."""
+    sock = getattr(connection, 'sock', None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+class HedgedCall:
+    """État partagé entre la première tentative d'un GET (thread de l'appelant) et sa couverture."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Première tentative terminée : la couverture ne part plus, et ne l'interrompt plus
+        self.settled = False
+        self.hedge = None
+        self.hedge_won = False
+        # Première tentative interrompue par le Gateway : son échec n'est pas imputé au backend
+        self.abandoned = False
+        self.connection = None
+
+    def attach(self, connection):
+        """Enregistre la connexion de la première tentative (appelé depuis la connexion elle-même)."""
+        with self.lock:
+            self.connection = connection
+            if self.abandoned:
+                shutdown_connection(connection)
+
+    def hedge_done(self, future):
+        """Couverture terminée : si elle est valide et la première en cours, celle-ci est interrompue."""
+        if future.cancelled() or future.exception() is not None:
+            return
+        if future.result().status_code in RETRYABLE_STATUSES:
+            return
+        with self.lock:
+            if self.settled:
+                return
+            self.hedge_won = True
+            self.abandoned = True
+            if self.connection is not None:
+                shutdown_connection(self.connection)
+
+def watch_connection(connection):
+    """Rattache la connexion à la première tentative couverte en cours dans ce thread, s'il y en a une."""
+    call = getattr(_phase, 'call', None)
+    if call is not None:
+        call.attach(connection)
+
+def deadline_attempts(kwargs):
+    """Retourne une fonction qui prépare les arguments de chaque tentative d'un même appel.
+
+    Le budget de l'en-tête X-Request-Deadline-Ms devient une échéance fixée au premier
+    appel : une couverture ou une relance annonce au backend le temps qui reste
+    réellement, et n'attend pas sa réponse au-delà.
+    """
+    headers = kwargs.get('headers') or {}
+    try:
+        deadline = time.monotonic() + int(headers[DEADLINE_HEADER]) / 1000.0
+    except (KeyError, ValueError):
+        return lambda: kwargs
+
+    def next_attempt():
+        remaining = max(0.001, deadline - time.monotonic())
+        attempt = dict(kwargs, headers={**headers, DEADLINE_HEADER: budget_header(remaining)})
+        timeout = kwargs.get('timeout')
+        if isinstance(timeout, tuple):
+            attempt['timeout'] = (timeout[0], remaining if timeout[1] is None else min(timeout[1], remaining))
+        elif timeout is not None:
+            attempt['timeout'] = min(timeout, remaining)
+        return attempt
+
+    return next_attempt
+
+def close_response(future):
+    """Libère la connexion d'une tentative abandonnée (réponse non relayée)."""
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+class Replica:
+    """Instance d'un service backend ; ses compteurs sont protégés par le verrou de l'upstream."""
+
+    # Poids de la dernière mesure dans la moyenne mobile de latence
+    EWMA_ALPHA = 0.2
+
+    def __init__(self, url, host=None):
+        self.url = url
+        # En-tête Host attendu par le backend quand l'URL désigne une adresse IP résolue
+        self.host = host
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.ejections = 0
+        self.latency_total = 0.0
+        self.latency_ewma = None
+        self.health_checked = False
+        self.health_check_failed = False
+        self.health_check_latency = None
+
+    def available(self, now):
+        """Vrai si le réplica n'est ni éjecté (échecs passifs) ni en échec de health check."""
+        return not self.health_check_failed and self.ejected_until <= now
+
+    def stats(self, now):
+        completed = self.requests - self.in_flight
+        return {
+            'url': self.url,
+            'available': self.available(now),
+            'in_flight': self.in_flight,
+            'requests': self.requests,
+            'errors': self.errors,
+            'error_ratio': round(self.errors / completed, 4) if completed > 0 else 0.0,
+            'latency_ms_avg': round(self.latency_total / completed * 1000, 2) if completed > 0 else None,
+            'latency_ms_ewma': round(self.latency_ewma * 1000, 2) if self.latency_ewma is not None else None,
+            'ejected_for': round(max(0.0, self.ejected_until - now), 2),
+            'ejections': self.ejections,
+            'health_check': ('failed' if self.health_check_failed else 'ok') if self.health_checked else 'unknown',
+            'health_check_latency_ms': round(self.health_check_latency * 1000, 2) if self.health_check_latency is not None else None
+        }
+
+class Upstream:
+    """Service backend (un ou plusieurs réplicas) joint via une session requests dédiée et poolée."""
+
+    def __init__(self, name, base_url, pool_size=20, connect_timeout=1.0, read_timeout=5.0, keep_alive=True,
+                 breaker=None, limiter=None, replicas_file=None, resolve_dns=False, eject_after=3, eject_time=10.0,
+                 hedging=True, hedge_min_delay=0.01, latency=None, retry_budget=None):
+        self.name = name
+        self.seed_urls = parse_endpoints(base_url)
+        self.replicas_file = replicas_file
+        self.resolve_dns = resolve_dns
+        self.eject_after = eject_after
+        self.eject_time = eject_time
+        self.replicas = [Replica(url) for url in self.seed_urls]
+        self._replicas_file_mtime = None
+        self._health_thread = None
+        self.health_check_interval = 0.0
+        # Dernier état agrégé publié par check_replicas() ; remplacé en bloc, jamais modifié sur place
+        self.health = {'status': 'unknown', 'since': None, 'checked_at': None,
+                       'latency_ms': None, 'replicas_up': 0, 'replicas': len(self.replicas)}
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.keep_alive = keep_alive
+
+        self.session = requests.Session()
+        # pool_connections : nombre de réplicas (hôtes) dont le pool reste ouvert
+        self.adapter = PooledAdapter(self, pool_connections=32, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+        if not keep_alive:
+            self.session.headers['Connection'] = 'close'
+        # Health checks sur une session à part : leurs connexions ne comptent pas dans connections_opened
+        self.health_session = requests.Session()
+
+        self.breaker = breaker or CircuitBreaker()
+        self.limiter = limiter or AdaptiveLimiter(initial_limit=pool_size)
+        self.hedging = hedging
+        self.hedge_min_delay = hedge_min_delay
+        self.latency = latency or LatencyWindow()
+        self.retry_budget = retry_budget or RetryBudget()
+        self.hedges_sent = 0
+        self.hedges_won = 0
+        self.retries = 0
+
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests_total = 0
+        self.connections_opened = 0
+        self.errors = 0
+
+        if replicas_file or resolve_dns:
+            self.refresh_endpoints()
+
+    @classmethod
+    def from_env(cls, name, base_url, default_read_timeout=5.0):
+        """Construit un upstream à partir des variables GATEWAY_<NOM>_<REGLAGE>, ou GATEWAY_<REGLAGE> à défaut."""
+        prefix = f'GATEWAY_{name.upper()}_'
+
+        def setting(key, default):
+            return os.getenv(prefix + key, os.getenv('GATEWAY_' + key, default))
+
+        pool_size = int(setting('POOL_SIZE', '20'))
+        return cls(
+            name,
+            base_url,
+            pool_size=pool_size,
+            connect_timeout=float(setting('CONNECT_TIMEOUT', '1.0')),
+            read_timeout=float(os.getenv(prefix + 'READ_TIMEOUT', str(default_read_timeout))),
+            keep_alive=env_flag('GATEWAY_KEEP_ALIVE', True),
+            replicas_file=os.getenv(prefix + 'REPLICAS_FILE'),
+            resolve_dns=env_flag(prefix + 'RESOLVE_DNS', env_flag('GATEWAY_RESOLVE_DNS', False)),
+            eject_after=int(setting('EJECT_AFTER', '3')),
+            eject_time=float(setting('EJECT_TIME', '10')),
+            breaker=CircuitBreaker(
+                fail_max=int(setting('BREAKER_FAIL_MAX', '5')),
+                reset_timeout=float(setting('BREAKER_RESET_TIMEOUT', '30'))
+            ),
+            limiter=AdaptiveLimiter(
+                initial_limit=int(setting('LIMIT_INITIAL', str(pool_size))),
+                min_limit=int(setting('LIMIT_MIN', '1')),
+                max_limit=int(setting('LIMIT_MAX', '200')),
+                latency_target=float(setting('LATENCY_TARGET', '1.0'))
+            ),
+            hedging=env_flag(prefix + 'HEDGE', env_flag('GATEWAY_HEDGE', True)),
+            hedge_min_delay=float(setting('HEDGE_MIN_DELAY', '0.01')),
+            latency=LatencyWindow(percentile=float(setting('HEDGE_PERCENTILE', '95'))),
+            retry_budget=RetryBudget(
+                ratio=float(setting('RETRY_BUDGET_RATIO', '0.1')),
+                min_per_second=float(setting('RETRY_BUDGET_MIN_PER_SEC', '1'))
+            )
+        )
+
+    @property
+    def timeout(self):
+        """Tuple (connect, read) attendu par requests."""
+        return (self.connect_timeout, self.read_timeout)
+
+    @property
+    def base_url(self):
+        """URL du premier réplica (compatibilité avec le code qui ne connaît qu'une instance)."""
+        with self._lock:
+            return self.replicas[0].url if self.replicas else ''
+
+    @base_url.setter
+    def base_url(self, value):
+        self.seed_urls = parse_endpoints(value)
+        self.set_endpoints(self.seed_urls)
+
+    def set_endpoints(self, urls, hosts=None):
+        """Remplace la liste des réplicas ; les réplicas conservés gardent leurs compteurs.
+
+        hosts : {url: en-tête Host} pour les URL issues de la résolution DNS.
+        """
+        hosts = hosts or {}
+        with self._lock:
+            current = {replica.url: replica for replica in self.replicas}
+            self.replicas = [current.get(url) or Replica(url, hosts.get(url)) for url in dict.fromkeys(urls)]
+
+    def refresh_endpoints(self):
+        """Relit le fichier de réplicas (s'il a changé) et/ou résout à nouveau le DNS.
+
+        En cas d'erreur (fichier absent, DNS indisponible), la liste courante est conservée.
+        """
+        urls = self.seed_urls
+        if self.replicas_file:
+            try:
+                mtime = os.path.getmtime(self.replicas_file)
+                if mtime == self._replicas_file_mtime and not self.resolve_dns:
+                    return
+                with open(self.replicas_file) as f:
+                    urls = parse_endpoints(f.read())
+                self._replicas_file_mtime = mtime
+            except OSError:
+                return
+        hosts = None
+        if self.resolve_dns:
+            try:
+                hosts = resolve_endpoints(urls)
+            except OSError:
+                return
+            urls = list(hosts)
+        if urls:
+            self.set_endpoints(urls, hosts)
+
+    def acquire_replica(self):
+        """Choisit le réplica disponible ayant le moins de requêtes en cours.
+
+        Si tous sont éjectés, la sélection se fait parmi tous les réplicas
+        plutôt que de refuser le trafic.
+        """
+        now = time.monotonic()
+        with self._lock:
+            candidates = [replica for replica in self.replicas if replica.available(now)] or self.replicas
+            if not candidates:
+                raise UpstreamRejected(f'Aucun réplica configuré pour {self.name}')
+            # Tirage aléatoire entre ex aequo pour ne pas surcharger toujours le premier réplica
+            replica = min(candidates, key=lambda r: (r.in_flight, random.random()))
+            replica.in_flight += 1
+            replica.requests += 1
+            return replica
+
+    def release_replica(self, replica, latency, failed):
+        """Enregistre le résultat d'un appel ; éjecte le réplica après `eject_after` échecs consécutifs."""
+        with self._lock:
+            replica.in_flight -= 1
+            replica.latency_total += latency
+            if replica.latency_ewma is None:
+                replica.latency_ewma = latency
+            else:
+                replica.latency_ewma += Replica.EWMA_ALPHA * (latency - replica.latency_ewma)
+            if not failed:
+                replica.consecutive_failures = 0
+                return
+            replica.errors += 1
+            replica.consecutive_failures += 1
+            if replica.consecutive_failures >= self.eject_after and len(self.replicas) > 1:
+                replica.ejected_until = time.monotonic() + self.eject_time
+                replica.ejections += 1
+                replica.consecutive_failures = 0
+
+    def check_replicas(self, path='/health', timeout=1.0):
+        """Health check actif : appelle `path` sur chaque réplica, hors circuit breaker et limite."""
+        with self._lock:
+            replicas = list(self.replicas)
+        for replica in replicas:
+            start = time.monotonic()
+            try:
+                response = self.health_session.get(f'{replica.url}{path}', timeout=(self.connect_timeout, timeout),
+                                            headers={'Host': replica.host} if replica.host else None)
+                healthy = response.status_code == 200
+                response.close()
+            except requests.exceptions.RequestException:
+                healthy = False
+            with self._lock:
+                replica.health_checked = True
+                replica.health_check_failed = not healthy
+                replica.health_check_latency = time.monotonic() - start
+        self.publish_health()
+
+    def publish_health(self):
+        """Calcule l'état agrégé de l'upstream (sain si au moins un réplica répond) et le publie dans self.health."""
+        with self._lock:
+            checked = [replica for replica in self.replicas if replica.health_checked]
+            up = [replica for replica in checked if not replica.health_check_failed]
+            total = len(self.replicas)
+        status = 'healthy' if up else ('unhealthy' if checked else 'unknown')
+        now = datetime.now(timezone.utc).isoformat()
+        previous = self.health
+        self.health = {
+            'status': status,
+            'since': previous['since'] if previous['status'] == status else now,
+            'checked_at': now,
+            'latency_ms': round(min(replica.health_check_latency for replica in up) * 1000, 2) if up else None,
+            'replicas_up': len(up),
+            'replicas': total
+        }
+
+    def start_health_checks(self, interval):
+        """Lance le thread qui recharge la liste des réplicas et les vérifie toutes les `interval` secondes."""
+        if interval <= 0 or self._health_thread is not None:
+            return
+        self.health_check_interval = interval
+
+        def loop():
+            while True:
+                if self.replicas_file or self.resolve_dns:
+                    self.refresh_endpoints()
+                self.check_replicas()
+                time.sleep(interval)
+
+        self._health_thread = threading.Thread(target=loop, name=f'health-{self.name}', daemon=True)
+        self._health_thread.start()
+
+    def record_connect(self, duration=0.0):
+        with self._lock:
+            self.connections_opened += 1
+        UPSTREAM_DURATION.observe(duration, self.name, 'connect')
+        _phase.connect = getattr(_phase, 'connect', 0.0) + duration
+
+    def record_phases(self, response, total, stream):
+        """Enregistre l'attente de la réponse et le transfert du corps (à la fermeture s'il est streamé)."""
+        headers_at = response.elapsed.total_seconds()
+        UPSTREAM_DURATION.observe(max(0.0, headers_at - _phase.connect), self.name, 'wait')
+        if not stream:
+            UPSTREAM_DURATION.observe(max(0.0, total - headers_at), self.name, 'transfer')
+            return
+        received_at = time.perf_counter()
+        close = response.close
+        name = self.name
+
+        def close_and_record():
+            # Remis en place d'abord : une seconde fermeture ne compte pas deux fois
+            response.close = close
+            UPSTREAM_DURATION.observe(time.perf_counter() - received_at, name, 'transfer')
+            close()
+
+        response.close = close_and_record
+
+    def request(self, method, path, retry=True, **kwargs):
+        """Envoie une requête vers l'upstream via la session poolée.
+
+        Les GET (idempotents) sont couverts et relancés dans la limite du budget
+        de relances ; les autres méthodes, et les GET avec retry=False, partent une seule fois.
+        """
+        self.retry_budget.deposit()
+        if method != 'GET' or not self.hedging or not retry:
+            return self.send(method, path, **kwargs)
+        return self.send_idempotent(path, **kwargs)
+
+    def take_extra_attempt(self):
+        """Prélève une tentative supplémentaire sur le budget de relances."""
+        if self.retry_budget.try_withdraw():
+            return True
+        UPSTREAM_BUDGET_EXHAUSTED.inc(self.name)
+        return False
+
+    def send_idempotent(self, path, **kwargs):
+        """GET avec au plus une tentative supplémentaire : couverture ou relance.
+
+        La première tentative part du thread de l'appelant. Si elle n'a pas répondu après
+        le p95 observé, HEDGE_TIMER envoie une seconde tentative via HEDGE_EXECUTOR (vers le
+        réplica le moins chargé, donc un autre s'il y en a plusieurs) ; si celle-ci répond
+        d'abord, la connexion de la première est coupée et l'appelant reçoit la couverture.
+        Sinon, un échec de connexion ou un 502/503/504 est relancé une fois. Dans les deux cas,
+        un jeton du budget est consommé.
+        """
+        next_attempt = deadline_attempts(kwargs)
+        delay = self.latency.value
+        if delay is None:
+            # Pas encore assez de mesures pour fixer un délai de couverture : relance seule
+            try:
+                response = self.send('GET', path, **next_attempt())
+            except requests.exceptions.RequestException as e:
+                return self.retry_failed(path, next_attempt, None, e)
+            return self.retry_failed(path, next_attempt, response, None)
+
+        call = HedgedCall()
+        context = contextvars.copy_context()
+        timer = HEDGE_TIMER.schedule(max(delay, self.hedge_min_delay),
+                                     lambda: self.launch_hedge(call, context, path, next_attempt))
+        response = error = None
+        _phase.call = call
+        try:
+            response = self.send('GET', path, **next_attempt())
+        except requests.exceptions.RequestException as e:
+            error = e
+        finally:
+            _phase.call = None
+            HEDGE_TIMER.cancel(timer)
+            with call.lock:
+                call.settled = True
+                hedge = call.hedge
+            if hedge is not None and response is None and error is None:
+                # Interruption hors réseau de la première tentative : la couverture n'est pas relayée
+                hedge.add_done_callback(close_response)
+
+        if hedge is None:
+            return self.retry_failed(path, next_attempt, response, error)
+        if call.hedge_won:
+            if response is not None:
+                response.close()
+            self.count_hedge_won()
+            return hedge.result()
+        if error is None and response.status_code not in RETRYABLE_STATUSES:
+            # Première réponse retenue : la couverture est fermée dès qu'elle se termine
+            hedge.add_done_callback(close_response)
+            return response
+
+        # Première tentative en échec : la couverture, déjà partie, tient lieu de relance
+        try:
+            hedged = hedge.result()
+        except requests.exceptions.RequestException:
+            if response is None:
+                raise
+            return response
+        if response is not None:
+            response.close()
+        if hedged.status_code not in RETRYABLE_STATUSES:
+            self.count_hedge_won()
+        return hedged
+
+    def launch_hedge(self, call, context, path, next_attempt):
+        """Délai de couverture écoulé (thread de HEDGE_TIMER) : seconde tentative si le budget le permet."""
+        with call.lock:
+            if call.settled or not self.take_extra_attempt():
+                return
+            call.hedge = HEDGE_EXECUTOR.submit(context.run, self.send, 'GET', path, **next_attempt())
+        with self._lock:
+            self.hedges_sent += 1
+        UPSTREAM_HEDGES.inc(self.name, 'sent')
+        call.hedge.add_done_callback(call.hedge_done)
+
+    def retry_failed(self, path, next_attempt, response, error):
+        """Relance une fois un GET non couvert en échec de connexion ou en 502/503/504."""
+        if error is not None:
+            if not isinstance(error, requests.exceptions.ConnectionError) or not self.take_extra_attempt():
+                raise error
+            self.count_retry()
+            return self.send('GET', path, **next_attempt())
+        if response.status_code in RETRYABLE_STATUSES and self.take_extra_attempt():
+            response.close()
+            self.count_retry()
+            return self.send('GET', path, **next_attempt())
+        return response
+
+    def count_hedge_won(self):
+        with self._lock:
+            self.hedges_won += 1
+        UPSTREAM_HEDGES.inc(self.name, 'won')
+
+    def count_retry(self):
+        with self._lock:
+            self.retries += 1
+        UPSTREAM_RETRIES.inc(self.name)
+
+    def latency_target(self, route_timeout=None):
+        """Latence cible de la limite adaptative pour une route au timeout `route_timeout`.
+
+        Une route plus lente par nature que l'upstream (timeout au-delà de read_timeout,
+        ex. statistiques de commandes) voit sa cible élargie dans la même proportion :
+        ses réponses normales ne sont pas prises pour une surcharge. La cible n'est jamais réduite.
+        """
+        target = self.limiter.latency_target
+        if route_timeout and self.read_timeout and route_timeout > self.read_timeout:
+            target *= route_timeout / self.read_timeout
+        return target
+
+    def send(self, method, path, route_timeout=None, **kwargs):
+        """Une tentative vers le réplica le moins chargé.
+
+        Lève UpstreamRejected sans contacter le backend si le circuit est ouvert
+        ou si la limite adaptative de concurrence est atteinte. `route_timeout` (timeout
+        déclaré par la route) fixe la latence cible de la limite adaptative.
+        """
+        if not self.limiter.try_acquire():
+            UPSTREAM_RESPONSES.inc(self.name, 'rejected')
+            raise UpstreamRejected(f'Service {self.name} surchargé, réessayez plus tard', retry_after=1.0)
+        if not self.breaker.allow():
+            self.limiter.cancel()
+            UPSTREAM_RESPONSES.inc(self.name, 'rejected')
+            raise UpstreamRejected(f'Service {self.name} indisponible (circuit ouvert)',
+                                   retry_after=self.breaker.retry_after())
+
+        try:
+            replica = self.acquire_replica()
+        except UpstreamRejected:
+            # Appel jamais parti : sans cela, la place semi-ouverte resterait prise et le circuit
+            # refuserait tout, même une fois les réplicas rétablis
+            self.breaker.cancel()
+            self.limiter.cancel()
+            raise
+
+        kwargs.setdefault('timeout', self.timeout)
+        with self._lock:
+            self.in_flight += 1
+            self.requests_total += 1
+            if self.in_flight > self.peak_in_flight:
+                self.peak_in_flight = self.in_flight
+        _phase.connect = 0.0
+        start = time.perf_counter()
+        headers = kwargs['headers'] = dict(kwargs.get('headers') or {})
+        if replica.host:
+            headers['Host'] = replica.host
+        try:
+            with client_span(f'{method} {path}', headers,
+                             tags={'peer.service': self.name, 'http.url': f'{replica.url}{path}'}) as span:
+                response = self.session.request(method, f'{replica.url}{path}', **kwargs)
+                span.tags['http.status_code'] = response.status_code
+        except requests.exceptions.RequestException:
+            elapsed = time.perf_counter() - start
+            call = getattr(_phase, 'call', None)
+            if call is not None and call.abandoned:
+                # Coupée par le Gateway, la couverture ayant répondu : pas un échec du backend
+                UPSTREAM_RESPONSES.inc(self.name, 'abandoned')
+                self.release_replica(replica, elapsed, failed=False)
+                self.breaker.cancel()
+                self.limiter.cancel()
+                raise
+            UPSTREAM_RESPONSES.inc(self.name, 'error')
+            self.release_replica(replica, elapsed, failed=True)
+            self.breaker.record_failure()
+            self.limiter.release(elapsed, dropped=True)
+            with self._lock:
+                self.errors += 1
+            raise
+        except BaseException:
+            # Erreur hors réseau (ex. interruption) : places rendues sans verdict sur le backend
+            self.release_replica(replica, time.perf_counter() - start, failed=False)
+            self.breaker.cancel()
+            self.limiter.cancel()
+            raise
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+        elapsed = time.perf_counter() - start
+        self.latency.record(elapsed)
+        UPSTREAM_RESPONSES.inc(self.name, str(response.status_code))
+        self.record_phases(response, elapsed, kwargs.get('stream', False))
+        failed = response.status_code >= 500
+        self.release_replica(replica, elapsed, failed)
+        if failed:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        self.limiter.release(elapsed, latency_target=self.latency_target(route_timeout))
+        return response
+
+    def stats(self):
+        """Retourne les métriques d'utilisation du pool de connexions."""
+        now = time.monotonic()
+        with self._lock:
+            reused = max(0, self.requests_total - self.connections_opened)
+            return {
+                'replicas': [replica.stats(now) for replica in self.replicas],
+                'replicas_source': self.replicas_file or ('dns' if self.resolve_dns else 'env'),
+                'health_check_interval': self.health_check_interval,
+                'health': self.health,
+                'pool_size': self.pool_size,
+                'keep_alive': self.keep_alive,
+                'connect_timeout': self.connect_timeout,
+                'read_timeout': self.read_timeout,
+                'in_flight': self.in_flight,
+                'peak_in_flight': self.peak_in_flight,
+                'pool_utilization': round(self.in_flight / self.pool_size, 4) if self.pool_size else 0.0,
+                'idle_connections': self.adapter.idle_connections(),
+                'requests': self.requests_total,
+                'connections_opened': self.connections_opened,
+                'connection_reuse_ratio': round(reused / self.requests_total, 4) if self.requests_total else 0.0,
+                'errors': self.errors,
+                'hedging': dict(self.latency.stats(), enabled=self.hedging, min_delay=self.hedge_min_delay,
+                                hedges_sent=self.hedges_sent, hedges_won=self.hedges_won, retries=self.retries),
+                'retry_budget': self.retry_budget.stats(),
+                'breaker': self.breaker.stats(),
+                'concurrency_limit': self.limiter.stats()
+            }
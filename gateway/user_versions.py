@@ -0,0 +1,107 @@
+"""
+Versions de sécurité des utilisateurs pour la vérification locale des tokens
+- Copie de la table user_id -> token_version de l'Auth Service (GET /auth/user-versions),
+  relevée toutes les `interval` secondes par un thread ; ETag / If-None-Match : la table
+  n'est retéléchargée que lorsqu'elle a changé
+- check(user_id, ver) compare le claim `ver` d'un access token à la version courante :
+  'ok', 'revoked' (version dépassée : suppression du rôle, changement de mot de passe, ...)
+  ou 'unknown' (utilisateur absent, token plus récent que la copie, copie trop ancienne) ;
+  dans ce dernier cas le Gateway interroge l'Auth Service plutôt que de conclure seul
+- Délai de révocation : au plus `interval` secondes tant que l'Auth Service répond,
+  `max_age` au-delà duquel la copie n'est plus utilisée
+"""
+
+import threading
+import time
+
+OK = 'ok'
+REVOKED = 'revoked'
+UNKNOWN = 'unknown'
+
+class UserVersionTable:
+    """Copie locale, rafraîchie périodiquement, des token_version de l'Auth Service.
+
+    `fetch(etag)` retourne (etag, versions) avec versions = {user_id: token_version},
+    (etag, None) si la table n'a pas changé depuis `etag`, ou None en cas d'échec.
+    """
+
+    def __init__(self, fetch, interval=1.0, max_age=30.0):
+        self.fetch = fetch
+        self.interval = interval
+        self.max_age = max_age
+        self._versions = None
+        self._etag = None
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self.reloads = 0
+        self.not_modified = 0
+        self.failures = 0
+
+    def refresh(self):
+        """Relève la table auprès de l'Auth Service ; retourne False si elle n'a pas pu être lue."""
+        try:
+            result = self.fetch(self._etag)
+        except Exception:
+            result = None
+        with self._lock:
+            if result is None:
+                self.failures += 1
+                return False
+            etag, versions = result
+            if versions is not None:
+                self._versions = versions
+                self.reloads += 1
+            elif self._versions is None:
+                # 304 sans copie locale (ne devrait pas arriver) : rechargement complet au prochain tour
+                self._etag = None
+                return False
+            else:
+                self.not_modified += 1
+            self._etag = etag
+            self._loaded_at = time.monotonic()
+        return True
+
+    def check(self, user_id, version):
+        with self._lock:
+            versions, loaded_at = self._versions, self._loaded_at
+        if versions is None or time.monotonic() - loaded_at > self.max_age:
+            return UNKNOWN
+        if not isinstance(version, int) or isinstance(version, bool):
+            return UNKNOWN
+        current = versions.get(user_id)
+        if current is None or version > current:
+            # Utilisateur créé, ou version changée, depuis le dernier relevé (ou supprimé)
+            return UNKNOWN
+        return REVOKED if version < current else OK
+
+    def start(self):
+        """Lance le thread de relevé ; interval <= 0 le désactive."""
+        if self.interval <= 0 or self._thread is not None:
+            return
+
+        def loop():
+            while True:
+                self.refresh()
+                time.sleep(self.interval)
+
+        self._thread = threading.Thread(target=loop, name='user-versions', daemon=True)
+        self._thread.start()
+
+    @property
+    def running(self):
+        """Vrai si le thread de relevé tourne (la copie est rafraîchie toutes les `interval` s)."""
+        return self._thread is not None
+
+    def stats(self):
+        with self._lock:
+            age = None if self._loaded_at is None else round(time.monotonic() - self._loaded_at, 3)
+            return {
+                'users': None if self._versions is None else len(self._versions),
+                'age': age,
+                'interval': self.interval,
+                'max_age': self.max_age,
+                'reloads': self.reloads,
+                'not_modified': self.not_modified,
+                'failures': self.failures
+            }
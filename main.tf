@@ -21,40 +21,40 @@ resource "docker_network" "micro_net" {
 resource "docker_image" "web_image" {
   name = "appflasktest-web"
   build {
-    context    = "./web_service"
-    dockerfile = "Dockerfile"
+    context    = "."
+    dockerfile = "web_service/Dockerfile"
   }
 }
 
 resource "docker_image" "auth_image" {
   name = "appflasktest-auth"
   build {
-    context    = "./auth_service"
-    dockerfile = "Dockerfile"
+    context    = "."
+    dockerfile = "auth_service/Dockerfile"
   }
 }
 
 resource "docker_image" "user_image" {
   name = "appflasktest-user"
   build {
-    context    = "./user_service"
-    dockerfile = "Dockerfile"
+    context    = "."
+    dockerfile = "user_service/Dockerfile"
   }
 }
 
 resource "docker_image" "orders_image" {
   name = "appflasktest-orders"
   build {
-    context    = "./orders_service"
-    dockerfile = "Dockerfile"
+    context    = "."
+    dockerfile = "orders_service/Dockerfile"
   }
 }
 
 resource "docker_image" "gateway_image" {
   name = "appflasktest-gateway"
   build {
-    context    = "./gateway"
-    dockerfile = "Dockerfile"
+    context    = "."
+    dockerfile = "gateway/Dockerfile"
   }
 }
 
@@ -170,7 +170,10 @@ resource "docker_container" "gateway" {
   env = [
     "AUTH_SERVICE_URL=http://auth_service:5001",
     "USER_SERVICE_URL=http://user_service:5002",
-    "ORDERS_SERVICE_URL=http://orders_service:5003"
+    "ORDERS_SERVICE_URL=http://orders_service:5003",
+    "JWT_SECRET_KEY=super-secret-key",
+    "GATEWAY_TOKEN_VERIFY_MODE=local",
+    "GATEWAY_PROXY_MODE=passthrough"
   ]
   
   ports {
@@ -11,15 +11,27 @@ from flask import Flask, request, jsonify
 from datetime import datetime
 import sqlite3
 import os
+import sys
+
+# Modules partagés entre services (shared/) : dossier parent en local, /app/shared dans l'image Docker
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.metrics import instrument_app
+from shared.tracing import trace_app
+from shared.deadline import deadline_app, check_deadline, DeadlineConnection, DeadlineExceeded
+from shared.serving import serve
 
 app = Flask(__name__)
+instrument_app(app, 'orders_service')
+trace_app(app, 'orders_service')
+deadline_app(app, 'orders_service')
 
 # Configuration de la base de données
 DATABASE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'orders.db')
 
 def get_db():
     """Connexion à la base de données SQLite pour les commandes"""
-    conn = sqlite3.connect(DATABASE_PATH)
+    conn = sqlite3.connect(DATABASE_PATH, factory=DeadlineConnection)
     conn.row_factory = sqlite3.Row
     return conn
 
@@ -72,16 +84,13 @@ def get_current_user_from_token():
     except (ValueError, TypeError):
         return None, None
 
-def add_history(user_id, username, action, details=""):
-    """Ajoute une entrée dans l'historique."""
-    conn = get_db()
-    cursor = conn.cursor()
+def add_history(cursor, user_id, username, action, details=""):
+    """Ajoute une entrée dans l'historique, dans la transaction de l'écriture qu'elle décrit
+    (validée par le même commit : pas de vérification d'échéance entre les deux)."""
     cursor.execute('''
         INSERT INTO history (user_id, username, action, details, timestamp)
         VALUES (?, ?, ?, ?, ?)
     ''', (user_id, username, action, details, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
-    conn.commit()
-    conn.close()
 
 # ========== ENDPOINTS ==========
 
@@ -92,17 +101,26 @@ def list_orders():
     if not user_id:
         return jsonify({'message': 'Utilisateur non authentifié'}), 401
 
+    # Paramètre optionnel ?limit=N pour ne récupérer que les N commandes les plus récentes
+    limit = request.args.get('limit', type=int)
+
     conn = get_db()
     cursor = conn.cursor()
-    cursor.execute('''
+    query = '''
         SELECT id, user_id, product_name, quantity, price, total, status, created_at
         FROM orders
         WHERE user_id = ?
         ORDER BY created_at DESC
-    ''', (user_id,))
+    '''
+    params = (user_id,)
+    if limit and limit > 0:
+        query += ' LIMIT ?'
+        params = (user_id, limit)
+    cursor.execute(query, params)
     rows = cursor.fetchall()
     conn.close()
 
+    check_deadline('serialization')
     orders = [
         {
             'id': row['id'],
@@ -152,11 +170,10 @@ def create_order():
             VALUES (?, ?, ?, ?, ?, 'pending')
         ''', (user_id, product_name, quantity, price, total))
         order_id = cursor.lastrowid
+        add_history(cursor, user_id, username or 'unknown', 'Commande créée', f'Commande #{order_id}: {product_name} x{quantity} = {total}€')
         conn.commit()
         conn.close()
 
-        add_history(user_id, username or 'unknown', 'Commande créée', f'Commande #{order_id}: {product_name} x{quantity} = {total}€')
-
         return jsonify({
             'message': 'Commande créée avec succès',
             'order': {
@@ -170,6 +187,8 @@ def create_order():
             }
         }), 201
 
+    except DeadlineExceeded:
+        raise  # réponse 504 de deadline_app, pas une erreur 500
     except Exception as e:
         return jsonify({'message': f'Erreur lors de la création de la commande: {str(e)}'}), 500
 
@@ -238,11 +257,10 @@ def update_order_status(order_id):
         return jsonify({'message': 'Accès refusé'}), 403
 
     cursor.execute('UPDATE orders SET status = ? WHERE id = ?', (status, order_id))
+    add_history(cursor, user_id, username or 'unknown', 'Statut commande modifié', f'Commande #{order_id}: {status}')
     conn.commit()
     conn.close()
 
-    add_history(user_id, username or 'unknown', 'Statut commande modifié', f'Commande #{order_id}: {status}')
-
     return jsonify({
         'message': 'Statut de la commande mis à jour',
         'order_id': order_id,
@@ -268,6 +286,7 @@ def get_history():
     rows = cursor.fetchall()
     conn.close()
 
+    check_deadline('serialization')
     history = [
         {
             'id': row['id'],
@@ -332,5 +351,5 @@ def health():
 
 if __name__ == '__main__':
     print("Demarrage du Orders Service sur le port 5003...")
-    app.run(debug=True, port=5003, host='0.0.0.0')
+    serve(app, port=5003)
 
@@ -0,0 +1,128 @@
+"""
+Échéances des requêtes, propagées du Gateway vers les services
+- Le Gateway envoie à chaque appel le temps qu'il accorde encore au backend (en ms)
+  dans l'en-tête X-Request-Deadline-Ms
+- Le service en déduit une échéance sur son horloge monotone (aucune dépendance à l'heure
+  des machines) et la vérifie avant les étapes coûteuses : requête SQL, hachage de mot de passe,
+  sérialisation d'une grande liste
+- Échéance dépassée : la requête s'arrête en 504, le Gateway ayant déjà répondu au client ;
+  une lecture SQLite en cours est interrompue (progress handler)
+"""
+
+from contextvars import ContextVar
+from flask import request, jsonify
+import sqlite3
+import time
+
+from shared.metrics import REGISTRY
+from shared.tracing import TracedCursor, TracedConnection
+
+DEADLINE_HEADER = 'X-Request-Deadline-Ms'
+
+# Instructions de la machine virtuelle SQLite entre deux vérifications pendant une requête
+SQLITE_CHECK_INSTRUCTIONS = 10000
+
+# Échéance (time.monotonic) de la requête en cours, None si l'appelant n'en a pas fixé
+_deadline = ContextVar('request_deadline', default=None)
+
+DEADLINE_EXCEEDED = REGISTRY.counter(
+    'deadline_exceeded_total', "Requêtes abandonnées car l'échéance fixée par l'appelant était dépassée",
+    ('service', 'step'))
+
+service_name = 'unknown'
+
+class DeadlineExceeded(Exception):
+    """Échéance dépassée avant (ou pendant) l'étape `step`."""
+
+    def __init__(self, step):
+        super().__init__(f'Échéance dépassée ({step})')
+        self.step = step
+
+def budget_header(seconds):
+    """Valeur de l'en-tête pour un budget en secondes (au moins 1 ms)."""
+    return str(max(1, int(seconds * 1000)))
+
+def remaining():
+    """Temps restant (s) avant l'échéance de la requête en cours, None sans échéance."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+def expired():
+    deadline = _deadline.get()
+    return deadline is not None and time.monotonic() >= deadline
+
+def check_deadline(step):
+    """Lève DeadlineExceeded si l'échéance de la requête en cours est passée."""
+    if expired():
+        raise DeadlineExceeded(step)
+
+def deadline_app(app, service):
+    """Lit l'échéance de chaque requête entrante et répond 504 quand une étape la dépasse."""
+    global service_name
+    service_name = service
+
+    @app.before_request
+    def start_deadline():
+        try:
+            budget_ms = int(request.headers.get(DEADLINE_HEADER, ''))
+        except ValueError:
+            return
+        request.environ['deadline.token'] = _deadline.set(time.monotonic() + budget_ms / 1000.0)
+        # Déjà expirée à l'arrivée (file d'attente du serveur) : rien n'est exécuté
+        check_deadline('reception')
+
+    @app.teardown_request
+    def clear_deadline(error=None):
+        token = request.environ.pop('deadline.token', None)
+        if token is not None:
+            _deadline.reset(token)
+
+    @app.errorhandler(DeadlineExceeded)
+    def deadline_exceeded(error):
+        DEADLINE_EXCEEDED.inc(service, error.step)
+        return jsonify({'message': f"Délai de la requête dépassé, traitement abandonné ({error.step})"}), 504
+
+# ========== SQLITE ==========
+
+class DeadlineCursor(TracedCursor):
+    """Curseur tracé qui vérifie l'échéance avant chaque requête lancée hors transaction d'écriture."""
+
+    def execute(self, sql, parameters=()):
+        # Une écriture commencée va jusqu'au commit : pas d'abandon au milieu d'une transaction
+        if not self.connection.in_transaction:
+            check_deadline('sqlite')
+        try:
+            return super().execute(sql, parameters)
+        except sqlite3.OperationalError:
+            if expired():
+                raise DeadlineExceeded('sqlite') from None
+            raise
+
+    def executemany(self, sql, seq_of_parameters):
+        if not self.connection.in_transaction:
+            check_deadline('sqlite')
+        return super().executemany(sql, seq_of_parameters)
+
+    def fetchall(self):
+        try:
+            return super().fetchall()
+        except sqlite3.OperationalError:
+            if expired():
+                raise DeadlineExceeded('sqlite') from None
+            raise
+
+class DeadlineConnection(TracedConnection):
+    """Connexion tracée dont les lectures s'arrêtent à l'échéance de la requête :
+    sqlite3.connect(path, factory=DeadlineConnection)."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if _deadline.get() is not None:
+            self.set_progress_handler(self._interrupt_if_expired, SQLITE_CHECK_INSTRUCTIONS)
+
+    def _interrupt_if_expired(self):
+        # Une valeur non nulle interrompt l'instruction en cours (sqlite3.OperationalError)
+        return not self.in_transaction and expired()
+
+    def cursor(self, factory=DeadlineCursor):
+        return super().cursor(factory)
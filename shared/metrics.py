@@ -0,0 +1,197 @@
+"""
+Métriques communes aux services (format texte Prometheus)
+- Compteurs, jauges et histogrammes étiquetés, thread-safe, sans dépendance externe
+- instrument_app(app, service) : nombre de requêtes par route / méthode / statut
+  et histogramme de latence par route, exposés sur GET /metrics
+- Coût par observation : un bisect et un verrou court, de quoi rester activé en production
+"""
+
+from bisect import bisect_left
+from flask import Response, request
+import threading
+import time
+
+# Bornes (s) des histogrammes de latence
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(names, values, extra=''):
+    """Construit '{a="1",b="2"}' (chaîne vide sans étiquette) ; `extra` est ajouté tel quel (ex. le="0.5")."""
+    parts = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+class Counter:
+    """Compteur croissant, une valeur par combinaison d'étiquettes."""
+
+    type_name = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        with self._lock:
+            return self._values.get(labels, 0)
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            yield f'{self.name}{format_labels(self.labelnames, labels)} {format_value(value)}'
+
+class Gauge:
+    """Valeur instantanée (taille d'une table, d'une file...), une par combinaison d'étiquettes."""
+
+    type_name = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def value(self, *labels):
+        with self._lock:
+            return self._values.get(labels, 0)
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            yield f'{self.name}{format_labels(self.labelnames, labels)} {format_value(value)}'
+
+class Histogram:
+    """Histogramme à bornes fixes ; les compteurs cumulés ne sont calculés qu'à l'export."""
+
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # étiquettes -> [compteurs par intervalle (+Inf en dernier), somme]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def snapshot(self, *labels):
+        """Retourne (compteurs par intervalle, somme) pour une combinaison d'étiquettes."""
+        with self._lock:
+            series = self._series.get(labels)
+            return (list(series[0]), series[1]) if series is not None else ([0] * (len(self.buckets) + 1), 0.0)
+
+    def render(self):
+        with self._lock:
+            series = sorted((labels, list(counts), total) for labels, (counts, total) in self._series.items())
+        bounds = self.buckets + (float('inf'),)
+        for labels, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                le = f'le="{format_value(float(bound))}"'
+                yield f'{self.name}_bucket{format_labels(self.labelnames, labels, le)} {cumulative}'
+            yield f'{self.name}_sum{format_labels(self.labelnames, labels)} {format_value(total)}'
+            yield f'{self.name}_count{format_labels(self.labelnames, labels)} {cumulative}'
+
+class Registry:
+    """Ensemble des métriques d'un processus ; une métrique déjà déclarée est réutilisée."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f'Métrique {name} déjà déclarée avec un autre type')
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self):
+        """Export au format texte Prometheus 0.0.4."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type_name}')
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+
+def instrument_app(app, service, registry=REGISTRY):
+    """Mesure chaque requête de l'application Flask et ajoute la route GET /metrics.
+
+    La route est étiquetée par son modèle (/users/<int:user_id>) pour borner le nombre de séries ;
+    la durée s'arrête à l'envoi des en-têtes (un corps relayé en streaming n'est pas compté).
+    """
+    requests_total = registry.counter(
+        'http_requests_total', 'Requêtes HTTP traitées', ('service', 'route', 'method', 'status'))
+    duration = registry.histogram(
+        'http_request_duration_seconds', 'Durée de traitement des requêtes HTTP', ('service', 'route', 'method'))
+
+    @app.before_request
+    def start_request_timer():
+        request.environ['metrics.start'] = time.perf_counter()
+
+    @app.after_request
+    def record_request_metrics(response):
+        start = request.environ.get('metrics.start')
+        if start is not None:
+            rule = request.url_rule
+            route = rule.rule if rule is not None else '<unmatched>'
+            duration.observe(time.perf_counter() - start, service, route, request.method)
+            requests_total.inc(service, route, request.method, str(response.status_code))
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        """Métriques du service au format texte Prometheus."""
+        return Response(registry.render(), content_type=CONTENT_TYPE)
+
+    return registry
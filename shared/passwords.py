@@ -0,0 +1,107 @@
+"""
+Hachage des mots de passe hors des threads de requête
+- Vérification et création des hachages dans un pool de processus borné : au plus
+  PASSWORD_HASH_WORKERS calculs simultanés, PASSWORD_HASH_MAX_PENDING en cours ou en attente ;
+  au-delà (après PASSWORD_HASH_WAIT s d'attente), PasswordHasherBusy et réponse 503
+  plutôt qu'une file de logins qui ralentit tout le service
+- Méthode configurable (PASSWORD_HASH_METHOD, format werkzeug : "scrypt", "scrypt:16384:8:1",
+  "pbkdf2:sha256:600000", ...) ; needs_rehash() signale un hachage stocké avec d'autres
+  paramètres, à remplacer au prochain login réussi
+- PASSWORD_HASH_WORKERS=0 : calcul dans le thread de la requête, sans pool
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import check_password_hash, generate_password_hash
+from flask import jsonify
+import threading
+import time
+import os
+
+from shared.metrics import REGISTRY
+from shared.deadline import DeadlineExceeded, remaining
+
+PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt')
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', str(os.cpu_count() or 1)))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', str(max(1, PASSWORD_HASH_WORKERS) * 4)))
+PASSWORD_HASH_WAIT = float(os.getenv('PASSWORD_HASH_WAIT', '2.0'))
+
+PASSWORD_HASH_DURATION = REGISTRY.histogram(
+    'password_hash_duration_seconds', 'Durée des calculs de hachage de mot de passe, attente comprise',
+    ('operation',))
+PASSWORD_HASH_REJECTED = REGISTRY.counter(
+    'password_hash_rejected_total', 'Calculs de hachage refusés faute de place dans le pool', ('operation',))
+
+class PasswordHasherBusy(Exception):
+    """Trop de calculs de hachage en cours : la requête doit être refusée (503)."""
+
+class PasswordHasher:
+    """Hachage et vérification des mots de passe dans un pool de processus borné."""
+
+    def __init__(self, method=PASSWORD_HASH_METHOD, workers=PASSWORD_HASH_WORKERS,
+                 max_pending=PASSWORD_HASH_MAX_PENDING, wait=PASSWORD_HASH_WAIT):
+        self.method = method
+        # Préfixe complet de la méthode ("scrypt" -> "scrypt:32768:8:1") ; valide aussi la configuration
+        self.current_method = generate_password_hash('', method=method).split('$', 1)[0]
+        self.workers = workers
+        self.max_pending = max_pending
+        self.wait = wait
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                # Processus créés à la demande, au premier calcul
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            return self._pool
+
+    def _run(self, operation, fn, *args):
+        start = time.perf_counter()
+        try:
+            if self.workers <= 0:
+                return fn(*args)
+            # Attente d'une place bornée par PASSWORD_HASH_WAIT et par l'échéance de la requête
+            budget = remaining()
+            wait = self.wait if budget is None else max(0.0, min(self.wait, budget))
+            if not self._slots.acquire(timeout=wait):
+                PASSWORD_HASH_REJECTED.inc(operation)
+                if budget is not None and budget <= wait:
+                    raise DeadlineExceeded(operation)
+                raise PasswordHasherBusy(f'Trop de calculs de hachage en cours ({operation})')
+            try:
+                return self._executor().submit(fn, *args).result()
+            except BrokenProcessPool:
+                # Processus du pool tué (OOM, ...) : un nouveau pool sera créé au prochain calcul
+                with self._lock:
+                    self._pool = None
+                raise
+            finally:
+                self._slots.release()
+        finally:
+            PASSWORD_HASH_DURATION.observe(time.perf_counter() - start, operation)
+
+    def verify(self, stored_hash, password):
+        return self._run('verify', check_password_hash, stored_hash, password)
+
+    def hash(self, password):
+        return self._run('hash', generate_password_hash, password, self.method)
+
+    def needs_rehash(self, stored_hash):
+        """Vrai si le hachage stocké n'a pas été calculé avec la méthode et les paramètres courants."""
+        return stored_hash.split('$', 1)[0] != self.current_method
+
+    def stats(self):
+        return {'method': self.current_method, 'workers': self.workers, 'max_pending': self.max_pending}
+
+password_hasher = PasswordHasher()
+
+def password_hashing_app(app):
+    """Répond 503 (avec Retry-After) quand le pool de hachage est saturé."""
+
+    @app.errorhandler(PasswordHasherBusy)
+    def password_hasher_busy(error):
+        response = jsonify({'message': 'Service surchargé, réessayez dans quelques instants'})
+        response.headers['Retry-After'] = '1'
+        return response, 503
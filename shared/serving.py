@@ -0,0 +1,24 @@
+"""
+Lancement des services Flask
+- waitress (s'il est installé) : HTTP/1.1 avec keep-alive, les connexions des pools du Gateway
+  et du site web sont réutilisées d'une requête à l'autre ; SERVER_THREADS threads de requêtes
+- Sinon, serveur de développement Flask : il ferme la connexion après chaque réponse
+  (werkzeug 3 envoie toujours "Connection: close"), chaque appel rouvre une connexion TCP
+"""
+
+import os
+
+try:
+    from waitress import serve as waitress_serve
+except ImportError:  # serveur de développement à la place
+    waitress_serve = None
+
+def serve(app, port, host='0.0.0.0', threads=16):
+    """Sert `app` sur host:port ; SERVER_THREADS remplace le nombre de threads par défaut."""
+    threads = int(os.getenv('SERVER_THREADS', str(threads)))
+    if waitress_serve is None:
+        print("   waitress absent : serveur de développement Flask (pas de keep-alive)")
+        app.run(debug=True, port=port, host=host)
+        return
+    print(f"   Serveur: waitress, {threads} threads")
+    waitress_serve(app, host=host, port=port, threads=threads)
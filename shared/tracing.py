@@ -0,0 +1,282 @@
+"""
+Traçage distribué commun aux services
+- Contexte propagé avec l'en-tête W3C `traceparent` (accepté ou créé à l'entrée du Gateway)
+- Spans serveur (traitement HTTP), client (appels sortants) et base de données (chaque requête SQL)
+- Export au format Zipkin v2 (JSON) vers un fichier (une ligne par span) ou un collecteur HTTP,
+  par un thread d'arrière-plan : la requête ne fait qu'ajouter le span à une file
+
+Configuration :
+- TRACE_EXPORT       : chemin d'un fichier ou URL d'un collecteur Zipkin
+                       (ex. http://zipkin:9411/api/v2/spans) ; vide = pas d'export
+- TRACE_SAMPLE_RATE  : proportion des traces exportées, décidée à la racine (défaut 1.0)
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask import request
+from urllib.parse import urlsplit
+import urllib.request
+import threading
+import sqlite3
+import random
+import queue
+import json
+import time
+import os
+
+TRACE_EXPORT = os.getenv('TRACE_EXPORT', '').strip()
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '1.0'))
+
+# Span courant du thread / de la tâche en cours
+_current_span = ContextVar('current_span', default=None)
+
+service_name = 'unknown'
+
+def new_id(bits):
+    return f'{random.getrandbits(bits):0{bits // 4}x}'
+
+class Span:
+    """Opération chronométrée ; exportée à sa fin si la trace est échantillonnée."""
+
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'kind', 'sampled', 'tags', 'start', 'started_at')
+
+    def __init__(self, name, kind=None, parent=None, trace_id=None, parent_id=None, sampled=None, tags=None):
+        if parent is not None:
+            trace_id, parent_id, sampled = parent.trace_id, parent.span_id, parent.sampled
+        self.trace_id = trace_id or new_id(128)
+        self.span_id = new_id(64)
+        self.parent_id = parent_id
+        self.sampled = random.random() < TRACE_SAMPLE_RATE if sampled is None else sampled
+        self.name = name
+        self.kind = kind
+        self.tags = tags or {}
+        self.start = time.time()
+        self.started_at = time.perf_counter()
+
+    @property
+    def traceparent(self):
+        return f'00-{self.trace_id}-{self.span_id}-{"01" if self.sampled else "00"}'
+
+    def finish(self):
+        if self.sampled and exporter is not None:
+            exporter.submit(self.to_zipkin(time.perf_counter() - self.started_at))
+
+    def to_zipkin(self, duration):
+        span = {
+            'traceId': self.trace_id,
+            'id': self.span_id,
+            'name': self.name,
+            'timestamp': int(self.start * 1e6),
+            'duration': max(1, int(duration * 1e6)),
+            'localEndpoint': {'serviceName': service_name},
+            'tags': {key: str(value) for key, value in self.tags.items()}
+        }
+        if self.parent_id:
+            span['parentId'] = self.parent_id
+        if self.kind:
+            span['kind'] = self.kind
+        return span
+
+def parse_traceparent(value):
+    """Retourne (trace_id, parent_id, sampled) depuis un en-tête traceparent, ou None s'il est invalide."""
+    parts = (value or '').strip().split('-')
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16)
+        int(parts[2], 16)
+        flags = int(parts[3][:2], 16)
+    except ValueError:
+        return None
+    if parts[1] == '0' * 32 or parts[2] == '0' * 16:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+def current_span():
+    return _current_span.get()
+
+@contextmanager
+def start_span(name, kind=None, tags=None):
+    """Span enfant du span courant (ou racine d'une nouvelle trace), courant pendant le bloc."""
+    span = Span(name, kind=kind, parent=_current_span.get(), tags=tags)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except Exception as e:
+        span.tags['error'] = type(e).__name__
+        raise
+    finally:
+        _current_span.reset(token)
+        span.finish()
+
+@contextmanager
+def server_span(name, traceparent, tags=None):
+    """Span serveur rattaché au traceparent reçu (racine d'une nouvelle trace s'il est absent ou invalide),
+    courant pendant le bloc ; pour les serveurs qui ne passent pas par trace_app (moteur aiohttp)."""
+    parent = parse_traceparent(traceparent)
+    if parent is not None:
+        span = Span(name, kind='SERVER', trace_id=parent[0], parent_id=parent[1], sampled=parent[2], tags=tags)
+    else:
+        span = Span(name, kind='SERVER', parent=_current_span.get(), tags=tags)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except Exception as e:
+        span.tags['error'] = type(e).__name__
+        raise
+    finally:
+        _current_span.reset(token)
+        span.finish()
+
+@contextmanager
+def client_span(name, headers, tags=None):
+    """Span d'appel sortant ; ajoute à `headers` le traceparent à transmettre au service appelé."""
+    with start_span(name, kind='CLIENT', tags=tags) as span:
+        headers['traceparent'] = span.traceparent
+        yield span
+
+def traced_session(session):
+    """Enveloppe session.request (requests) : un span client par appel, traceparent propagé."""
+    send = session.request
+
+    def traced_request(method, url, headers=None, **kwargs):
+        headers = dict(headers or {})
+        with client_span(f'{method.upper()} {urlsplit(url).path}', headers,
+                         tags={'http.method': method.upper(), 'http.url': url}) as span:
+            response = send(method, url, headers=headers, **kwargs)
+            span.tags['http.status_code'] = response.status_code
+            return response
+
+    session.request = traced_request
+    return session
+
+# ========== EXPORT ==========
+
+class Exporter:
+    """File bornée vidée par lots par un thread ; les spans sont abandonnés si la file est pleine."""
+
+    def __init__(self, target, max_queue=10000, batch_size=200, flush_interval=1.0):
+        self.target = target
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.exported = 0
+        self.dropped = 0
+        self.failed = 0
+        thread = threading.Thread(target=self._run, name='trace-exporter', daemon=True)
+        thread.start()
+
+    def submit(self, span):
+        try:
+            self.queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+                self.exported += len(batch)
+            except Exception:
+                self.failed += len(batch)
+
+    def _write(self, batch):
+        if self.target.startswith(('http://', 'https://')):
+            body = json.dumps(batch).encode('utf-8')
+            req = urllib.request.Request(self.target, data=body, headers={'Content-Type': 'application/json'})
+            urllib.request.urlopen(req, timeout=5).close()
+        else:
+            with open(self.target, 'a', encoding='utf-8') as f:
+                f.write(''.join(json.dumps(span) + '\n' for span in batch))
+
+    def stats(self):
+        return {'target': self.target, 'queued': self.queue.qsize(), 'exported': self.exported,
+                'dropped': self.dropped, 'failed': self.failed}
+
+exporter = Exporter(TRACE_EXPORT) if TRACE_EXPORT else None
+
+# ========== FLASK ==========
+
+def trace_app(app, service):
+    """Ouvre un span serveur par requête, rattaché au traceparent reçu (ou au span courant),
+    et renvoie l'identifiant de trace dans l'en-tête X-Trace-Id."""
+    global service_name
+    service_name = service
+
+    @app.before_request
+    def start_server_span():
+        parent = parse_traceparent(request.headers.get('traceparent'))
+        rule = request.url_rule
+        name = f'{request.method} {rule.rule if rule is not None else request.path}'
+        tags = {'http.method': request.method, 'http.path': request.path}
+        if parent is not None:
+            span = Span(name, kind='SERVER', trace_id=parent[0], parent_id=parent[1], sampled=parent[2], tags=tags)
+        else:
+            span = Span(name, kind='SERVER', parent=_current_span.get(), tags=tags)
+        request.environ['tracing.span'] = span
+        request.environ['tracing.token'] = _current_span.set(span)
+
+    @app.after_request
+    def tag_server_span(response):
+        span = request.environ.get('tracing.span')
+        if span is not None:
+            span.tags['http.status_code'] = response.status_code
+            response.headers['X-Trace-Id'] = span.trace_id
+        return response
+
+    @app.teardown_request
+    def finish_server_span(error=None):
+        span = request.environ.pop('tracing.span', None)
+        if span is None:
+            return
+        if error is not None:
+            span.tags['error'] = type(error).__name__
+        _current_span.reset(request.environ.pop('tracing.token'))
+        span.finish()
+
+# ========== SQLITE ==========
+
+class TracedCursor(sqlite3.Cursor):
+    """Curseur qui ouvre un span par requête SQL (et par lecture complète du résultat)."""
+
+    def execute(self, sql, parameters=()):
+        if exporter is None or _current_span.get() is None:
+            return super().execute(sql, parameters)
+        with start_span('sqlite', kind='CLIENT', tags={'db.system': 'sqlite', 'db.statement': ' '.join(sql.split())}):
+            return super().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        if exporter is None or _current_span.get() is None:
+            return super().executemany(sql, seq_of_parameters)
+        with start_span('sqlite', kind='CLIENT', tags={'db.system': 'sqlite', 'db.statement': ' '.join(sql.split())}):
+            return super().executemany(sql, seq_of_parameters)
+
+    def fetchall(self):
+        if exporter is None or _current_span.get() is None:
+            return super().fetchall()
+        with start_span('sqlite fetchall', kind='CLIENT', tags={'db.system': 'sqlite'}) as span:
+            rows = super().fetchall()
+            span.tags['db.rows'] = len(rows)
+            return rows
+
+class TracedConnection(sqlite3.Connection):
+    """Connexion SQLite dont les curseurs (et conn.execute) sont tracés : sqlite3.connect(path, factory=TracedConnection)."""
+
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
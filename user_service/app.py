@@ -10,19 +10,51 @@ Responsabilités:
 from flask import Flask, request, jsonify
 import sqlite3
 import os
-from werkzeug.security import generate_password_hash
+import sys
+
+# Modules partagés entre services (shared/) : dossier parent en local, /app/shared dans l'image Docker
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.metrics import instrument_app
+from shared.tracing import trace_app
+from shared.deadline import deadline_app, check_deadline, DeadlineConnection, DeadlineExceeded
+from shared.passwords import password_hashing_app, password_hasher
+from shared.serving import serve
 
 app = Flask(__name__)
+instrument_app(app, 'user_service')
+trace_app(app, 'user_service')
+deadline_app(app, 'user_service')
+password_hashing_app(app)
 
 # Configuration de la base de données (partagée avec Auth Service)
 DATABASE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'users.db')
 
 def get_db():
     """Connexion à la base de données SQLite avec timeout pour éviter les verrouillages"""
-    conn = sqlite3.connect(DATABASE_PATH, timeout=10.0)
+    conn = sqlite3.connect(DATABASE_PATH, timeout=10.0, factory=DeadlineConnection)
     conn.row_factory = sqlite3.Row
     return conn
 
+def ensure_token_version_column():
+    """Ajoute users.token_version (version de sécurité des access tokens) aux bases existantes."""
+    try:
+        # mode=rw : ne crée pas de base vide si elle n'est pas encore initialisée
+        conn = sqlite3.connect(f'file:{DATABASE_PATH}?mode=rw', uri=True, timeout=10.0)
+    except sqlite3.OperationalError:
+        return
+    try:
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(users)')]
+        if columns and 'token_version' not in columns:
+            conn.execute('ALTER TABLE users ADD COLUMN token_version INTEGER NOT NULL DEFAULT 0')
+            conn.commit()
+    except sqlite3.OperationalError:
+        pass  # colonne ajoutée au même moment par l'Auth Service
+    finally:
+        conn.close()
+
+ensure_token_version_column()
+
 def serialize_user(user_row, include_password=False):
     """Convertit une ligne SQLite en dictionnaire sérialisable."""
     if not user_row:
@@ -117,6 +149,7 @@ def list_users():
     rows = cursor.fetchall()
     conn.close()
 
+    check_deadline('serialization')
     users_list = [
         {
             'id': row['id'],
@@ -161,10 +194,14 @@ def update_user(user_id):
         conn = get_db()
         cursor = conn.cursor()
         
-        if email:
-            cursor.execute('UPDATE users SET email = ? WHERE id = ?', (email, user_id))
-        if role and user_row['role'] == 'admin':
-            cursor.execute('UPDATE users SET role = ? WHERE id = ?', (role, user_id))
+        if email and email != target_user['email']:
+            # L'email est embarqué dans les access tokens : nouvelle version de sécurité, comme pour le rôle
+            cursor.execute('UPDATE users SET email = ?, token_version = token_version + 1 WHERE id = ?',
+                           (email, user_id))
+        if role and user_row['role'] == 'admin' and role != target_user['role']:
+            # Nouvelle version de sécurité : les access tokens émis avec l'ancien rôle sont refusés
+            cursor.execute('UPDATE users SET role = ?, token_version = token_version + 1 WHERE id = ?',
+                           (role, user_id))
         
         conn.commit()
         conn.close()
@@ -175,6 +212,8 @@ def update_user(user_id):
             'user': serialize_user(updated_user)
         }), 200
 
+    except DeadlineExceeded:
+        raise  # réponse 504 de deadline_app, pas une erreur 500
     except Exception as e:
         return jsonify({'message': f'Erreur lors de la mise à jour: {str(e)}'}), 500
 
@@ -207,6 +246,8 @@ def delete_user(user_id):
             'message': f'Utilisateur "{target_user["username"]}" supprimé avec succès'
         }), 200
 
+    except DeadlineExceeded:
+        raise  # réponse 504 de deadline_app, pas une erreur 500
     except Exception as e:
         return jsonify({'message': f'Erreur lors de la suppression: {str(e)}'}), 500
 
@@ -251,13 +292,15 @@ def create_user():
     if existing_user:
         return jsonify({'message': f'L\'utilisateur "{username}" existe déjà'}), 400
 
+    # Hachage calculé avant d'ouvrir la connexion (pool saturé : 503, échéance : 504)
+    check_deadline('generate_password_hash')
+    hashed_password = password_hasher.hash(password)
+
     try:
-        from werkzeug.security import generate_password_hash
         from datetime import datetime
         
         conn = get_db()
         cursor = conn.cursor()
-        hashed_password = generate_password_hash(password)
         created_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         
         cursor.execute('''
@@ -276,6 +319,8 @@ def create_user():
             'user': serialize_user(new_user)
         }), 201
 
+    except DeadlineExceeded:
+        raise  # réponse 504 de deadline_app, pas une erreur 500
     except Exception as e:
         return jsonify({'message': f'Erreur lors de la création: {str(e)}'}), 500
 
@@ -290,5 +335,5 @@ def health():
 
 if __name__ == '__main__':
     print("Demarrage du User Service sur le port 5002...")
-    app.run(debug=True, port=5002, host='0.0.0.0')
+    serve(app, port=5002)
 
@@ -1,18 +1,26 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
-from datetime import datetime, timedelta
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, has_request_context
+from datetime import datetime
 import os
 import pybreaker
 import random
 import time
 import sqlite3
-import secrets
 from werkzeug.security import generate_password_hash, check_password_hash
-from functools import wraps
 from authlib.jose import jwt
 from authlib.jose.errors import ExpiredTokenError, InvalidTokenError
 import requests
+from http.cookiejar import DefaultCookiePolicy
+import sys
+
+# Modules partagés entre services (shared/) : dossier parent en local, /app/shared dans l'image Docker
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.metrics import instrument_app
+from shared.tracing import trace_app, TracedConnection, traced_session
 
 app = Flask(__name__)
+instrument_app(app, 'web_service')
+trace_app(app, 'web_service')
 app.config['SECRET_KEY'] = 'votre-cle-secrete-ici'
 
 # Configuration des microservices
@@ -21,12 +29,30 @@ USER_SERVICE_URL = os.getenv('USER_SERVICE_URL', 'http://localhost:5002')
 ORDERS_SERVICE_URL = os.getenv('ORDERS_SERVICE_URL', 'http://localhost:5003')
 GATEWAY_URL = os.getenv('GATEWAY_URL', 'http://localhost:5004')  # Port différent car app.py utilise 5000
 
+def forwarding_session(session):
+    """Ajoute X-Forwarded-For (IP du navigateur) aux appels faits pendant une requête : le Gateway
+    limite les logins par IP cliente, et non par l'adresse du site qui les relaie tous."""
+    send = session.request
+
+    def forwarded_request(method, url, headers=None, **kwargs):
+        if has_request_context() and request.remote_addr:
+            headers = dict(headers or {}, **{'X-Forwarded-For': request.remote_addr})
+        return send(method, url, headers=headers, **kwargs)
+
+    session.request = forwarded_request
+    return session
+
+# Session HTTP partagée vers les services : connexions réutilisées, un span client par appel
+http_session = forwarding_session(traced_session(requests.Session()))
+# Aucun cookie conservé : la session sert à tous les utilisateurs
+http_session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
 # Configuration de la base de données (partagée avec les microservices)
 DATABASE = 'users.db'
 
 def get_db():
     """Connexion à la base de données SQLite avec timeout pour éviter les verrouillages"""
-    conn = sqlite3.connect(DATABASE, timeout=10.0)
+    conn = sqlite3.connect(DATABASE, timeout=10.0, factory=TracedConnection)
     conn.row_factory = sqlite3.Row
     return conn
 
@@ -42,7 +68,8 @@ def init_db():
             password TEXT NOT NULL,
             email TEXT,
             role TEXT DEFAULT 'user',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            token_version INTEGER NOT NULL DEFAULT 0
         )
     ''')
 
@@ -50,9 +77,12 @@ def init_db():
         CREATE TABLE IF NOT EXISTS refresh_tokens (
             jti TEXT PRIMARY KEY,
             user_id INTEGER NOT NULL,
+            family_id TEXT,
             created_at TEXT NOT NULL,
             expires_at TEXT NOT NULL,
             revoked INTEGER DEFAULT 0,
+            revoked_at TEXT,
+            replaced_by TEXT,
             FOREIGN KEY(user_id) REFERENCES users(id)
         )
     ''')
@@ -95,9 +125,9 @@ def call_auth_service(endpoint, method='GET', data=None):
     try:
         url = f"{GATEWAY_URL}/gateway/auth{endpoint}"
         if method == 'POST':
-            response = requests.post(url, json=data, timeout=2)
+            response = http_session.post(url, json=data, timeout=2)
         else:
-            response = requests.get(url, timeout=2)
+            response = http_session.get(url, timeout=2)
         return response.json() if response.status_code == 200 else None
     except:
         return None
@@ -110,13 +140,13 @@ def call_user_service(endpoint, method='GET', data=None, token=None):
         if token:
             headers['Authorization'] = f'Bearer {token}'
         if method == 'POST':
-            response = requests.post(url, json=data, headers=headers, timeout=5)
+            response = http_session.post(url, json=data, headers=headers, timeout=5)
         elif method == 'PUT':
-            response = requests.put(url, json=data, headers=headers, timeout=5)
+            response = http_session.put(url, json=data, headers=headers, timeout=5)
         elif method == 'DELETE':
-            response = requests.delete(url, headers=headers, timeout=5)
+            response = http_session.delete(url, headers=headers, timeout=5)
         else:
-            response = requests.get(url, headers=headers, timeout=5)
+            response = http_session.get(url, headers=headers, timeout=5)
         # Retourne la réponse même si le status code n'est pas 200 (pour gérer les erreurs)
         if response.status_code in [200, 201]:
             return response.json()
@@ -135,11 +165,11 @@ def call_orders_service(endpoint, method='GET', data=None, token=None):
         if token:
             headers['Authorization'] = f'Bearer {token}'
         if method == 'POST':
-            response = requests.post(url, json=data, headers=headers, timeout=2)
+            response = http_session.post(url, json=data, headers=headers, timeout=2)
         elif method == 'PUT':
-            response = requests.put(url, json=data, headers=headers, timeout=2)
+            response = http_session.put(url, json=data, headers=headers, timeout=2)
         else:
-            response = requests.get(url, headers=headers, timeout=2)
+            response = http_session.get(url, headers=headers, timeout=2)
         return response.json() if response.status_code == 200 else None
     except:
         return None
@@ -151,7 +181,7 @@ def refresh_access_token():
         return False
     
     try:
-        response = requests.post(
+        response = http_session.post(
             f"{GATEWAY_URL}/gateway/auth/refresh",
             json={"refresh_token": refresh_token},
             timeout=2
@@ -216,7 +246,7 @@ def check_microservices_status():
     
     # Vérifie d'abord le Gateway
     try:
-        r = requests.get(f"{GATEWAY_URL}/health", timeout=2)
+        r = http_session.get(f"{GATEWAY_URL}/health", timeout=2)
         if r.status_code == 200:
             status['gateway'] = True
             # Le Gateway peut retourner l'état des autres services
@@ -232,19 +262,19 @@ def check_microservices_status():
     # Fallback: vérification directe si le Gateway ne retourne pas les infos
     if not status['gateway']:
         try:
-            r = requests.get(f"{AUTH_SERVICE_URL}/health", timeout=1)
+            r = http_session.get(f"{AUTH_SERVICE_URL}/health", timeout=1)
             status['auth'] = r.status_code == 200
         except:
             pass
         
         try:
-            r = requests.get(f"{USER_SERVICE_URL}/health", timeout=1)
+            r = http_session.get(f"{USER_SERVICE_URL}/health", timeout=1)
             status['user'] = r.status_code == 200
         except:
             pass
         
         try:
-            r = requests.get(f"{ORDERS_SERVICE_URL}/health", timeout=1)
+            r = http_session.get(f"{ORDERS_SERVICE_URL}/health", timeout=1)
             status['orders'] = r.status_code == 200
         except:
             pass
@@ -269,7 +299,7 @@ def authenticate_credentials(username, password):
     """Authentifie via Gateway (qui route vers Auth Service) ou fallback local"""
     # Essaie d'abord via Gateway
     try:
-        response = requests.post(
+        response = http_session.post(
             f"{GATEWAY_URL}/gateway/auth/login",
             json={"username": username, "password": password},
             timeout=2
@@ -368,7 +398,7 @@ def logout():
     refresh_token = session.get('refresh_token')
     if refresh_token:
         try:
-            requests.post(
+            http_session.post(
                 f"{GATEWAY_URL}/gateway/auth/logout",
                 json={"refresh_token": refresh_token},
                 timeout=2
@@ -569,7 +599,7 @@ def api_user():
     # Récupère l'historique
     historique = []
     try:
-        conn = sqlite3.connect('orders.db')
+        conn = sqlite3.connect('orders.db', factory=TracedConnection)
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         cursor.execute('SELECT * FROM historique WHERE user_id = ? ORDER BY timestamp DESC LIMIT 50', (user_id,))
@@ -20,7 +20,8 @@ def init_db():
             password TEXT NOT NULL,
             email TEXT,
             role TEXT DEFAULT 'user',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            token_version INTEGER NOT NULL DEFAULT 0
         )
     ''')
 
@@ -28,9 +29,12 @@ def init_db():
         CREATE TABLE IF NOT EXISTS refresh_tokens (
             jti TEXT PRIMARY KEY,
             user_id INTEGER NOT NULL,
+            family_id TEXT,
             created_at TEXT NOT NULL,
             expires_at TEXT NOT NULL,
             revoked INTEGER DEFAULT 0,
+            revoked_at TEXT,
+            replaced_by TEXT,
             FOREIGN KEY(user_id) REFERENCES users(id)
         )
     ''')